@@ -1,7 +1,14 @@
 from django.contrib import admin
-from .models import PDFFile
+from .models import Job, PDFFile
 
 @admin.register(PDFFile)
 class PDFFileAdmin(admin.ModelAdmin):
     list_display = ('id', 'file', 'company', 'source', 'active')
     readonly_fields = ('id',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'done', 'total', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('id', 'celery_task_id', 'created_at', 'started_at', 'finished_at')
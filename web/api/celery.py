@@ -1,6 +1,8 @@
 # celery.py
 import os
+import sys
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
@@ -9,6 +11,33 @@ app = Celery('ESGDataCollector')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+import core.profiling  # noqa: E402,F401 - connects the opt-in task profiling signals
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Prometheus endpoint of this worker; in prefork mode it aggregates the pool processes via PROMETHEUS_MULTIPROC_DIR
+    port = getattr(settings, 'WORKER_METRICS_PORT', None)
+    if not port:
+        return
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Without it the endpoint would serve the parent process only, which runs no tasks
+        print(
+            f"Worker metrics NOT started: WORKER_METRICS_PORT={port} needs PROMETHEUS_MULTIPROC_DIR set to an "
+            f"empty directory before the worker starts.",
+            file=sys.stderr,
+        )
+        return
+    from backend.llm_module.metrics import start_worker_server
+    start_worker_server(port)
+    print(f"Worker metrics on port {port}.")
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from backend.llm_module.metrics import mark_process_dead
+    mark_process_dead(pid or os.getpid())
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import PDFFile, Query
+from backend.llm_module.llm_provider import SentenceTransformersEmbeddingProvider
+from backend.llm_module.processor import LLMProcessor, query_text
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched multi-query retrieval against the per-query loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company_id', type=int, help='Only use PDFs of this company')
+        parser.add_argument('--top_k', default=5, type=int)
+        parser.add_argument('--repeat', default=3, type=int, help='Timed runs per mode, the best run is reported')
+        parser.add_argument('--extended_search', action='store_true', help='Search all chunk types')
+
+    def handle(self, *args, **options):
+        queries = list(Query.objects.filter(active=True))
+        pdf_files = PDFFile.objects.filter(active=True, processing_status='success').exclude(chunk_vector_index_path=None)
+        if options['company_id']:
+            pdf_files = pdf_files.filter(company_id=options['company_id'])
+        pdf_files = list(pdf_files)
+        if not queries or not pdf_files:
+            raise CommandError("Need at least one active query and one processed PDF.")
+
+        processor = LLMProcessor(embedding_provider=SentenceTransformersEmbeddingProvider())
+        top_k = options['top_k']
+        extended_search = options['extended_search']
+        chunk_types = None if extended_search else ["table_column"]
+
+        # Warm up model and page cache so that neither mode pays for loading
+        processor.embed_queries(queries[:1])
+        processor.batch_retrieve(queries[:1], pdf_files, top_k=top_k, extended_search=extended_search)
+
+        def per_query_loop():
+            results = {}
+            for query in queries:
+                query_vector = processor.embedding_provider.encode([query_text(query)])[0]
+                for pdf_file in pdf_files:
+                    chunk_store = processor._load_chunk_store(pdf_file.chunk_vector_index_path)
+                    results[(query.id, pdf_file.id)] = chunk_store.search(
+                        query_vector, top_k=top_k, chunk_types=chunk_types
+                    )
+            return results
+
+        def batched():
+            return processor.batch_retrieve(queries, pdf_files, top_k=top_k, extended_search=extended_search)
+
+        self.stdout.write(f"{len(queries)} queries x {len(pdf_files)} PDFs, top_k={top_k}")
+        timings = {}
+        outputs = {}
+        for name, run in (('per-query loop', per_query_loop), ('batched', batched)):
+            best = None
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                outputs[name] = run()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+            pairs_per_sec = len(queries) * len(pdf_files) / best if best else float('inf')
+            self.stdout.write(f"{name:<15} {best:>9.3f} s  ({pairs_per_sec:,.1f} query/PDF pairs per s)")
+
+        self.stdout.write(f"Speed-up: {timings['per-query loop'] / timings['batched']:.1f}x")
+
+        def chunk_ids(results):
+            return {key: [meta.get('chunk_id') for meta, _ in row] for key, row in results.items()}
+
+        if chunk_ids(outputs['per-query loop']) != chunk_ids(outputs['batched']):
+            self.stderr.write("Warning: batched results differ from the per-query loop.")
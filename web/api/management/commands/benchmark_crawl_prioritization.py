@@ -0,0 +1,181 @@
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a child process per crawl, the Twisted reactor cannot be restarted
+CRAWL_SCRIPT = (
+    "import json, sys\n"
+    "from backend.scraper_module.runner import crawl_companies\n"
+    "spider = crawl_companies(**json.loads(sys.argv[1]))\n"
+    "print(json.dumps({'stats': spider.company_stats[1], 'pdfs': [pdf['url'] for pdf in spider.pdf_files[1]]}))\n"
+)
+
+# Report sections in the middle of the navigation: neither the first nor the last links of a page, whichever
+# order an unscored crawl takes them in (Scrapy's default is depth-first, last link first)
+NAV = [('/products/', 'Products'), ('/about/', 'About us'), ('/sustainability/', 'Sustainability'),
+       ('/investors/', 'Investors'), ('/news/', 'News')]
+FOOTER = [('/locations/', 'Locations'), ('/careers/', 'Careers'), ('/contact/', 'Contact'), ('/privacy/', 'Privacy'),
+          ('/imprint/', 'Imprint')]
+
+
+def synthetic_site(categories=10, products=20, news_pages=30, jobs=50, locations=40):
+    """
+    A corporate site as {path: links}: a large product catalogue, news archive and job board, and a few
+    sustainability and investor pages holding the reports. Every page links the navigation and the footer.
+    Returns (pages, report_pdfs, other_pdfs).
+    """
+    pages = {'/': [], '/contact/': [], '/privacy/': [], '/imprint/': [], '/about/history/': [], '/about/management/': []}
+    other_pdfs = set()
+
+    pages['/products/'] = [(f'/products/c{i}/', f'Category {i}') for i in range(categories)]
+    for i in range(categories):
+        pages[f'/products/c{i}/'] = [(f'/products/c{i}/p{j}/', f'Product {i}-{j}') for j in range(products)]
+        for j in range(products):
+            links = [(f'/products/c{i}/p{(j + 1) % products}/', 'Related product')]
+            if j % 5 == 0:
+                links.append((f'/products/c{i}/p{j}/datasheet.pdf', 'Datasheet'))
+                other_pdfs.add(f'/products/c{i}/p{j}/datasheet.pdf')
+            pages[f'/products/c{i}/p{j}/'] = links
+
+    pages['/news/'] = [('/news/page/0/', 'Archive')]
+    for n in range(news_pages):
+        articles = [(f'/news/{2024 - n // 10}/a{n * 10 + k}/', f'Article {n * 10 + k}') for k in range(10)]
+        pages[f'/news/page/{n}/'] = articles + [(f'/news/page/{(n + 1) % news_pages}/', 'Older')]
+        for path, _ in articles:
+            pages[path] = [('/news/', 'Back to news')]
+
+    pages['/careers/'] = [(f'/careers/jobs/{k}/', f'Job {k}') for k in range(jobs)]
+    for k in range(jobs):
+        pages[f'/careers/jobs/{k}/'] = [('/careers/', 'All jobs')]
+
+    pages['/locations/'] = [(f'/locations/{k}/', f'Location {k}') for k in range(locations)]
+    for k in range(locations):
+        pages[f'/locations/{k}/'] = [('/locations/', 'All locations'), ('/contact/', 'Contact')]
+
+    pages['/about/'] = [('/about/history/', 'History'), ('/about/management/', 'Management')]
+    pages['/investors/'] = [('/investors/share/', 'Share'), ('/investors/agm/', 'Annual general meeting'),
+                            ('/investors/publications/', 'Publications')]
+    pages['/investors/share/'] = []
+    pages['/investors/agm/'] = [('/investors/agm/invitation-2024.pdf', 'Invitation')]
+    other_pdfs.add('/investors/agm/invitation-2024.pdf')
+    pages['/investors/publications/'] = [
+        (f'/investors/publications/annual-report-{year}.pdf', f'Annual report {year}') for year in range(2019, 2025)
+    ]
+    pages['/sustainability/'] = [('/sustainability/strategy/', 'Strategy'), ('/sustainability/climate/', 'Climate'),
+                                 ('/sustainability/reports/', 'Reports')]
+    pages['/sustainability/strategy/'] = []
+    pages['/sustainability/climate/'] = [('/sustainability/climate/tcfd-2024.pdf', 'TCFD disclosure 2024')]
+    pages['/sustainability/reports/'] = [
+        (f'/sustainability/reports/report-{year}.pdf', f'Sustainability report {year}') for year in range(2019, 2025)
+    ] + [('/downloads/d7/', 'Nachhaltigkeitsbericht Archiv')]  # the URL says nothing, the anchor text does
+    pages['/downloads/d7/'] = [(f'/downloads/d7/{year}.pdf', f'Nachhaltigkeitsbericht {year}') for year in range(2015, 2019)]
+
+    report_pdfs = {path for links in pages.values() for path, _ in links if path.endswith('.pdf')} - other_pdfs
+    return pages, report_pdfs, other_pdfs
+
+
+def site_handler(pages, pdfs, latency=0.0):
+    class SiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)  # without it responses arrive before the crawl has scored the links of the last one
+            if self.path in pdfs:
+                body, content_type = b'%PDF-1.4\n' + self.path.encode() + b'\n%%EOF', 'application/pdf'
+            elif self.path in pages:
+                links = NAV + pages[self.path] + FOOTER
+                body = ('<html><body>' + ''.join(f'<a href="{href}">{text}</a>' for href, text in links)
+                        + '</body></html>').encode()
+                content_type = 'text/html'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return SiteHandler
+
+
+class SiteServer(ThreadingHTTPServer):
+    request_queue_size = 64  # the crawl opens several connections at once
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark link prioritization: crawl a synthetic corporate site with and without link scoring at several '
+        'page budgets and compare the report PDFs found per page fetched'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budgets', default='25,50,100,200', type=str, help='Comma separated page budgets')
+        parser.add_argument('--max_depth', default=6, type=int, help='Link depth to follow, 0 = unlimited')
+        parser.add_argument('--latency', default=0.05, type=float, help='Seconds the site takes per response')
+        parser.add_argument('--runs', default=3, type=int, help='Crawls per budget and mode, the table shows the mean')
+        parser.add_argument('--per_domain', default=4, type=int, help='Concurrent requests to the site')
+
+    def handle(self, *args, **options):
+        try:
+            budgets = [int(b) for b in options['budgets'].split(',') if b.strip()]
+        except ValueError:
+            raise CommandError(f"Invalid budgets: {options['budgets']}")
+
+        pages, report_pdfs, other_pdfs = synthetic_site()
+        server = SiteServer(('127.0.0.1', 0), site_handler(pages, report_pdfs | other_pdfs, options['latency']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        start_url = f'http://127.0.0.1:{server.server_address[1]}/'
+        self.stdout.write(
+            f"synthetic site: {len(pages)} pages, {len(report_pdfs)} report PDFs, {len(other_pdfs)} other PDFs, "
+            f"max_depth={options['max_depth']}"
+        )
+
+        self.stdout.write(f"{'budget':>7} {'mode':<9} {'pages':>7} {'reports':>8} {'other':>6} {'reports/100 pages':>18}")
+        try:
+            for budget in budgets:
+                for mode, score_links in (('unscored', False), ('scored', True)):
+                    # The order in which responses arrive varies, and with it what a small budget reaches
+                    fetched = n_reports = n_other = 0
+                    for _ in range(options['runs']):
+                        result = self._crawl(start_url, budget, score_links, options)
+                        found = {url[len(start_url) - 1:] for url in result['pdfs']}
+                        fetched += result['stats']['pages']
+                        n_reports += len(found & report_pdfs)
+                        n_other += len(found & other_pdfs)
+                    runs = options['runs']
+                    self.stdout.write(
+                        f"{budget:>7} {mode:<9} {fetched / runs:>7.1f} {n_reports / runs:>8.1f} {n_other / runs:>6.1f} "
+                        f"{100 * n_reports / max(fetched, 1):>18.1f}"
+                    )
+        finally:
+            server.shutdown()
+
+    def _crawl(self, start_url, budget, score_links, options):
+        with tempfile.TemporaryDirectory() as save_folder:
+            kwargs = {
+                'targets': [{'company_id': 1, 'url': start_url}],
+                'save_folder': save_folder,
+                'max_depth': options['max_depth'],
+                'max_pages': budget,
+                'score_links': score_links,
+                'per_domain': options['per_domain'],
+                # One site: more requests than its slot takes would wait in the slot, out of priority order
+                'concurrency': options['per_domain'],
+            }
+            completed = subprocess.run(
+                [sys.executable, '-c', CRAWL_SCRIPT, json.dumps(kwargs)],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+        if completed.returncode != 0:
+            raise CommandError(f"Crawl failed:\n{completed.stderr[-2000:]}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from api.models import CompanyProfile, PDFFile, Query
+from backend.llm_module.llm_provider import SentenceTransformersEmbeddingProvider
+from backend.llm_module.processor import LLMProcessor, query_text
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rag_analyze latency with sequential and thread-pooled per-PDF retrieval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min_reports', default=50, type=int, help='Only companies with at least this many processed PDFs')
+        parser.add_argument('--company_id', type=int, help='Benchmark this company regardless of its report count')
+        parser.add_argument('--workers', default='1,4,8,16', help='Comma-separated pool sizes, 1 = sequential')
+        parser.add_argument('--queries', default=5, type=int, help='Number of active queries to run per company')
+        parser.add_argument('--top_k', default=5, type=int)
+        parser.add_argument('--filter_by_document_level_index', action='store_true')
+
+    def handle(self, *args, **options):
+        processed = Q(pdfs__active=True, pdfs__processing_status='success', pdfs__chunk_vector_index_path__isnull=False)
+        companies = CompanyProfile.objects.annotate(n_reports=Count('pdfs', filter=processed))
+        if options['company_id']:
+            companies = companies.filter(id=options['company_id'])
+        else:
+            companies = companies.filter(n_reports__gte=options['min_reports'])
+        companies = list(companies.order_by('-n_reports'))
+
+        queries = list(Query.objects.filter(active=True)[:options['queries']])
+        if not companies or not queries:
+            raise CommandError(f"Need at least one active query and one company with {options['min_reports']}+ processed reports.")
+
+        worker_counts = [int(w) for w in options['workers'].split(',')]
+        # Only table columns are searched, so no LLM calls for report years end up in the timings
+        processor = LLMProcessor(embedding_provider=SentenceTransformersEmbeddingProvider())
+
+        for company in companies:
+            pdf_files = list(
+                PDFFile.objects.filter(company=company, active=True, processing_status='success')
+                .exclude(chunk_vector_index_path=None)
+            )
+            self.stdout.write(f"\nCompany {company.id} ({company.name}): {len(pdf_files)} reports, {len(queries)} queries")
+
+            def run(query, workers):
+                return processor.rag_analyze(
+                    company.id, query.id, query_text(query), pdf_files,
+                    top_k=options['top_k'],
+                    filter_by_document_level_index=options['filter_by_document_level_index'],
+                    max_workers=workers,
+                )
+
+            # Warm up model and page cache so that the first configuration does not pay for loading
+            run(queries[0], max(worker_counts))
+
+            reference = None
+            baseline = None
+            for workers in worker_counts:
+                latencies = []
+                outputs = []
+                for query in queries:
+                    start = time.perf_counter()
+                    outputs.append(run(query, workers))
+                    latencies.append(time.perf_counter() - start)
+
+                chunk_ids = [[(r['pdf_id'], r['chunk_id']) for r in output] for output in outputs]
+                if reference is None:
+                    reference = chunk_ids
+                elif chunk_ids != reference:
+                    self.stderr.write(f"Warning: results with {workers} workers differ from {worker_counts[0]} workers.")
+
+                median = statistics.median(latencies)
+                baseline = baseline or median
+                self.stdout.write(
+                    f"workers={workers:<3} median {median * 1000:>8.1f} ms  max {max(latencies) * 1000:>8.1f} ms  "
+                    f"speed-up {baseline / median:.1f}x"
+                )
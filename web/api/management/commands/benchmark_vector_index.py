@@ -0,0 +1,142 @@
+import os
+import glob
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.llm_module.vector_store import INDEX_TYPES, ChunkVectorStore, build_faiss_index, choose_index_type
+
+
+class Command(BaseCommand):
+    help = 'Benchmark FAISS index types (recall@k against flat search, query latency, build time)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', default=50_000, type=int, help='Number of synthetic vectors')
+        parser.add_argument('--dim', default=384, type=int, help='Dimension of synthetic vectors')
+        parser.add_argument('--queries', default=200, type=int, help='Number of queries to time')
+        parser.add_argument('--k', default=10, type=int, help='Number of neighbours per query (recall@k)')
+        parser.add_argument('--index_types', default=','.join(INDEX_TYPES), type=str,
+                            help='Comma separated index types to compare')
+        parser.add_argument('--real', action='store_true',
+                            help='Use the chunk embeddings of the existing indexes under MEDIA_ROOT/vector_indexes')
+        parser.add_argument('--compare_filtering', action='store_true',
+                            help='Also compare filtered search inside the index with post-filtering')
+        parser.add_argument('--filter_fraction', default=0.1, type=float,
+                            help='Share of chunks matching the filter in the filtering comparison')
+        parser.add_argument('--seed', default=42, type=int)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        index_types = [t.strip() for t in options['index_types'].split(',') if t.strip()]
+        unknown = set(index_types) - set(INDEX_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown index types: {', '.join(sorted(unknown))}")
+
+        if options['real']:
+            vectors = self._load_real_vectors()
+            source = 'real'
+        else:
+            vectors = self._synthetic_vectors(rng, options['vectors'], options['dim'])
+            source = 'synthetic'
+
+        n, dim = vectors.shape
+        k = min(options['k'], n)
+        queries = self._sample_queries(rng, vectors, options['queries'])
+
+        self.stdout.write(
+            f"{source} embeddings: {n} vectors, dim={dim}, {len(queries)} queries, k={k} "
+            f"(size-based choice: {choose_index_type(n)})"
+        )
+
+        # Exact ground truth from brute force search
+        ground_truth, _ = build_faiss_index(dim, vectors, index_type='flat')
+        _, true_ids = ground_truth.search(queries, k)
+
+        self.stdout.write(f"{'type':<6} {'factory':<14} {'build s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'recall@' + str(k):>10}")
+        for index_type in index_types:
+            index, params = build_faiss_index(dim, vectors, index_type=index_type)
+
+            latencies = []
+            found_ids = np.empty((len(queries), k), dtype='int64')
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                _, ids = index.search(query.reshape(1, -1), k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found_ids[i] = ids[0]
+
+            recall = np.mean([
+                len(set(found) & set(true)) / k for found, true in zip(found_ids, true_ids)
+            ])
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            self.stdout.write(
+                f"{index_type:<6} {params['factory']:<14} {params['build_seconds']:>9.3f} "
+                f"{p50:>8.3f} {p95:>8.3f} {p99:>8.3f} {recall:>10.3f}"
+            )
+
+        if options['compare_filtering']:
+            self._compare_filtering(rng, vectors, queries, k, index_types, options['filter_fraction'])
+
+    def _compare_filtering(self, rng, vectors, queries, k, index_types, fraction):
+        """Filtered search pushed into the index against searching k * overfetch and filtering after."""
+        n, dim = vectors.shape
+        matching = rng.random(n) < fraction
+        metas = [{'chunk_type': 'table_column' if m else 'text'} for m in matching]
+        self.stdout.write(
+            f"\nFiltering: {matching.sum()} of {n} chunks match chunk_type=table_column, k={k}"
+        )
+        self.stdout.write(f"{'type':<6} {'mode':<16} {'p50 ms':>8} {'p95 ms':>8} {'avg hits':>9}")
+
+        for index_type in index_types:
+            store = ChunkVectorStore(dim=dim, index_type=index_type)
+            store.add_chunk_vectors(vectors, metas)
+            modes = [('pushed down', None)] + [(f'post-filter x{f}', f) for f in (1, 4, 16)]
+            for mode, overfetch in modes:
+                latencies, hits = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    if overfetch is None:
+                        results = store.search(query, top_k=k, chunk_types=['table_column'])
+                    else:
+                        results = [
+                            (meta, score) for meta, score in store.search(query, top_k=k * overfetch)
+                            if meta['chunk_type'] == 'table_column'
+                        ][:k]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits.append(len(results))
+                p50, p95 = np.percentile(latencies, [50, 95])
+                self.stdout.write(f"{index_type:<6} {mode:<16} {p50:>8.3f} {p95:>8.3f} {np.mean(hits):>9.2f}")
+
+    def _synthetic_vectors(self, rng, n, dim):
+        # Clustered data resembles sentence embeddings much better than uniform noise
+        n_clusters = max(1, n // 500)
+        centers = rng.standard_normal((n_clusters, dim)).astype('float32')
+        labels = rng.integers(0, n_clusters, size=n)
+        vectors = centers[labels] + 0.3 * rng.standard_normal((n, dim)).astype('float32')
+        return np.ascontiguousarray(vectors, dtype='float32')
+
+    def _load_real_vectors(self):
+        index_dir = os.path.join(settings.MEDIA_ROOT, 'vector_indexes')
+        paths = [p for p in glob.glob(os.path.join(index_dir, '*.faiss')) if not p.endswith('.doc.faiss')]
+        if not paths:
+            raise CommandError(f"No chunk indexes found in {index_dir}")
+
+        blocks = []
+        for path in paths:
+            index = faiss.read_index(path)
+            try:
+                blocks.append(index.reconstruct_n(0, index.ntotal))
+            except RuntimeError as e:
+                self.stderr.write(f"Skipping {os.path.basename(path)}: {e}")
+        if not blocks:
+            raise CommandError("None of the chunk indexes could be reconstructed")
+        return np.ascontiguousarray(np.vstack(blocks), dtype='float32')
+
+    def _sample_queries(self, rng, vectors, n_queries):
+        # Perturbed corpus vectors, so that queries have meaningful near neighbours
+        picks = rng.integers(0, len(vectors), size=n_queries)
+        noise = 0.1 * rng.standard_normal((n_queries, vectors.shape[1])).astype('float32')
+        return np.ascontiguousarray(vectors[picks] + noise, dtype='float32')
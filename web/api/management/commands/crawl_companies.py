@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import CompanyProfile, CompanyURL, Job
+from api.scraping import known_origins, record_unchanged
+from backend.scraper_module.runner import crawl_companies
+
+CRAWL_STATE_DIR = 'crawl_state'  # below MEDIA_ROOT, one SQLite file per CompanyURL
+
+
+def _megabytes(n_bytes: int) -> str:
+    return f"{n_bytes / 2**20:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        'Crawl the active URLs of all active companies (or --company_id) in one Scrapy crawl with a global and '
+        'a per-domain concurrency limit, and store the found PDFs. Starts its own reactor, so run it once per process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company_id', type=int, nargs='+', help='Only crawl these companies')
+        parser.add_argument('--concurrency', type=int, help='Concurrent requests overall (default: CONCURRENT_REQUESTS)')
+        parser.add_argument('--per_domain', type=int, help='Concurrent requests per domain (default: CONCURRENT_REQUESTS_PER_DOMAIN)')
+        parser.add_argument('--job_id', help='Job to report progress on, set by run_scraping_task')
+        parser.add_argument('--report_every', default=30.0, type=float, help='Seconds between progress lines')
+        parser.add_argument('--recrawl_after', default=7.0, type=float, help='Days after which a visited page is crawled again')
+        parser.add_argument('--max_depth', type=int, help='Link depth below the start URL to follow, 0 = unlimited (default: CRAWL_MAX_DEPTH)')
+        parser.add_argument('--max_pages', type=int, help='Pages to request per company, 0 = unlimited (default: CRAWL_MAX_PAGES_PER_COMPANY)')
+        parser.add_argument('--full', action='store_true', help='Crawl all pages again, ignoring when they were last seen')
+
+    def handle(self, *args, **options):
+        urls = CompanyURL.objects.filter(active=True, company__active=True).select_related('company')
+        if options['company_id']:
+            urls = urls.filter(company_id__in=options['company_id'])
+        urls = list(urls.order_by('company_id', 'id'))
+        if not urls:
+            raise CommandError("No active URLs to crawl.")
+
+        self.job = Job.objects.get(pk=options['job_id']) if options['job_id'] else None
+        companies = {url.company_id: url.company for url in urls}
+        targets = [{'company_id': url.company_id, 'company_url_id': url.id, 'url': url.url} for url in urls]
+        self.stdout.write(f"Starte Crawl von {len(targets)} URLs für {len(companies)} Firmen…")
+
+        save_folder = tempfile.mkdtemp(prefix='crawl-', dir=settings.MEDIA_ROOT)
+        try:
+            spider = crawl_companies(
+                targets, save_folder,
+                known=known_origins(list(companies)),
+                state_dir=os.path.join(settings.MEDIA_ROOT, CRAWL_STATE_DIR),
+                recrawl_after=0 if options['full'] else options['recrawl_after'] * 86400,
+                store_pdfs=True,  # PdfStoragePipeline stores them while the crawl runs
+                max_depth=options['max_depth'],
+                max_pages=options['max_pages'],
+                concurrency=options['concurrency'],
+                per_domain=options['per_domain'],
+                report=self.report,
+                report_every=options['report_every'],
+            )
+            self.report(spider)
+            self.report_companies(spider, companies)
+        finally:
+            shutil.rmtree(save_folder, ignore_errors=True)
+
+        CompanyProfile.objects.filter(id__in=list(companies)).update(last_scraped=timezone.now())
+        bytes_saved = sum(stats['bytes_saved'] for stats in spider.company_stats.values())
+        bytes_downloaded = sum(stats['bytes'] for stats in spider.company_stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Scraping & Speichern abgeschlossen: {_megabytes(bytes_downloaded)} PDFs downloaded, "
+            f"{_megabytes(bytes_saved)} saved by conditional requests."
+        ))
+        if self.job is not None:
+            self.job.add_progress(bytes_downloaded=bytes_downloaded, bytes_saved=bytes_saved)
+
+    def report(self, spider):
+        total_pdfs = sum(stats['pdfs'] for stats in spider.company_stats.values())
+        self.stdout.write(f"{spider.pages_per_sec():.1f} pages/s, {total_pdfs} PDFs found")
+        if self.job is not None:
+            self.job.add_progress(pages_per_sec=round(spider.pages_per_sec(), 2), pdfs_found=total_pdfs)
+
+    def report_companies(self, spider, companies):
+        counts = spider.crawler.stats  # pdf_store/* of PdfStoragePipeline
+        for company_id, company in companies.items():
+            record_unchanged(spider.unchanged[company_id])
+            new, duplicates, failed = (
+                counts.get_value(f'pdf_store/{outcome}/{company_id}', 0) for outcome in ('created', 'duplicates', 'failed')
+            )
+
+            stats = spider.company_stats[company_id]
+            self.stdout.write(
+                f"{company.name}: {stats['pages']} pages ({spider.pages_per_sec(company_id):.2f} pages/s), "
+                f"{stats['pdfs']} PDFs downloaded, {new} new, {duplicates} duplicates, {failed} failed, "
+                f"{stats['unchanged']} unchanged ({_megabytes(stats['bytes_saved'])} saved), "
+                f"{stats['fresh']} recently seen URLs skipped, {stats['over_budget']} pages over budget"
+            )
+            if self.job is not None:
+                self.job.add_progress(done=1, failed=1 if failed else 0, results_created=new, current_company=company_id)
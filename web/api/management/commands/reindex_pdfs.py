@@ -0,0 +1,312 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.models import PDFFile
+from backend.llm_module.artifacts import PIPELINE_DIR, discard_artifacts, embedding_model_name, find_artifacts, write_artifact
+from backend.llm_module.company_index import add_pdf_to_company_index_task
+from backend.llm_module.ingestion_queue import BULK_PRIORITY
+from backend.llm_module.pdf_preprocessor import get_preprocessor, ingestion_pipeline
+from backend.llm_module.pdf_store import get_pdf_store
+
+STATUSES = ('pending', 'success', 'failed')
+
+
+def _index_pdf(pdf_id: int, pdf_path: str, file_hash: str):
+    """Runs in a pool process; the preprocessor and its models are created once per process."""
+    return get_preprocessor().index_pdf(pdf_id, pdf_path, file_hash)
+
+
+class ReindexCheckpoint:
+    """
+    Progress of a reindex run, saved as JSON after every finished PDF: the selection the run was started
+    with, the PDFs that are done or failed and, with --celery, the PDFs whose pipeline is queued. A run
+    with the same selection skips the done PDFs and does not queue the queued ones again.
+    """
+    def __init__(self, path: str, selection: dict):
+        self.path = path
+        self.selection = selection
+        self.started_at = timezone.now()
+        self.done = set()
+        self.failed = set()
+        self.queued = set()
+
+    @classmethod
+    def load(cls, path: str, selection: dict, restart: bool = False) -> 'ReindexCheckpoint':
+        checkpoint = cls(path, selection)
+        if restart or not os.path.exists(path):
+            return checkpoint
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data['selection'] != selection:
+            raise CommandError(
+                f"Checkpoint {path} belongs to a run with another selection ({data['selection']}). "
+                f"Use --restart to discard it or --checkpoint to keep it."
+            )
+        checkpoint.started_at = datetime.fromisoformat(data['started_at'])
+        checkpoint.done = set(data['done'])
+        checkpoint.failed = set(data['failed'])
+        checkpoint.queued = set(data.get('queued', []))
+        return checkpoint
+
+    def mark_queued(self, pdf_ids):
+        self.queued.update(pdf_ids)
+        self.save()
+
+    def mark(self, pdf_ids, ok: bool):
+        self.queued.difference_update(pdf_ids)
+        if ok:
+            self.done.update(pdf_ids)
+            self.failed.difference_update(pdf_ids)
+        else:
+            self.failed.update(pdf_ids)
+        self.save()
+
+    def save(self):
+        data = {
+            'selection': self.selection,
+            'started_at': self.started_at.isoformat(),
+            'done': sorted(self.done),
+            'failed': sorted(self.failed),
+            'queued': sorted(self.queued),
+        }
+        write_artifact(self.path, lambda f: f.write(json.dumps(data).encode('utf-8')))
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the vector indexes of existing PDFs, in a process pool or fanned out to the Celery ingestion '
+        'pipeline. Progress is checkpointed, running the same command again resumes an interrupted run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company_id', type=int, nargs='+', help='Only PDFs of these companies')
+        parser.add_argument('--status', nargs='+', choices=STATUSES, help='Only PDFs with this processing status')
+        parser.add_argument('--embedding_model', help="Only PDFs indexed with this embedding model, 'none' for never indexed")
+        parser.add_argument('--outdated', action='store_true', help='Only PDFs not indexed with the current EMBEDDING_MODEL_NAME')
+        parser.add_argument('--since', help='Only PDFs scraped or uploaded on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only PDFs scraped or uploaded on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--include_inactive', action='store_true')
+        parser.add_argument('--limit', type=int)
+        parser.add_argument('--rebuild', action='store_true', help='Build index sets again even if the file hash already has one for the current model')
+        parser.add_argument('--workers', default=1, type=int, help='Size of the process pool, 1 = in this process')
+        parser.add_argument('--celery', action='store_true', help='Queue the ingestion pipeline per PDF instead of using a process pool')
+        parser.add_argument('--force', action='store_true', help='With --celery, queue PDFs again whose pipeline an interrupted run queued')
+        parser.add_argument(
+            '--timeout', default=3600.0, type=float,
+            help='With --celery, seconds without any finished PDF after which the outstanding PDFs are marked failed'
+        )
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: MEDIA_ROOT/pipeline/reindex_checkpoint.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--report_every', default=5.0, type=float, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        selection = {
+            key: options[key]
+            for key in ('company_id', 'status', 'embedding_model', 'outdated', 'since', 'until', 'include_inactive', 'limit', 'rebuild')
+        }
+        selection['model'] = embedding_model_name()  # a different model is a different run
+        checkpoint_path = options['checkpoint'] or os.path.join(settings.MEDIA_ROOT, PIPELINE_DIR, 'reindex_checkpoint.json')
+        self.checkpoint = ReindexCheckpoint.load(checkpoint_path, selection, restart=options['restart'])
+
+        pdfs = [pdf for pdf in self.select(options) if pdf.id not in self.checkpoint.done]
+        if self.checkpoint.done:
+            self.stdout.write(f"Resuming from {checkpoint_path}: {len(self.checkpoint.done)} PDFs already done.")
+        if not pdfs:
+            self.stdout.write("Nothing to reindex.")
+            return
+
+        if options['rebuild']:
+            # Manifests written by this run (before an interruption) are kept
+            discarded = sum(
+                discard_artifacts(file_hash, selection['model'], built_before=self.checkpoint.started_at)
+                for file_hash in {pdf.file_hash for pdf in pdfs}
+            )
+            self.stdout.write(f"Discarded {discarded} existing index sets.")
+        self.checkpoint.save()
+
+        self.total = len(pdfs)
+        self.report_every = options['report_every']
+        self.processed = self.pages = self.chunks = self.failed = 0
+        self.started = self.last_report = time.perf_counter()
+        self.stdout.write(f"Reindexing {self.total} PDFs with {selection['model']}.")
+
+        try:
+            if options['celery']:
+                self.run_celery(pdfs, options['force'], options['timeout'])
+            else:
+                self.run_pool(pdfs, options['workers'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"\nInterrupted after {self.processed} PDFs; run the same command again to resume."
+            ))
+            return
+
+        self.report()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.processed - self.failed} PDFs reindexed, {self.failed} failed "
+            f"in {timedelta(seconds=int(time.perf_counter() - self.started))}."
+        ))
+
+    def select(self, options):
+        pdfs = PDFFile.objects.all()
+        if not options['include_inactive']:
+            pdfs = pdfs.filter(active=True)
+        if options['company_id']:
+            pdfs = pdfs.filter(company_id__in=options['company_id'])
+        if options['status']:
+            pdfs = pdfs.filter(processing_status__in=options['status'])
+        if options['embedding_model'] == 'none':
+            pdfs = pdfs.filter(embedding_model__isnull=True)
+        elif options['embedding_model']:
+            pdfs = pdfs.filter(embedding_model=options['embedding_model'])
+        if options['outdated']:
+            pdfs = pdfs.exclude(embedding_model=embedding_model_name())
+        for option, lookup in (('since', 'gte'), ('until', 'lte')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f"--{option} must be a date (YYYY-MM-DD), got '{options[option]}'.")
+                pdfs = pdfs.filter(**{f'scrape_dates__scraped_at__date__{lookup}': day}).distinct()
+        pdfs = pdfs.only('id', 'file', 'file_hash').order_by('id')
+        if options['limit']:
+            pdfs = pdfs[:options['limit']]
+        return list(pdfs)
+
+    # --- Process pool ---
+
+    def run_pool(self, pdfs, workers: int):
+        # PDFs with the same content share one index set, so each file hash is processed once
+        groups = {}
+        for pdf in pdfs:
+            groups.setdefault(pdf.file_hash, []).append(pdf)
+
+        if workers <= 1:
+            for group in groups.values():
+                try:
+                    result = _index_pdf(group[0].id, group[0].file.path, group[0].file_hash)
+                except Exception as e:
+                    self.finish_group(group, error=e)
+                else:
+                    self.finish_group(group, result)
+            return
+
+        connections.close_all()  # the pool processes must not inherit this process' database connections
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                pool.submit(_index_pdf, group[0].id, group[0].file.path, file_hash): group
+                for file_hash, group in groups.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.finish_group(futures[future], error=e)
+                else:
+                    self.finish_group(futures[future], result)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def finish_group(self, group, result=None, error=None):
+        pdf_ids = [pdf.id for pdf in group]
+        store = get_pdf_store()
+        if error is not None:
+            self.stderr.write(f"Reindexing PDF {pdf_ids[0]} failed: {error}")
+            store.update_many({pdf_id: {'processing_status': 'failed'} for pdf_id in pdf_ids})
+            self.checkpoint.mark(pdf_ids, ok=False)
+            self.failed += len(pdf_ids)
+        else:
+            fields = result['fields']
+            store.update_many({pdf_id: {'processing_status': 'success', **fields} for pdf_id in pdf_ids})
+            if fields:
+                for pdf_id in pdf_ids:
+                    add_pdf_to_company_index_task.delay(pdf_id, replace=True)
+            self.checkpoint.mark(pdf_ids, ok=True)
+            self.pages += result['n_pages']
+            self.chunks += result['n_chunks']
+        self.processed += len(pdf_ids)
+        self.maybe_report()
+
+    # --- Celery fan-out ---
+
+    def run_celery(self, pdfs, force: bool = False, timeout: float = 3600.0):
+        # Pipelines an interrupted run queued are still in the queue; they are polled, not queued twice
+        still_queued = set() if force else set(
+            PDFFile.objects.filter(id__in=self.checkpoint.queued, processing_status='pending').values_list('id', flat=True)
+        )
+        to_queue = [pdf for pdf in pdfs if pdf.id not in still_queued]
+        # The pipeline sets the status when it is done, that is what the progress is polled on
+        PDFFile.objects.filter(id__in=[pdf.id for pdf in to_queue]).update(processing_status='pending')
+        for pdf in to_queue:
+            # Lowest priority, uploads and scraped PDFs are processed in between
+            ingestion_pipeline(pdf.id, pdf.file.path, source='reindex', priority=BULK_PRIORITY).apply_async()
+        self.checkpoint.mark_queued([pdf.id for pdf in to_queue])
+        self.stdout.write(f"Queued {len(to_queue)} ingestion pipelines, {len(pdfs) - len(to_queue)} still queued by an earlier run.")
+
+        model_name = embedding_model_name()
+        outstanding = {pdf.id: pdf.file_hash for pdf in pdfs}
+        last_progress = time.monotonic()
+        while outstanding:
+            time.sleep(self.report_every)
+            if time.monotonic() - last_progress > timeout:
+                # Lost pipelines (worker killed, message dropped) would keep the PDFs pending forever
+                lost = sorted(outstanding)
+                self.stderr.write(f"No PDF finished in {timeout:.0f} s, marking {len(lost)} outstanding PDFs failed: {lost}")
+                get_pdf_store().update_many({pdf_id: {'processing_status': 'failed'} for pdf_id in lost})
+                self.checkpoint.mark(lost, ok=False)
+                self.processed += len(lost)
+                self.failed += len(lost)
+                return
+            finished = (
+                PDFFile.objects.filter(id__in=list(outstanding))
+                .exclude(processing_status='pending')
+                .values_list('id', 'processing_status')
+            )
+            succeeded, failed = [], []
+            for pdf_id, status in finished:
+                file_hash = outstanding.pop(pdf_id)
+                if status != 'success':
+                    failed.append(pdf_id)
+                    continue
+                succeeded.append(pdf_id)
+                # Only PDFs that built their index set did the work, the others reused it
+                manifest = find_artifacts(file_hash, model_name)
+                if manifest and manifest['built_for_pdf_id'] == pdf_id:
+                    self.pages += manifest.get('n_pages') or 0
+                    self.chunks += manifest['n_chunks']
+            if succeeded or failed:
+                last_progress = time.monotonic()
+            if succeeded:
+                self.checkpoint.mark(succeeded, ok=True)
+            if failed:
+                self.checkpoint.mark(failed, ok=False)
+            self.processed += len(succeeded) + len(failed)
+            self.failed += len(failed)
+            self.report()
+
+    # --- Progress ---
+
+    def maybe_report(self):
+        if time.perf_counter() - self.last_report >= self.report_every:
+            self.report()
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        elapsed = self.last_report - self.started
+        if elapsed <= 0:
+            return
+        pdf_rate = self.processed / elapsed
+        eta = timedelta(seconds=int((self.total - self.processed) / pdf_rate)) if pdf_rate else '?'
+        self.stdout.write(
+            f"[{self.processed}/{self.total}] {pdf_rate:.2f} PDFs/s  {self.pages / elapsed:.1f} pages/s  "
+            f"{self.chunks / elapsed:.1f} chunks/s  failed {self.failed}  ETA {eta}"
+        )
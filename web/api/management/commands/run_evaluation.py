@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Job
+from api.tasks import run_evaluation_matrix_task
+
+
+class Command(BaseCommand):
+    help = 'Evaluate all active companies against all active queries, skipping pairs whose inputs did not change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-evaluate pairs even if their input fingerprint is unchanged')
+        parser.add_argument('--top_k', default=5, type=int)
+        parser.add_argument('--async', dest='run_async', action='store_true', help='Queue the Celery task instead of running in-process')
+
+    def handle(self, *args, **options):
+        kwargs = {'top_k': options['top_k'], 'force': options['force']}
+        if options['run_async']:
+            result = run_evaluation_matrix_task.delay(**kwargs)
+            self.stdout.write(f"Evaluation queued as task {result.id}.")
+            return
+
+        job = Job.objects.get(pk=run_evaluation_matrix_task(**kwargs))
+        self.stdout.write(
+            f"{job.done}/{job.total} pairs done, {job.skipped} skipped as unchanged, "
+            f"{job.results_created} results created in {job.duration:.1f} s."
+        )
@@ -1,22 +1,21 @@
 import os
-import hashlib
-import pandas as pd
-import requests
 from django.core.management.base import BaseCommand
-from django.core.files.base import ContentFile
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
 from backend.scraper_module.spiders.pdf_spider import PdfSpider
-from api.models import CompanyProfile, PDFFile, PDFScrapeDate, PDFOriginURL
+from api.models import CompanyProfile
 
 class Command(BaseCommand):
-    help = 'Run the PDF scraper for a company and save results to the database'
+    help = (
+        'Run the PDF scraper for a company and save results to the database. '
+        'Starts its own reactor, so run it once per process; crawl_companies crawls many companies at once.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('--domain', required=True, type=str, help='The domain to crawl for PDFs')
         parser.add_argument('--company_id', required=True, type=int, help='The ID of the company to associate with the PDFs')
-        parser.add_argument('--save_folder', default='media/pdfs', type=str, help='Local folder to save CSV & PDFs')
+        parser.add_argument('--save_folder', default='media/pdfs', type=str, help='Local folder for the downloaded PDFs')
 
     def handle(self, *args, **options):
         domain = options['domain']
@@ -40,41 +39,18 @@ class Command(BaseCommand):
         # Optional: Overrides an Settings, z.B. Verzeichnis für Dateien
         settings.set('FILES_STORE', output_folder, priority='cmdline')
 
-        # 4) CrawlerProcess mit diesen Settings starten
+        # 4) CrawlerProcess mit diesen Settings starten; PdfStoragePipeline speichert die PDFs während des Crawls
         process = CrawlerProcess(settings)
-        process.crawl(PdfSpider, domain=domain, save_folder=output_folder)
+        crawler = process.create_crawler(PdfSpider)
+        process.crawl(crawler, domain=domain, save_folder=output_folder, company_id=company.id)
         self.stdout.write(f"Starte In-Process Scrapy für {domain}…")
         process.start()  # blockiert, bis Spider fertig
 
-        # 5) Nach dem Crawl: CSV einlesen und in DB speichern
-        csv_path = os.path.join(output_folder, 'pdf_files.csv')
-        df = pd.read_csv(csv_path)
-        for _, row in df.iterrows():
-            local_path = row['file_path']          # statt pdf_url
-            file_name  = row['file_name']
-
-            try:
-                # PDF direkt von Platte laden:
-                with open(local_path, 'rb') as f:
-                    content = f.read()
-
-                sha256 = hashlib.sha256(content).hexdigest()
-                pdf = PDFFile.objects.filter(file_hash=sha256, source='webscraped').first()
-
-                if pdf:
-                    PDFScrapeDate.objects.create(pdf_file=pdf)
-                    if not pdf.origin_urls.filter(url=local_path).exists():
-                        PDFOriginURL.objects.create(pdf_file=pdf, url=local_path)
-                    self.stdout.write(f"Duplicate gefunden, Metadaten aktualisiert: {file_name}")
-                else:
-                    new_pdf = PDFFile(company=company, source='webscraped')
-                    new_pdf.file.save(file_name, ContentFile(content))
-                    new_pdf.save()
-                    PDFScrapeDate.objects.create(pdf_file=new_pdf)
-                    PDFOriginURL.objects.create(pdf_file=new_pdf, url=local_path) # TODO Local path auf url anpassen, pdf_files.csv muss angepasst werden
-                    self.stdout.write(f"Neues PDF gespeichert: {file_name}")
-
-            except Exception as e:
-                self.stderr.write(f"Fehler beim Lesen {local_path}: {e}")
-
+        stats = crawler.stats
+        self.stdout.write(
+            f"{stats.get_value('pdf_store/created', 0)} neue PDFs, "
+            f"{stats.get_value('pdf_store/duplicates', 0)} Duplikate, "
+            f"{stats.get_value('pdf_store/failed', 0)} Fehler"
+        )
         self.stdout.write("Scraping & Speichern abgeschlossen.")
+
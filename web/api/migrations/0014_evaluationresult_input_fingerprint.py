@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_pdfvector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the inputs (PDF set, query, model versions) this result was computed from.', max_length=64, null=True),
+        ),
+    ]
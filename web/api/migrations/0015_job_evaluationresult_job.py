@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_evaluationresult_input_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('evaluation', 'Evaluation'), ('evaluation_matrix', 'Evaluation matrix'), ('scrape', 'Scrape')], max_length=32)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('success', 'Success'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('celery_task_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('results_created', models.IntegerField(default=0)),
+                ('info', models.JSONField(blank=True, default=dict, help_text='Additional progress details, e.g. the current company.')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='job',
+            field=models.ForeignKey(blank=True, help_text='The job that produced this result, if any.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='results', to='api.job'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_job_evaluationresult_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pdffile',
+            name='file_hash',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pdffile',
+            name='embedding_model',
+            field=models.CharField(blank=True, help_text='Embedding model the vector indexes were built with.', max_length=255, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pdffile',
+            unique_together={('company', 'file_hash')},
+        ),
+    ]
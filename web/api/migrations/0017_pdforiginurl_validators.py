@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_pdffile_embedding_model_company_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdforiginurl',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='pdforiginurl',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pdforiginurl',
+            name='content_length',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
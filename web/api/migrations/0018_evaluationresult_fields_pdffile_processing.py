@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:56
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_pdforiginurl_validators'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='queryresult',
+            name='company',
+        ),
+        migrations.RemoveField(
+            model_name='queryresult',
+            name='pdf',
+        ),
+        migrations.RemoveField(
+            model_name='queryresult',
+            name='query',
+        ),
+        migrations.RemoveField(
+            model_name='evaluationresult',
+            name='result_data',
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='answer',
+            field=models.TextField(default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='chunk_id',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='chunk_type',
+            field=models.CharField(default='', max_length=50),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='cosine_similarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='processing_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='references',
+            field=models.JSONField(default=dict, help_text='Metadata from chunk used to produce this result.'),
+        ),
+        migrations.AddField(
+            model_name='evaluationresult',
+            name='report_year',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pdffile',
+            name='chunk_vector_index_path',
+            field=models.CharField(blank=True, max_length=512, null=True),
+        ),
+        migrations.AddField(
+            model_name='pdffile',
+            name='document_vector_index_path',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='pdffile',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='pdffile',
+            name='report_year',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='companyurl',
+            name='url',
+            field=models.URLField(max_length=2000, validators=[django.core.validators.URLValidator()]),
+        ),
+        migrations.AlterField(
+            model_name='evaluationresult',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='api.companyprofile'),
+        ),
+        migrations.AlterField(
+            model_name='evaluationresult',
+            name='pdf_file',
+            field=models.ForeignKey(default='', help_text='The source PDF for this result.', on_delete=django.db.models.deletion.CASCADE, related_name='results', to='api.pdffile'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='evaluationresult',
+            name='query',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='api.query'),
+        ),
+        migrations.DeleteModel(
+            name='PDFVector',
+        ),
+        migrations.DeleteModel(
+            name='QueryResult',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_latest_result_fingerprints(apps, schema_editor):
+    """Pairs evaluated before this migration keep the fingerprint of their latest result."""
+    EvaluationResult = apps.get_model('api', 'EvaluationResult')
+    EvaluationFingerprint = apps.get_model('api', 'EvaluationFingerprint')
+    latest_id = (
+        EvaluationResult.objects.filter(company_id=OuterRef('company_id'), query_id=OuterRef('query_id'))
+        .order_by('-timestamp', '-id')
+        .values('id')[:1]
+    )
+    rows = (
+        EvaluationResult.objects.filter(id=Subquery(latest_id)).exclude(input_fingerprint=None)
+        .values_list('company_id', 'query_id', 'input_fingerprint', 'timestamp')
+    )
+    EvaluationFingerprint.objects.bulk_create([
+        EvaluationFingerprint(company_id=company_id, query_id=query_id, input_fingerprint=fingerprint, evaluated_at=timestamp)
+        for company_id, query_id, fingerprint, timestamp in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_evaluationresult_fields_pdffile_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvaluationFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('input_fingerprint', models.CharField(max_length=64)),
+                ('evaluated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluation_fingerprints', to='api.companyprofile')),
+                ('query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluation_fingerprints', to='api.query')),
+            ],
+            options={
+                'unique_together': {('company', 'query')},
+            },
+        ),
+        migrations.RunPython(copy_latest_result_fingerprints, migrations.RunPython.noop),
+    ]
@@ -18,7 +18,10 @@ from django.contrib.auth.models import User
 from django.core.validators import URLValidator
 from django.utils.timezone import now
 from django.contrib.postgres.fields import JSONField  # for Postgres, else use models.JSONField in Django 3.1+
+from django.db.models import F
+from datetime import timedelta
 import hashlib
+import uuid
 
 
 class CompanyProfile(models.Model):
@@ -45,7 +48,7 @@ class CompanyURL(models.Model):
 class PDFFile(models.Model):
     company = models.ForeignKey("CompanyProfile", related_name='pdfs', on_delete=models.CASCADE)
     file = models.FileField(upload_to='pdfs/')
-    file_hash = models.CharField(max_length=64, unique=True)  # SHA-256 hash
+    file_hash = models.CharField(max_length=64, db_index=True)  # SHA-256 hash, unique per company
     file_size = models.IntegerField(null=True, blank=True)
     source = models.CharField(max_length=20, choices=[('manual', 'Manual'), ('webscraped', 'Webscraped')])
     report_year = models.IntegerField(null=True, blank=True)
@@ -53,6 +56,11 @@ class PDFFile(models.Model):
     chunk_vector_index_path = models.CharField(max_length=512, blank=True, null=True)
     document_vector_index_path = models.CharField(max_length=255, blank=True, null=True)
     processing_status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed')], default='pending')
+    embedding_model = models.CharField(max_length=255, blank=True, null=True, help_text="Embedding model the vector indexes were built with.")
+
+    class Meta:
+        # The same report may belong to several companies; their PDFs share the vector indexes
+        unique_together = ('company', 'file_hash')
 
     def __str__(self):
         return f"{self.file.name} ({self.company.name})"
@@ -84,6 +92,10 @@ class PDFScrapeDate(models.Model):
 class PDFOriginURL(models.Model):
     pdf_file = models.ForeignKey(PDFFile, related_name='origin_urls', on_delete=models.CASCADE)
     url = models.URLField()
+    # HTTP validators of the last download, sent as conditional request headers on the next crawl
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    content_length = models.BigIntegerField(null=True, blank=True)
 
     class Meta:
         unique_together = ('pdf_file', 'url')
@@ -123,7 +135,133 @@ class EvaluationResult(models.Model):
     # Meta / LLM info
     model_version = models.CharField(max_length=255, blank=True, null=True)
     processing_time = models.FloatField(blank=True, null=True)
+    input_fingerprint = models.CharField(
+        max_length=64, blank=True, null=True, db_index=True,
+        help_text="Hash of the inputs (PDF set, query, model versions) this result was computed from."
+    )
+    job = models.ForeignKey(
+        "Job", on_delete=models.SET_NULL, null=True, blank=True, related_name='results',
+        help_text="The job that produced this result, if any."
+    )
 
     def __str__(self):
         return f"Result for query {self.query_id} on PDF {self.pdf_file_id} (chunk {self.chunk_id})"
 
+
+class EvaluationFingerprint(models.Model):
+    """
+    The input fingerprint a (company, query) pair was last evaluated with. Kept apart from the results,
+    so that pairs without any result (no processed PDFs, nothing retrieved) are skipped as well.
+    """
+    company = models.ForeignKey("CompanyProfile", on_delete=models.CASCADE, related_name='evaluation_fingerprints')
+    query = models.ForeignKey("Query", on_delete=models.CASCADE, related_name='evaluation_fingerprints')
+    input_fingerprint = models.CharField(max_length=64)
+    evaluated_at = models.DateTimeField(default=now)
+
+    class Meta:
+        unique_together = ('company', 'query')
+
+    def __str__(self):
+        return f"Fingerprint of query {self.query_id} for company {self.company_id}"
+
+
+
+class Job(models.Model):
+    """A background job (evaluation, evaluation matrix, scraping) run by a Celery task."""
+    KIND_CHOICES = [
+        ('evaluation', 'Evaluation'),
+        ('evaluation_matrix', 'Evaluation matrix'),
+        ('scrape', 'Scrape'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+    # Jobs still queued/running after this long are considered lost (e.g. the worker died)
+    STALE_AFTER = timedelta(hours=6)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    params = models.JSONField(default=dict, blank=True)
+    celery_task_id = models.CharField(max_length=255, blank=True, null=True)
+
+    # Progress counters, the unit depends on the kind (query/PDF pairs, URLs, ...)
+    total = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    results_created = models.IntegerField(default=0)
+    info = models.JSONField(default=dict, blank=True, help_text="Additional progress details, e.g. the current company.")
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.id} ({self.status})"
+
+    @classmethod
+    def active_jobs(cls, kind):
+        return cls.objects.filter(kind=kind, status__in=cls.ACTIVE_STATUSES, created_at__gte=now() - cls.STALE_AFTER)
+
+    @property
+    def is_finished(self):
+        return self.status not in self.ACTIVE_STATUSES
+
+    @property
+    def duration(self):
+        if not self.started_at:
+            return None
+        return ((self.finished_at or now()) - self.started_at).total_seconds()
+
+    # The following helpers write with .update() so that concurrent progress updates do not overwrite each other
+    def mark_running(self, total=None):
+        fields = {'status': 'running', 'started_at': now()}
+        if total is not None:
+            fields['total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def add_progress(self, done=0, skipped=0, failed=0, results_created=0, total=None, **info):
+        fields = {
+            'done': F('done') + done,
+            'skipped': F('skipped') + skipped,
+            'failed': F('failed') + failed,
+            'results_created': F('results_created') + results_created,
+        }
+        if total is not None:
+            fields['total'] = total
+        if info:
+            self.info.update(info)
+            fields['info'] = self.info
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def mark_finished(self, error=None):
+        Job.objects.filter(pk=self.pk).update(
+            status='failed' if error else 'success', error=error or '', finished_at=now()
+        )
+
+    def as_dict(self):
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'results_created': self.results_created,
+            'info': self.info,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_seconds': self.duration,
+        }
@@ -0,0 +1,67 @@
+"""
+File: web/api/persistence.py
+
+Role:
+    Bulk write path for `EvaluationResult` rows. The referenced companies, queries and PDFs of a
+    whole batch are fetched with one `in_bulk` query each and all rows are inserted with
+    `bulk_create` inside a single transaction, so persisting an evaluation costs a constant number
+    of queries instead of two per retrieved chunk.
+
+Interactions:
+    - `web/api/views.py`: `LLMRunEvaluationView` and the `batch` action of `EvaluationResultViewSet`.
+    - `web/api/tasks.py`: `run_evaluation_matrix_task` stores the results of each company with it.
+"""
+
+from typing import Any, Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CompanyProfile, EvaluationResult, PDFFile, Query
+
+# Keys of a data point (as returned by `LLMProcessor.rag_analyze`) that are copied onto the model
+RESULT_FIELDS = (
+    "timestamp", "chunk_id", "chunk_type", "answer", "report_year", "confidence", "cosine_similarity",
+    "references", "model_version", "processing_time", "input_fingerprint",
+)
+
+
+def bulk_create_evaluation_results(
+    data_points: Iterable[Dict[str, Any]],
+    batch_size: int = 500,
+    **defaults
+) -> Tuple[List[EvaluationResult], int]:
+    """
+    Creates one EvaluationResult per data point. Each data point needs `company_id`, `query_id` and
+    `pdf_id`; other model fields are taken from the data point or from `defaults`.
+
+    Data points referencing a missing company, query or PDF are skipped. Returns (created, skipped).
+    """
+    data_points = list(data_points)
+    if not data_points:
+        return [], 0
+
+    companies = CompanyProfile.objects.in_bulk({point["company_id"] for point in data_points})
+    queries = Query.objects.in_bulk({point["query_id"] for point in data_points})
+    pdf_files = PDFFile.objects.in_bulk({point["pdf_id"] for point in data_points})
+
+    timestamp = defaults.pop("timestamp", None) or timezone.now()
+    rows = []
+    for point in data_points:
+        company = companies.get(point["company_id"])
+        query = queries.get(point["query_id"])
+        pdf_file = pdf_files.get(point["pdf_id"])
+        if company is None or query is None or pdf_file is None:
+            continue  # Skip results referencing deleted objects
+
+        fields = {"timestamp": timestamp, **defaults}
+        fields.update({key: point[key] for key in RESULT_FIELDS if point.get(key) is not None})
+        if "model_version" not in fields and point.get("provider"):
+            fields["model_version"] = point["provider"]
+        fields.setdefault("answer", "")
+        fields.setdefault("references", {})
+        rows.append(EvaluationResult(company=company, query=query, pdf_file=pdf_file, **fields))
+
+    with transaction.atomic():
+        created = EvaluationResult.objects.bulk_create(rows, batch_size=batch_size)
+    return created, len(data_points) - len(rows)
@@ -0,0 +1,140 @@
+"""
+File: web/api/scraping.py
+
+Role:
+    Stores PDFs found by the scraper as `PDFFile` rows of a company. A PDF whose content hash the
+    company already has only gets a new scrape date (and origin URL); a new PDF is saved, which queues
+    it for preprocessing through the post_save signal.
+
+    The HTTP validators of each download (ETag, Last-Modified, Content-Length) are kept on its
+    `PDFOriginURL`. The next crawl sends them as a conditional request; a PDF the server reports as
+    unchanged is not downloaded again and only gets a scrape date (`record_unchanged`).
+
+    The spiders stream downloads to disk and hash them on the way, so a PDF stored here is not read again:
+    its SHA-256 and size are passed in, and the downloaded file is moved into the storage.
+
+    `store_scraped_pdfs` stores a batch of downloads with one hash lookup and bulk inserts of the scrape
+    dates and origin URLs; only new PDFs are saved one by one, as their files are moved and queued.
+
+Interactions:
+    - `web/backend/scraper_module/pipelines.py`: Stores the PDFs of a crawl while it runs.
+    - `web/api/management/commands/crawl_companies.py`: Records the PDFs a multi-company crawl found unchanged.
+"""
+
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from django.core.files import File
+
+from .models import CompanyProfile, PDFFile, PDFOriginURL, PDFScrapeDate
+
+VALIDATOR_FIELDS = ['etag', 'last_modified', 'content_length']
+
+
+class DownloadedFile(File):
+    """A file on local disk that FileSystemStorage moves into place instead of copying it."""
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def store_scraped_pdf(
+    company: CompanyProfile,
+    local_path: str,
+    file_name: str,
+    origin_url: str,
+    validators: Optional[Dict] = None,
+    sha256: Optional[str] = None,
+    size: Optional[int] = None
+) -> Tuple[PDFFile, bool]:
+    """
+    Stores the downloaded PDF at `local_path` for the company. `validators` are the response's
+    {'etag', 'last_modified', 'content_length'}; `sha256` and `size` are computed from the file if not
+    given. A new PDF's file is moved into the storage. Returns (pdf, created).
+    """
+    download = {
+        'file_path': local_path, 'file_name': file_name, 'url': origin_url,
+        'validators': validators, 'sha256': sha256, 'size': size,
+    }
+    return store_scraped_pdfs(company, [download])[0]
+
+
+def store_scraped_pdfs(company: CompanyProfile, downloads: List[Dict]) -> List[Tuple[PDFFile, bool]]:
+    """
+    Stores a batch of downloads ({'file_path', 'file_name', 'url', and optionally 'validators', 'sha256',
+    'size'}) like `store_scraped_pdf`, with one query for the known hashes and bulk inserts of the scrape
+    dates and origin URLs. Downloads with the same content are stored once. Returns [(pdf, created)] in
+    the order of `downloads`.
+    """
+    hashes = [download.get('sha256') or file_sha256(download['file_path']) for download in downloads]
+    pdfs = {pdf.file_hash: pdf for pdf in PDFFile.objects.filter(company=company, file_hash__in=set(hashes))}
+
+    results = []
+    for download, sha256 in zip(downloads, hashes):
+        pdf = pdfs.get(sha256)
+        created = pdf is None
+        if created:
+            size = download.get('size')
+            pdf = PDFFile(
+                company=company, source='webscraped', file_hash=sha256,
+                file_size=size if size is not None else os.path.getsize(download['file_path']),
+            )
+            with open(download['file_path'], 'rb') as f:
+                # saves the row, the signal queues it
+                pdf.file.save(download['file_name'], DownloadedFile(f, name=download['file_name']))
+            pdfs[sha256] = pdf
+        results.append((pdf, created))
+
+    PDFScrapeDate.objects.bulk_create([PDFScrapeDate(pdf_file=pdf) for pdf, _ in results])
+
+    # The last download of a URL has its current validators
+    origins = {(pdf.id, download['url']): download.get('validators') for (pdf, _), download in zip(results, downloads)}
+    existing = {
+        (origin.pdf_file_id, origin.url): origin
+        for origin in PDFOriginURL.objects.filter(
+            pdf_file_id__in={pdf_id for pdf_id, _ in origins}, url__in={url for _, url in origins}
+        )
+    }
+    new, changed = [], []
+    for (pdf_id, url), validators in origins.items():
+        origin = existing.get((pdf_id, url))
+        if origin is None:
+            new.append(PDFOriginURL(pdf_file_id=pdf_id, url=url, **(validators or {})))
+        elif validators:
+            for field, value in validators.items():
+                setattr(origin, field, value)
+            changed.append(origin)
+    PDFOriginURL.objects.bulk_create(new)
+    PDFOriginURL.objects.bulk_update(changed, VALIDATOR_FIELDS)
+    return results
+
+
+def known_origins(company_ids) -> Dict[int, Dict[str, Dict]]:
+    """
+    {company_id: {url: {'pdf_id', 'etag', 'last_modified', 'content_length'}}} of the URLs the companies' PDFs
+    were downloaded from. A URL that served several PDFs over time maps to the latest one.
+    """
+    origins = {company_id: {} for company_id in company_ids}
+    rows = (
+        PDFOriginURL.objects.filter(pdf_file__company_id__in=company_ids)
+        .order_by('id')
+        .values_list('pdf_file__company_id', 'pdf_file_id', 'url', 'etag', 'last_modified', 'content_length')
+    )
+    for company_id, pdf_id, url, etag, last_modified, content_length in rows.iterator():
+        origins[company_id][url] = {
+            'pdf_id': pdf_id, 'etag': etag, 'last_modified': last_modified, 'content_length': content_length,
+        }
+    return origins
+
+
+def record_unchanged(pdf_ids):
+    """Records a scrape date for PDFs whose URL still serves the same content."""
+    PDFScrapeDate.objects.bulk_create([PDFScrapeDate(pdf_file_id=pdf_id) for pdf_id in pdf_ids])
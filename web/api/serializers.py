@@ -67,6 +67,20 @@ class EvaluationResultSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class EvaluationResultBatchItemSerializer(serializers.ModelSerializer):
+    """
+    One item of a batch create. Related objects are plain ids here, they are resolved with one
+    `in_bulk` query per model by `bulk_create_evaluation_results` instead of one query per item.
+    """
+    query = serializers.IntegerField()
+    company = serializers.IntegerField()
+    pdf_file = serializers.IntegerField()
+
+    class Meta:
+        model = EvaluationResult
+        exclude = ("id",)
+
+
 class PDFFileSerializer(serializers.ModelSerializer):
     scrape_dates = PDFScrapeDateSerializer(many=True, read_only=True)
     origin_urls = PDFOriginURLSerializer(many=True, read_only=True)
@@ -75,8 +89,9 @@ class PDFFileSerializer(serializers.ModelSerializer):
         model = PDFFile
         fields = (
             "id", "company", "file", "file_hash", "file_size", "source", "active",
-            "chunk_vector_index_path", "processing_status", "scrape_dates",
-            "origin_urls", "vector",
+            "chunk_vector_index_path", "document_vector_index_path", "report_year", "embedding_model",
+            "processing_status", "scrape_dates",
+            "origin_urls",
         )
         # These fields are calculated automatically in the model's save method.
         read_only_fields = ("file_hash", "file_size")
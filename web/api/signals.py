@@ -1,14 +1,31 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from .models import PDFFile
-from backend.llm_module.pdf_preprocessor import process_and_embed_pdf_task
+from backend.llm_module.ingestion_queue import ingestion_priority
+from backend.llm_module.pdf_preprocessor import ingestion_pipeline
+from backend.llm_module.company_index import CompanyIndex
 
 @receiver(post_save, sender=PDFFile)
 def pdf_file_post_save(sender, instance, created, **kwargs):
     """
     Trigger PDF pre-processing and embedding after a new PDFFile is created.
+    Manual uploads are queued first; a company's scraped PDFs lose priority the more of them are waiting.
     """
     if created and instance.processing_status == 'pending':
-       print(f"PDFFile created (ID: {instance.id}), queuing for pre-processing.")
-       process_and_embed_pdf_task.delay(instance.id, instance.file.path)
\ No newline at end of file
+       backlog = 0
+       if instance.source == 'webscraped':
+           backlog = PDFFile.objects.filter(
+               company_id=instance.company_id, source='webscraped', processing_status='pending'
+           ).exclude(pk=instance.pk).count()
+       priority = ingestion_priority(instance.source, backlog)
+       print(f"PDFFile created (ID: {instance.id}), queuing for pre-processing with priority {priority}.")
+       ingestion_pipeline(instance.id, instance.file.path, source=instance.source, priority=priority).apply_async()
+
+
+@receiver(post_delete, sender=PDFFile)
+def pdf_file_post_delete(sender, instance, **kwargs):
+    """
+    Hide the chunks of a deleted PDF from the company index; they are dropped on the next compaction.
+    """
+    CompanyIndex(instance.company_id).deactivate_pdf(instance.id)
@@ -0,0 +1,216 @@
+"""
+Celery tasks of the api app that work directly on the Django models.
+Picked up by `app.autodiscover_tasks` in `api/celery.py`.
+
+Every task runs on behalf of a `Job` row; status, progress counters and timings are written to the job,
+so that the web process only creates the job, queues the task and reads the job back.
+"""
+
+import subprocess
+import sys
+import time
+import traceback
+
+from celery import shared_task
+from django.conf import settings
+from django.utils.timezone import now
+
+from .models import CompanyProfile, CompanyURL, EvaluationFingerprint, Job, PDFFile, Query
+from .persistence import bulk_create_evaluation_results
+from backend.llm_module.artifacts import embedding_model_name
+from backend.llm_module.evaluator import LLMEvaluator
+from backend.llm_module.llm_provider import HuggingFaceLLMProvider, SentenceTransformersEmbeddingProvider
+from backend.llm_module.processor import LLMProcessor
+
+_processor = None
+
+
+def get_processor() -> LLMProcessor:
+    """The models are loaded once per worker process, not once per task."""
+    global _processor
+    if _processor is None:
+        _processor = LLMProcessor(
+            provider=HuggingFaceLLMProvider(),
+            embedding_provider=SentenceTransformersEmbeddingProvider(model_name=embedding_model_name())
+        )
+    return _processor
+
+
+def _start_job(task, job_id, kind, params=None, total=None) -> Job:
+    """Loads the job queued by the web process, or creates one when the task is called directly."""
+    if job_id:
+        job = Job.objects.get(pk=job_id)
+    else:
+        job = Job.objects.create(kind=kind, params=params or {})
+    if task.request.id and job.celery_task_id != task.request.id:
+        Job.objects.filter(pk=job.pk).update(celery_task_id=task.request.id)
+    job.mark_running(total=total)
+    return job
+
+
+def _latest_fingerprints(company_ids):
+    """{(company_id, query_id): input_fingerprint the pair was last evaluated with}, in one query."""
+    rows = EvaluationFingerprint.objects.filter(company_id__in=company_ids).values_list(
+        'company_id', 'query_id', 'input_fingerprint'
+    )
+    return {(company_id, query_id): fingerprint for company_id, query_id, fingerprint in rows}
+
+
+def _save_fingerprints(company_id, fingerprints):
+    """Records {query_id: input_fingerprint} of the evaluated pairs of a company, whether or not they produced results."""
+    EvaluationFingerprint.objects.bulk_create(
+        [
+            EvaluationFingerprint(company_id=company_id, query_id=query_id, input_fingerprint=fingerprint, evaluated_at=now())
+            for query_id, fingerprint in fingerprints.items()
+        ],
+        update_conflicts=True, unique_fields=['company', 'query'], update_fields=['input_fingerprint', 'evaluated_at'],
+    )
+
+
+@shared_task(bind=True)
+def run_evaluation_matrix_task(
+    self, job_id: str = None, top_k: int = 5, extended_search: bool = True, force: bool = False
+):
+    """
+    Evaluates every active company against every active query and stores one EvaluationResult per
+    retrieved chunk. Pairs whose input fingerprint matches the one they were last evaluated with are
+    skipped unless `force` is set. Progress is counted in (company, query) pairs on the job.
+    """
+    job = _start_job(self, job_id, 'evaluation_matrix', {'top_k': top_k, 'extended_search': extended_search, 'force': force})
+    started = time.perf_counter()
+    try:
+        processor = get_processor()
+        evaluator = LLMEvaluator(processor, top_k=top_k, extended_search=extended_search)
+
+        company_ids = list(CompanyProfile.objects.filter(active=True).values_list('id', flat=True))
+        queries = list(Query.objects.filter(active=True))
+        pairs = evaluator.plan(company_ids, queries)
+        job.add_progress(total=len(pairs))
+        if not pairs:
+            job.mark_finished()
+            return str(job.id)
+
+        pdfs_by_company = {}
+        pdf_files = PDFFile.objects.filter(
+            company_id__in=company_ids, active=True, processing_status='success'
+        ).exclude(chunk_vector_index_path=None)
+        for pdf_file in pdf_files:
+            pdfs_by_company.setdefault(pdf_file.company_id, []).append(pdf_file)
+
+        latest_fingerprints = {} if force else _latest_fingerprints(company_ids)
+        llm_model = evaluator.model_versions()["llm_model"]
+
+        # One embedding call for the whole matrix
+        query_matrix = processor.embed_queries(queries)
+
+        evaluated = 0
+        for company_id in company_ids:
+            company_pdfs = pdfs_by_company.get(company_id, [])
+            fingerprints = {query.id: evaluator.input_fingerprint(query, company_pdfs) for query in queries}
+            stale = [
+                i for i, query in enumerate(queries)
+                if latest_fingerprints.get((company_id, query.id)) != fingerprints[query.id]
+            ]
+            if not stale:
+                job.add_progress(done=len(queries), skipped=len(queries))
+                continue
+
+            job.add_progress(current_company=company_id)
+            # Results are stored per PDF, so they show up in the job stream before the company is done
+            for pdf_file, pdf_results in evaluator.iter_evaluate_company(
+                company_id, [queries[i] for i in stale], company_pdfs, query_matrix=query_matrix[stale]
+            ):
+                data_points = [
+                    {**chunk, "input_fingerprint": fingerprints[query_id]}
+                    for query_id, chunks in pdf_results.items()
+                    for chunk in chunks
+                ]
+                created, _ = bulk_create_evaluation_results(data_points, model_version=llm_model, job=job)
+                job.add_progress(results_created=len(created), current_pdf=pdf_file.id)
+            _save_fingerprints(company_id, {queries[i].id: fingerprints[queries[i].id] for i in stale})
+
+            evaluated += len(stale)
+            elapsed = time.perf_counter() - started
+            job.add_progress(
+                done=len(queries),
+                skipped=len(queries) - len(stale),
+                # Rate of actually evaluated pairs, skipped ones cost (almost) nothing
+                pairs_per_sec=round(evaluated / elapsed, 2) if elapsed > 0 else None,
+            )
+
+        job.add_progress(current_company=None, current_pdf=None)
+        job.mark_finished()
+        job.refresh_from_db()
+        print(f"Evaluation matrix finished: {job.done} pairs ({job.skipped} unchanged, skipped), "
+              f"{job.results_created} results, {job.info.get('pairs_per_sec')} pairs/s.")
+        return str(job.id)
+    except Exception as e:
+        traceback.print_exc()
+        job.mark_finished(error=str(e))
+        raise
+
+
+@shared_task(bind=True)
+def run_llm_evaluation_task(
+    self,
+    job_id: str,
+    company_id: int,
+    query_id: int,
+    query: str,
+    top_k: int = 5,
+    filter_by_document_level_index: bool = True,
+    extended_search: bool = True
+):
+    """
+    Runs the RAG pipeline for one company and query (formerly done inside the HTTP request).
+    Progress is counted in PDFs; the results of each PDF are stored as soon as it is done.
+    """
+    pdf_files = list(PDFFile.objects.filter(company_id=company_id, active=True))
+    job = _start_job(self, job_id, 'evaluation', total=len(pdf_files))
+    try:
+        for pdf_file, data_points in get_processor().iter_rag_analyze_by_pdf(
+            company_id=company_id,
+            query_id=query_id,
+            query_text=query,
+            pdf_files=pdf_files,
+            top_k=top_k,
+            filter_by_document_level_index=filter_by_document_level_index,
+            extended_search=extended_search
+        ):
+            created, skipped = bulk_create_evaluation_results(data_points, job=job)
+            job.add_progress(done=1, results_created=len(created), failed=skipped)
+        job.mark_finished()
+        return str(job.id)
+    except Exception as e:
+        traceback.print_exc()
+        job.mark_finished(error=str(e))
+        raise
+
+
+@shared_task(bind=True)
+def run_scraping_task(self, job_id: str = None):
+    """
+    Crawls all active URLs of all active companies in one crawl (`crawl_companies` command). Progress is
+    counted in companies. The command runs in a child process: the Twisted reactor of a crawl cannot be
+    restarted, so a second crawl in this worker process would never start.
+    """
+    company_ids = set(
+        CompanyURL.objects.filter(active=True, company__active=True).values_list('company_id', flat=True)
+    )
+    job = _start_job(self, job_id, 'scrape', total=len(company_ids))
+    try:
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'crawl_companies', '--job_id', str(job.id)],
+            cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"crawl_companies exited with code {result.returncode}")
+
+        job.add_progress(current_company=None)
+        job.mark_finished()
+        print("Scraping abgeschlossen.")
+        return str(job.id)
+    except Exception as e:
+        traceback.print_exc()
+        job.mark_finished(error=str(e))
+        raise
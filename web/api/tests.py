@@ -1,3 +1,1481 @@
-from django.test import TestCase
+import hashlib
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import tasks
+from api.celery import start_metrics_server
+from api.management.commands import reindex_pdfs
+from api.management.commands.reindex_pdfs import ReindexCheckpoint
+from api.models import CompanyProfile, EvaluationResult, Job, PDFFile, PDFOriginURL, Query
+from api.persistence import bulk_create_evaluation_results
+from api.scraping import known_origins, record_unchanged, store_scraped_pdf
+from api.views import JobStreamView
+from backend.llm_module import artifacts, pdf_preprocessor
+from backend.llm_module.company_index import (
+    CompanyIndex, acquire_company_index_lock, compact_vector_indexes_task, release_company_index_lock,
+)
+from backend.llm_module.parser import PDFParser
+from backend.llm_module.pdf_store import APIPDFStore
+from backend.llm_module.utils import get_api_client
+from core.profiling import ProfilingMiddleware, profiled, task_profile_name
+from backend.llm_module import ingestion_queue, metrics
+from backend.llm_module.evaluator import LLMEvaluator
+from backend.llm_module.llm_provider import LLMProviderInterface
+from backend.llm_module.processor import LLMProcessor
+from backend.llm_module.vector_store import (
+    FLAT_INDEX_MAX_VECTORS, HNSW_INDEX_MAX_VECTORS, ChunkVectorStore, choose_index_type, meta_path_for,
+)
+from backend.scraper_module.crawl_state import CrawlState
+from backend.scraper_module.link_scorer import link_priority, score_link
+from backend.scraper_module.pipelines import PdfStoragePipeline
+
+
+def make_chunk_store(n=600, dim=16, index_type=None, seed=0):
+    """Builds a store with unit vectors and a mix of chunk types, years and source PDFs."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metas = [
+        {
+            'chunk_id': f'chunk-{i}',
+            'chunk_type': 'table_column' if i % 10 == 0 else 'text',
+            'year': 2020 + (i // 10) % 4 if i % 10 == 0 else None,  # every year among the table columns
+            'source_pdf_id': i % 3 + 1,
+        }
+        for i in range(n)
+    ]
+    store = ChunkVectorStore(dim=dim, index_type=index_type)
+    store.add_chunk_vectors(vectors, metas)
+    return store, vectors, metas, rng
+
+
+def brute_force_top_k(vectors, metas, query, k, predicate):
+    candidates = [i for i, meta in enumerate(metas) if predicate(meta)]
+    distances = ((vectors[candidates] - query) ** 2).sum(axis=1)
+    return [metas[candidates[j]]['chunk_id'] for j in np.argsort(distances)[:k]]
+
+
+class ChunkVectorStoreFilteredSearchTests(SimpleTestCase):
+    def test_filter_returns_true_top_k_among_matching_chunks(self):
+        store, vectors, metas, rng = make_chunk_store()
+        query = rng.standard_normal(16).astype('float32')
+
+        results = store.search(query, top_k=5, chunk_types=['table_column'])
+
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(meta['chunk_type'] == 'table_column' for meta, _ in results))
+        expected = brute_force_top_k(vectors, metas, query, 5, lambda m: m['chunk_type'] == 'table_column')
+        self.assertEqual([meta['chunk_id'] for meta, _ in results], expected)
+
+    def test_filter_does_not_shrink_result_set_like_post_filtering(self):
+        store, _, _, rng = make_chunk_store()
+        query = rng.standard_normal(16).astype('float32')
+
+        post_filtered = [m for m, _ in store.search(query, top_k=5) if m['chunk_type'] == 'table_column']
+        pushed_down = store.search(query, top_k=5, chunk_types=['table_column'])
+
+        self.assertLess(len(post_filtered), 5)
+        self.assertEqual(len(pushed_down), 5)
+
+    def test_combined_year_and_pdf_filters(self):
+        store, vectors, metas, rng = make_chunk_store()
+        query = rng.standard_normal(16).astype('float32')
+
+        results = store.search(query, top_k=3, years=[2021], pdf_ids=[2])
+
+        def matches(meta):
+            return meta['year'] == 2021 and meta['source_pdf_id'] == 2
+
+        self.assertTrue(results)
+        self.assertTrue(all(matches(meta) for meta, _ in results))
+        self.assertEqual([m['chunk_id'] for m, _ in results], brute_force_top_k(vectors, metas, query, 3, matches))
+
+    def test_filter_without_matches_returns_empty_list(self):
+        store, _, _, rng = make_chunk_store()
+        self.assertEqual(store.search(rng.standard_normal(16), top_k=5, pdf_ids=[99]), [])
+
+    def test_filtered_search_on_approximate_indexes(self):
+        for index_type in ('hnsw', 'ivf'):
+            with self.subTest(index_type=index_type):
+                store, vectors, metas, rng = make_chunk_store(n=2000, index_type=index_type)
+                query = vectors[30] + 0.01 * rng.standard_normal(16).astype('float32')
+
+                results = store.search(query, top_k=3, chunk_types=['table_column'])
+
+                self.assertEqual(store.index_params['index_type'], index_type)
+                self.assertEqual(results[0][0]['chunk_id'], 'chunk-30')
+                self.assertTrue(all(meta['chunk_type'] == 'table_column' for meta, _ in results))
+
+
+class VectorIndexTypeTests(SimpleTestCase):
+    def test_index_type_follows_size_thresholds(self):
+        self.assertEqual(choose_index_type(0), 'flat')
+        self.assertEqual(choose_index_type(FLAT_INDEX_MAX_VECTORS), 'flat')
+        self.assertEqual(choose_index_type(FLAT_INDEX_MAX_VECTORS + 1), 'hnsw')
+        self.assertEqual(choose_index_type(HNSW_INDEX_MAX_VECTORS), 'hnsw')
+        self.assertEqual(choose_index_type(HNSW_INDEX_MAX_VECTORS + 1), 'ivf')
+
+    def test_approximate_indexes_round_trip_through_save_and_load(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for index_type in ('hnsw', 'ivf'):
+            with self.subTest(index_type=index_type):
+                store, vectors, _, rng = make_chunk_store(n=2000, index_type=index_type)
+                queries = vectors[:5] + 0.01 * rng.standard_normal((5, 16)).astype('float32')
+                index_path = os.path.join(tmp.name, f'{index_type}.faiss')
+                store.save_index(index_path, meta_path_for(index_path))
+
+                loaded = ChunkVectorStore(dim=16, index_path=index_path, meta_path=meta_path_for(index_path))
+
+                self.assertEqual(loaded.index_params, store.index_params)
+                for query in queries:
+                    self.assertEqual(
+                        [meta['chunk_id'] for meta, _ in loaded.search(query, top_k=5)],
+                        [meta['chunk_id'] for meta, _ in store.search(query, top_k=5)],
+                    )
+
+    def test_benchmark_reports_every_index_type(self):
+        out = StringIO()
+        call_command('benchmark_vector_index', vectors=1000, dim=16, queries=10, k=5, stdout=out)
+        rows = [line.split()[0] for line in out.getvalue().splitlines()[2:]]
+        self.assertEqual(rows, ['flat', 'hnsw', 'ivf'])
+
+
+class ChunkVectorStoreMutationTests(SimpleTestCase):
+    def test_removed_ids_are_skipped_until_restored(self):
+        store, vectors, _, _ = make_chunk_store(n=50)
+
+        store.remove_ids([7])
+        self.assertNotIn('chunk-7', [m['chunk_id'] for m, _ in store.search(vectors[7], top_k=3)])
+
+        store.restore_ids([7])
+        self.assertEqual(store.search(vectors[7], top_k=1)[0][0]['chunk_id'], 'chunk-7')
+
+    def test_compact_drops_tombstoned_vectors_and_keeps_ids(self):
+        store, vectors, _, _ = make_chunk_store(n=50)
+        store.remove_ids(range(10, 20))
+
+        self.assertEqual(store.compact(), 10)
+
+        self.assertEqual(store.index.ntotal, 40)
+        self.assertEqual(len(store.deleted_ids()), 0)
+        self.assertEqual(store.search(vectors[30], top_k=1)[0][0]['chunk_id'], 'chunk-30')
+
+    def test_tombstones_appended_elsewhere_are_visible_to_loaded_store(self):
+        store, vectors, _, _ = make_chunk_store(n=50)
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = os.path.join(tmp, 'company_1.faiss')
+            store.save_index(index_path, meta_path_for(index_path))
+            loaded = ChunkVectorStore(dim=16, index_path=index_path, meta_path=meta_path_for(index_path))
+
+            # e.g. the web process deactivating a PDF while a worker holds the index in memory
+            ChunkVectorStore(dim=16, index_path=index_path, meta_path=meta_path_for(index_path)).remove_range(0, 25)
+
+            results = loaded.search(vectors[3], top_k=5)
+            self.assertTrue(all(int(m['chunk_id'].split('-')[1]) >= 25 for m, _ in results))
+
+
+class LLMProcessorRetrievalPoolTests(SimpleTestCase):
+    def test_pooled_map_keeps_input_order(self):
+        def slow_identity(pdf_id):
+            time.sleep(0.001 * (10 - pdf_id))  # later PDFs finish first
+            return pdf_id
+
+        pdf_ids = list(range(10))
+        self.assertEqual(LLMProcessor._map_pdfs(slow_identity, pdf_ids, max_workers=4), pdf_ids)
+        self.assertEqual(LLMProcessor._map_pdfs(slow_identity, pdf_ids, max_workers=1), pdf_ids)
+
+    def test_streamed_results_match_rag_analyze(self):
+        stores = {f'pdf_{i}.faiss': make_chunk_store(n=40, seed=i)[0] for i in range(4)}
+
+        class InMemoryProcessor(LLMProcessor):
+            def _load_chunk_store(self, index_path):
+                return stores[index_path]
+
+        processor = InMemoryProcessor(
+            embedding_provider=SimpleNamespace(encode=lambda texts: np.ones((len(texts), 16), dtype='float32') / 4),
+            retrieval_workers=3,
+        )
+        pdfs = [
+            SimpleNamespace(id=i, company_id=1, chunk_vector_index_path=f'pdf_{i}.faiss', report_year=2023, file_name=None)
+            for i in range(4)
+        ]
+
+        by_pdf = list(processor.iter_rag_analyze_by_pdf(1, 7, 'Scope 1', pdfs, top_k=2))
+
+        self.assertEqual([pdf.id for pdf, _ in by_pdf], [0, 1, 2, 3])
+        self.assertEqual(
+            [point for _, points in by_pdf for point in points],
+            processor.rag_analyze(1, 7, 'Scope 1', pdfs, top_k=2),
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'company-index-tests'}})
+class CompanyIndexRetrievalTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        stores = {f'pdf_{i}.faiss': make_chunk_store(n=40, seed=i)[0] for i in (1, 2, 3)}
+
+        class InMemoryProcessor(LLMProcessor):
+            def _load_chunk_store(self, index_path):
+                return stores[index_path]
+
+        self.processor = InMemoryProcessor(embedding_provider=SimpleNamespace(encode=None))
+        self.pdfs = [
+            SimpleNamespace(id=i, company_id=1, chunk_vector_index_path=f'pdf_{i}.faiss', report_year=2023, file_name=None)
+            for i in (1, 2, 3)
+        ]
+        # PDF 3 is not in the company index yet
+        company_index = CompanyIndex(1, dim=16)
+        for pdf in self.pdfs[:2]:
+            company_index.add_pdf(pdf.id, stores[pdf.chunk_vector_index_path], np.ones(16, dtype='float32') / 4)
+        self.queries = [SimpleNamespace(id=7), SimpleNamespace(id=8)]
+        self.query_matrix = np.random.default_rng(5).standard_normal((2, 16)).astype('float32')
+
+    def retrieve(self, **kwargs):
+        return self.processor.batch_retrieve(
+            self.queries, self.pdfs, top_k=3, extended_search=True, query_matrix=self.query_matrix, **kwargs
+        )
+
+    def test_company_index_returns_the_per_pdf_hits(self):
+        via_company, per_pdf = self.retrieve(), self.retrieve(use_company_index=False)
+
+        self.assertEqual(set(via_company), {(q, p) for q in (7, 8) for p in (1, 2, 3)})
+        self.assertEqual(set(via_company), set(per_pdf))
+        for key, hits in per_pdf.items():
+            self.assertEqual([m['chunk_id'] for m, _ in via_company[key]], [m['chunk_id'] for m, _ in hits])
+            np.testing.assert_allclose([s for _, s in via_company[key]], [s for _, s in hits], rtol=1e-5)
+
+    def test_deactivated_pdf_yields_nothing(self):
+        CompanyIndex(1).deactivate_pdf(2)
+
+        results = self.retrieve()
+
+        self.assertEqual(results[(7, 2)], [])
+        self.assertEqual(len(results[(7, 1)]), 3)
+
+    def test_lock_is_exclusive_per_company(self):
+        token = acquire_company_index_lock(1)
+
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_company_index_lock(1))
+        self.assertIsNotNone(acquire_company_index_lock(2))
+        release_company_index_lock(1, 'someone else')
+        self.assertIsNone(acquire_company_index_lock(1))
+        release_company_index_lock(1, token)
+        self.assertIsNotNone(acquire_company_index_lock(1))
+
+    def test_compaction_skips_a_locked_company_index(self):
+        CompanyIndex(1).deactivate_pdf(1)
+        token = acquire_company_index_lock(1)
+
+        compact_vector_indexes_task()
+        self.assertEqual(CompanyIndex(1).chunk_store.index.ntotal, 80)
+
+        release_company_index_lock(1, token)
+        compact_vector_indexes_task()
+        self.assertEqual(CompanyIndex(1).chunk_store.index.ntotal, 40)
+
+
+class BatchRetrieveTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp.name)  # no company indexes unless a test adds them
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.stores = {f'pdf_{i}.faiss': make_chunk_store(n=200, seed=i)[0] for i in (1, 2, 3)}
+        stores = self.stores
+
+        class InMemoryProcessor(LLMProcessor):
+            def _load_chunk_store(self, index_path):
+                return stores[index_path]
+
+        def encode(texts):
+            # A fixed random vector per text
+            seeds = [int(hashlib.sha256(text.encode()).hexdigest()[:8], 16) for text in texts]
+            return np.stack([np.random.default_rng(seed).standard_normal(16) for seed in seeds]).astype('float32')
+
+        self.processor = InMemoryProcessor(embedding_provider=SimpleNamespace(encode=encode))
+        self.pdfs = [
+            SimpleNamespace(id=i, company_id=1, chunk_vector_index_path=f'pdf_{i}.faiss', report_year=2023, file_name=None)
+            for i in (1, 2, 3)
+        ]
+        self.queries = [
+            SimpleNamespace(id=q, question=question, enriched_text='')
+            for q, question in enumerate(['Scope 1 emissions?', 'Water withdrawal?', 'Share of women in management?'])
+        ]
+
+    def assert_batch_matches_per_query(self, **kwargs):
+        batched = self.processor.batch_retrieve(self.queries, self.pdfs, top_k=4, **kwargs)
+
+        for query in self.queries:
+            points = self.processor.rag_analyze(1, query.id, query.question, self.pdfs, top_k=4)
+            for pdf in self.pdfs:
+                expected = [p for p in points if p['pdf_id'] == pdf.id]
+                hits = batched[(query.id, pdf.id)]
+                self.assertEqual([m['chunk_id'] for m, _ in hits], [p['chunk_id'] for p in expected])
+                np.testing.assert_allclose([s for _, s in hits], [p['cosine_similarity'] for p in expected], rtol=1e-5)
+
+    def test_batch_retrieve_matches_per_query_retrieval(self):
+        self.assert_batch_matches_per_query(use_company_index=False)
+
+    def test_batch_retrieve_matches_per_query_retrieval_in_company_index(self):
+        company_index = CompanyIndex(1, dim=16)
+        for pdf in self.pdfs:
+            company_index.add_pdf(pdf.id, self.stores[pdf.chunk_vector_index_path], np.ones(16, dtype='float32') / 4)
+
+        self.assert_batch_matches_per_query()
+
+
+class InputFingerprintTests(SimpleTestCase):
+    def setUp(self):
+        self.evaluator = LLMEvaluator(LLMProcessor(embedding_provider=SimpleNamespace(model_name='all-MiniLM-L6-v2')))
+        self.query = SimpleNamespace(id=1, question='Scope 1 emissions?', enriched_text='', last_edited=None)
+        self.pdfs = [SimpleNamespace(id=1, file_hash='a'), SimpleNamespace(id=2, file_hash='b')]
+
+    def test_fingerprint_ignores_pdf_order(self):
+        self.assertEqual(
+            self.evaluator.input_fingerprint(self.query, self.pdfs),
+            self.evaluator.input_fingerprint(self.query, self.pdfs[::-1]),
+        )
+
+    def test_fingerprint_changes_with_inputs(self):
+        fingerprint = self.evaluator.input_fingerprint(self.query, self.pdfs)
+        changed_pdf = [self.pdfs[0], SimpleNamespace(id=2, file_hash='c')]
+        changed_query = SimpleNamespace(**{**vars(self.query), 'enriched_text': 'Scope 1 GHG emissions in t CO2e'})
+
+        self.assertNotEqual(fingerprint, self.evaluator.input_fingerprint(self.query, changed_pdf))
+        self.assertNotEqual(fingerprint, self.evaluator.input_fingerprint(self.query, self.pdfs[:1]))
+        self.assertNotEqual(fingerprint, self.evaluator.input_fingerprint(changed_query, self.pdfs))
+
+
+class EvaluationFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyProfile.objects.create(name='ACME')
+        cls.query = Query.objects.create(name='Scope 1', question='Scope 1 emissions?')
+        # Not 'pending', so that the post_save signal does not queue the preprocessing task
+        cls.pdfs = [
+            PDFFile.objects.create(
+                company=cls.company, file=f'pdfs/report_{i}.pdf', file_hash=f'{i:064x}', file_size=1,
+                processing_status='success',
+            )
+            for i in range(3)
+        ]
+
+    def data_points(self, n):
+        return [
+            {
+                'company_id': self.company.id, 'query_id': self.query.id, 'pdf_id': self.pdfs[i % 3].id,
+                'chunk_id': f'chunk-{i}', 'chunk_type': 'text', 'answer': 'x', 'cosine_similarity': 0.5,
+            }
+            for i in range(n)
+        ]
+
+
+class BulkEvaluationResultTests(EvaluationFixtureMixin, TestCase):
+    def test_query_count_does_not_grow_with_results(self):
+        # 3 in_bulk lookups + SAVEPOINT, INSERT, RELEASE of the transaction
+        with self.assertNumQueries(6):
+            created, skipped = bulk_create_evaluation_results(self.data_points(30))
+
+        self.assertEqual((len(created), skipped), (30, 0))
+        self.assertEqual(EvaluationResult.objects.filter(company=self.company).count(), 30)
+
+    def test_results_for_missing_pdfs_are_skipped(self):
+        points = self.data_points(2)
+        points[1]['pdf_id'] = 10_000
+
+        created, skipped = bulk_create_evaluation_results(points)
+
+        self.assertEqual((len(created), skipped), (1, 1))
+
+
+class JobStreamTests(EvaluationFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=User.objects.create_user('stream-reader'))
+
+    def read_stream(self, job, after=None):
+        url = reverse('job_stream', args=[job.id]) + (f'?after={after}' if after is not None else '')
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_stream_requires_a_token(self):
+        job = Job.objects.create(kind='evaluation')
+        self.assertEqual(self.client.get(reverse('job_stream', args=[job.id])).status_code, 401)
+
+    def test_status_requires_a_token(self):
+        job = Job.objects.create(kind='evaluation')
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).status_code, 401)
+
+    def test_stream_ends_with_a_reconnect_line_and_resumes_after_it(self):
+        job = Job.objects.create(kind='evaluation')
+        job.mark_running(total=2)
+        created, _ = bulk_create_evaluation_results(self.data_points(3), job=job)
+        max_duration, JobStreamView.max_duration = JobStreamView.max_duration, 0
+        try:
+            lines = self.read_stream(job)
+        finally:
+            JobStreamView.max_duration = max_duration
+
+        self.assertEqual([line['type'] for line in lines], ['result'] * 3 + ['job', 'reconnect'])
+        self.assertEqual(lines[-1]['after'], created[-1].id)
+        bulk_create_evaluation_results(self.data_points(1), job=job)
+        job.mark_finished()
+        resumed = self.read_stream(job, after=lines[-1]['after'])
+        self.assertEqual([line['type'] for line in resumed], ['result', 'job'])
+        self.assertEqual(resumed[-1]['job']['status'], 'success')
+
+    def test_stream_of_finished_job_contains_results_and_final_state(self):
+        job = Job.objects.create(kind='evaluation')
+        job.mark_running(total=1)
+        bulk_create_evaluation_results(self.data_points(3), job=job)
+        job.add_progress(done=1, results_created=3)
+        job.mark_finished()
+
+        lines = self.read_stream(job)
+
+        self.assertEqual([line['type'] for line in lines], ['result'] * 3 + ['job'])
+        self.assertEqual([line['result']['chunk_id'] for line in lines[:3]], ['chunk-0', 'chunk-1', 'chunk-2'])
+        self.assertEqual(lines[-1]['job']['status'], 'success')
+        self.assertEqual(lines[-1]['job']['results_created'], 3)
+
+    def test_status_endpoints_report_active_jobs(self):
+        job = Job.objects.create(kind='evaluation_matrix')
+        self.assertTrue(self.client.get(reverse('reevaluate_status')).json()['running'])
+
+        job.mark_finished(error='boom')
+        self.assertFalse(self.client.get(reverse('reevaluate_status')).json()['running'])
+        status_response = self.client.get(reverse('job_status', args=[job.id]), HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(status_response.json()['status'], 'failed')
+
+
+class YearEchoProvider(LLMProviderInterface):
+    """Answers a report year prompt with the year in its text; records the size of every batch."""
+    model_name = 'year-echo'
+
+    def __init__(self):
+        self.batches = []
+
+    def generate(self, prompt, **kwargs):
+        match = re.search(r'Report (\d{4})', prompt)
+        return {'text': match.group(1) if match else 'None', 'confidence': 1.0}
+
+    def generate_batch(self, prompts, **kwargs):
+        self.batches.append(len(prompts))
+        return [self.generate(prompt) for prompt in prompts]
+
+
+class EvaluationMatrixTaskTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp.name)  # no company indexes
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.queries = [Query.objects.create(name=f'Q{i}', question=f'Question {i}?') for i in range(2)]
+        self.pdfs = []
+        for name, n_pdfs in (('ACME', 2), ('Globex', 1)):
+            company = CompanyProfile.objects.create(name=name)
+            for _ in range(n_pdfs):
+                pdf = PDFFile.objects.create(
+                    company=company, file=f'pdfs/{name}_{len(self.pdfs)}.pdf', file_hash=f'{len(self.pdfs):064x}',
+                    file_size=1, processing_status='success',
+                )
+                pdf.chunk_vector_index_path = f'pdf_{pdf.id}.faiss'
+                pdf.save()
+                self.pdfs.append(pdf)
+
+        # Every PDF holds one text chunk per query, the answer to query i lies along axis i
+        stores = {}
+        for pdf in self.pdfs:
+            store = ChunkVectorStore(dim=4)
+            store.add_chunk_vectors(np.eye(4, dtype='float32')[:3], [
+                {'chunk_id': f'pdf{pdf.id}-q{i}', 'chunk_type': 'text', 'text': f'Report {self.year(pdf, i)}'}
+                for i in range(3)  # the third chunk answers no query
+            ])
+            stores[pdf.chunk_vector_index_path] = store
+
+        class InMemoryProcessor(LLMProcessor):
+            def _load_chunk_store(self, index_path):
+                return stores[index_path]
+
+        axes = {query.question: np.eye(4, dtype='float32')[i] for i, query in enumerate(self.queries)}
+        self.llm = YearEchoProvider()
+        processor = InMemoryProcessor(
+            provider=self.llm,
+            embedding_provider=SimpleNamespace(encode=lambda texts: np.stack([axes[text] for text in texts])),
+        )
+        previous, tasks._processor = tasks._processor, processor
+        self.addCleanup(setattr, tasks, '_processor', previous)
+
+    @staticmethod
+    def year(pdf, query_index):
+        return 2000 + 2 * pdf.id + query_index
+
+    def test_batched_answers_are_stored_with_their_company_and_query(self):
+        job = Job.objects.get(pk=tasks.run_evaluation_matrix_task(top_k=1))
+
+        self.assertEqual(job.status, 'success')
+        self.assertEqual((job.done, job.results_created), (4, 6))
+        # One batched LLM call per PDF, holding the chunks of both queries
+        self.assertEqual(self.llm.batches, [2, 2, 2])
+        results = EvaluationResult.objects.select_related('pdf_file')
+        self.assertEqual({(r.company_id, r.query_id, r.pdf_file_id) for r in results}, {
+            (pdf.company_id, query.id, pdf.id) for pdf in self.pdfs for query in self.queries
+        })
+        for result in results:
+            query_index = self.queries.index(result.query)
+            self.assertEqual(result.pdf_file.company_id, result.company_id)
+            self.assertEqual(result.chunk_id, f'pdf{result.pdf_file_id}-q{query_index}')
+            self.assertEqual(result.report_year, self.year(result.pdf_file, query_index))
+
+    def test_rerun_skips_unchanged_pairs(self):
+        tasks.run_evaluation_matrix_task(top_k=1)
+
+        job = Job.objects.get(pk=tasks.run_evaluation_matrix_task(top_k=1))
+
+        self.assertEqual((job.done, job.skipped, job.results_created), (4, 4, 0))
+
+    def test_rerun_skips_pairs_without_results(self):
+        CompanyProfile.objects.create(name='Initech')  # no processed PDFs, nothing to retrieve
+        first = Job.objects.get(pk=tasks.run_evaluation_matrix_task(top_k=1))
+        self.assertEqual((first.done, first.skipped, first.results_created), (6, 0, 6))
+
+        job = Job.objects.get(pk=tasks.run_evaluation_matrix_task(top_k=1))
+
+        self.assertEqual((job.done, job.skipped, job.results_created), (6, 6, 0))
+
+    def test_latest_fingerprints_reads_the_last_evaluation_per_pair_in_one_query(self):
+        acme, globex = self.pdfs[0].company_id, self.pdfs[2].company_id
+        for generation in range(3):
+            for company_id in (acme, globex):
+                tasks._save_fingerprints(company_id, {query.id: f'{company_id}-{query.id}-{generation}' for query in self.queries})
+
+        with self.assertNumQueries(1):
+            latest = tasks._latest_fingerprints([acme, globex])
+
+        self.assertEqual(latest, {
+            (company_id, query.id): f'{company_id}-{query.id}-2' for company_id in (acme, globex) for query in self.queries
+        })
+
+
+class TestClientSession:
+    """The part of the requests.Session API that APIPDFStore uses, answered by DRF's test client."""
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, url):
+        return self.wrap(self.client.get(url))
+
+    def patch(self, url, json=None):
+        return self.wrap(self.client.patch(url, json, format='json'))
+
+    @staticmethod
+    def wrap(response):
+        response.text = response.content.decode()
+        return response
+
+
+class APIPDFStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyProfile.objects.create(name='ACME')
+        cls.pdfs = [
+            PDFFile.objects.create(
+                company=cls.company, file=f'pdfs/report_{i}.pdf', file_hash=f'{i:064x}', file_size=1,
+                processing_status='success',
+            )
+            for i in range(2)
+        ]
+        cls.token = Token.objects.create(user=User.objects.create_user('worker'))
+
+    def setUp(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.store = APIPDFStore(api_client=TestClientSession(client))
+
+    def test_get_file_hash(self):
+        self.assertEqual(self.store.get_file_hash(self.pdfs[1].id), f'{1:064x}')
+        self.assertIsNone(self.store.get_file_hash(10_000))
+
+    def test_update_writes_the_fields(self):
+        self.assertTrue(self.store.update(self.pdfs[0].id, processing_status='failed', report_year=2023))
+        self.assertFalse(self.store.update(10_000, processing_status='failed'))
+
+        self.pdfs[0].refresh_from_db()
+        self.assertEqual((self.pdfs[0].processing_status, self.pdfs[0].report_year), ('failed', 2023))
+
+    def test_update_many_writes_all_pdfs_in_one_request(self):
+        updated = self.store.update_many({
+            self.pdfs[0].id: {'chunk_vector_index_path': 'vector_indexes/a.faiss', 'embedding_model': 'm'},
+            self.pdfs[1].id: {'processing_status': 'failed'},
+        })
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            list(PDFFile.objects.order_by('id').values_list('chunk_vector_index_path', 'embedding_model', 'processing_status')),
+            [('vector_indexes/a.faiss', 'm', 'success'), (None, None, 'failed')],
+        )
+
+    def test_update_many_rejects_fields_the_worker_may_not_set(self):
+        self.assertEqual(self.store.update_many({self.pdfs[0].id: {'file_hash': 'x'}}), 0)
+        self.assertEqual(self.store.update_many({}), 0)
+        self.pdfs[0].refresh_from_db()
+        self.assertEqual(self.pdfs[0].file_hash, f'{0:064x}')
+
+    def test_api_client_retries_only_idempotent_methods(self):
+        retry = get_api_client().get_adapter('http://localhost/').max_retries
+
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('PATCH', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IngestionArtifactTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_manifest_is_found_only_while_its_index_files_exist(self):
+        fields = {'chunk_vector_index_path': 'vector_indexes/abc.m.faiss', 'document_vector_index_path': None}
+        index_file = os.path.join(self.media_root, fields['chunk_vector_index_path'])
+        os.makedirs(os.path.dirname(index_file))
+        open(index_file, 'wb').close()
+
+        artifacts.record_artifacts('abc', 'org/model', pdf_id=1, n_chunks=10, fields=fields)
+        self.assertEqual(artifacts.find_artifacts('abc', 'org/model')['built_for_pdf_id'], 1)
+        self.assertIsNone(artifacts.find_artifacts('abc', 'other-model'))
+
+        os.remove(index_file)
+        self.assertIsNone(artifacts.find_artifacts('abc', 'org/model'))
+
+    def test_ingestion_lock_is_exclusive_per_hash_and_model(self):
+        token = artifacts.acquire_ingestion_lock('abc', 'model')
+        self.assertIsNotNone(token)
+        self.assertIsNone(artifacts.acquire_ingestion_lock('abc', 'model'))
+        self.assertIsNotNone(artifacts.acquire_ingestion_lock('abc', 'other-model'))
+
+        artifacts.release_ingestion_lock('abc', 'model', 'stale-token')
+        self.assertIsNone(artifacts.acquire_ingestion_lock('abc', 'model'))
+        artifacts.release_ingestion_lock('abc', 'model', token)
+        self.assertIsNotNone(artifacts.acquire_ingestion_lock('abc', 'model'))
+
+
+class ReindexCheckpointTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'reindex.json')
+        self.selection = {'company_id': [1, 2], 'status': None, 'rebuild': True, 'model': 'm'}
+
+    def test_resumes_with_done_pdfs_of_the_same_selection(self):
+        checkpoint = ReindexCheckpoint.load(self.path, self.selection)
+        checkpoint.mark([1, 2], ok=True)
+        checkpoint.mark([3], ok=False)
+
+        resumed = ReindexCheckpoint.load(self.path, dict(self.selection))
+        self.assertEqual(resumed.done, {1, 2})
+        self.assertEqual(resumed.failed, {3})
+        self.assertEqual(resumed.started_at, checkpoint.started_at)
+
+        resumed.mark([3], ok=True)
+        self.assertEqual(ReindexCheckpoint.load(self.path, self.selection).failed, set())
+        self.assertEqual(ReindexCheckpoint.load(self.path, self.selection, restart=True).done, set())
+
+    def test_other_selection_is_rejected(self):
+        ReindexCheckpoint.load(self.path, self.selection).save()
+        with self.assertRaises(CommandError):
+            ReindexCheckpoint.load(self.path, {**self.selection, 'model': 'other'})
+
+
+class StoreScrapedPDFTests(TestCase):
+    def test_known_content_only_adds_scrape_date_and_origin_url(self):
+        company = CompanyProfile.objects.create(name='ACME')
+        content = b'%PDF-1.4 report'
+        pdf = PDFFile.objects.create(
+            company=company, file='pdfs/report.pdf', file_hash=hashlib.sha256(content).hexdigest(),
+            file_size=len(content), processing_status='success', source='webscraped',
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        local_path = os.path.join(tmp.name, 'report.pdf')
+        with open(local_path, 'wb') as f:
+            f.write(content)
+
+        for _ in range(2):
+            stored, created = store_scraped_pdf(company, local_path, 'report.pdf', origin_url='https://acme.test/r.pdf')
+            self.assertEqual((stored.id, created), (pdf.id, False))
+
+        self.assertEqual(PDFFile.objects.filter(company=company).count(), 1)
+        self.assertEqual(pdf.scrape_dates.count(), 2)
+        self.assertEqual(list(pdf.origin_urls.values_list('url', flat=True)), ['https://acme.test/r.pdf'])
+
+        validators = {'etag': '"v1"', 'last_modified': 'Mon, 01 Sep 2025 10:00:00 GMT', 'content_length': len(content)}
+        store_scraped_pdf(company, local_path, 'report.pdf', origin_url='https://acme.test/r.pdf', validators=validators)
+        self.assertEqual(
+            known_origins([company.id]), {company.id: {'https://acme.test/r.pdf': {'pdf_id': pdf.id, **validators}}}
+        )
+        record_unchanged([pdf.id])
+        self.assertEqual(pdf.scrape_dates.count(), 4)
+
+    def test_validators_of_the_latest_download_are_persisted_per_origin_url(self):
+        company = CompanyProfile.objects.create(name='ACME')
+        content = b'%PDF-1.4 report'
+        pdf = PDFFile.objects.create(
+            company=company, file='pdfs/report.pdf', file_hash=hashlib.sha256(content).hexdigest(),
+            file_size=len(content), processing_status='success', source='webscraped',
+        )
+        PDFOriginURL.objects.create(pdf_file=pdf, url='https://acme.test/r.pdf', etag='"v1"', content_length=1)
+        v2 = {'etag': '"v2"', 'last_modified': 'Tue, 02 Sep 2025 10:00:00 GMT', 'content_length': len(content)}
+
+        def store(url, validators):
+            store_scraped_pdf(
+                company, '/nonexistent/report.pdf', 'report.pdf', origin_url=url, validators=validators,
+                sha256=pdf.file_hash, size=len(content),
+            )
+
+        store('https://acme.test/r.pdf', v2)
+        store('https://acme.test/r.pdf', None)  # a response without validators keeps the known ones
+        store('https://acme.test/mirror/r.pdf', {**v2, 'etag': '"m1"'})
+
+        self.assertEqual(
+            sorted(PDFOriginURL.objects.values_list('url', 'etag', 'last_modified', 'content_length')),
+            [('https://acme.test/mirror/r.pdf', '"m1"', v2['last_modified'], len(content)),
+             ('https://acme.test/r.pdf', '"v2"', v2['last_modified'], len(content))],
+        )
+
+    def test_pipeline_stores_a_batch_with_real_origin_urls(self):
+        company = CompanyProfile.objects.create(name='ACME')
+        content = b'%PDF-1.4 report'
+        sha256 = hashlib.sha256(content).hexdigest()
+        pdf = PDFFile.objects.create(
+            company=company, file='pdfs/report.pdf', file_hash=sha256, file_size=len(content),
+            processing_status='success', source='webscraped',
+        )
+        PDFOriginURL.objects.create(pdf_file=pdf, url='https://acme.test/r.pdf', etag='"v1"')
+        item = {
+            'company_id': company.id, 'file_path': '/nonexistent/report.pdf', 'file_name': 'report.pdf',
+            'sha256': sha256, 'size': len(content),
+        }
+        validators = {'etag': '"v2"', 'last_modified': '', 'content_length': len(content)}
+        batch = [
+            {**item, 'url': 'https://acme.test/r.pdf', 'validators': validators},
+            {**item, 'url': 'https://acme.test/archive/r.pdf', 'validators': None},
+        ]
+
+        stats = {}
+        pipeline = PdfStoragePipeline(SimpleNamespace(inc_value=lambda key: stats.update({key: stats.get(key, 0) + 1})))
+        # MultiCompanyPdfSpider: the company comes with every item
+        pipeline.open_spider(SimpleNamespace(store_pdfs=True))
+        pipeline.store(company.id, batch, SimpleNamespace(logger=logging.getLogger(__name__)))
+
+        self.assertEqual(stats, {'pdf_store/duplicates': 2, f'pdf_store/duplicates/{company.id}': 2})
+        self.assertEqual(pdf.scrape_dates.count(), 2)
+        self.assertEqual(
+            sorted(pdf.origin_urls.values_list('url', 'etag')),
+            [('https://acme.test/archive/r.pdf', ''), ('https://acme.test/r.pdf', '"v2"')],
+        )
+
+    def test_pipeline_batches_per_company_and_stores_nothing_without_store_pdfs(self):
+        items = [{'company_id': company_id, 'url': f'https://acme.test/{n}.pdf'} for n, company_id in enumerate([1, 2, 1])]
+
+        pipeline = PdfStoragePipeline(SimpleNamespace(inc_value=lambda key: None), batch_size=10)
+        pipeline.open_spider(SimpleNamespace(store_pdfs=True))
+        for item in items:
+            self.assertIs(pipeline.process_item(item, None), item)
+        self.assertEqual(pipeline.pending, {1: [items[0], items[2]], 2: [items[1]]})
+
+        pipeline = PdfStoragePipeline(SimpleNamespace(inc_value=lambda key: None), batch_size=10)
+        pipeline.open_spider(SimpleNamespace(store_pdfs=False))
+        for item in items:
+            pipeline.process_item(item, None)
+        self.assertEqual(pipeline.pending, {})
+        self.assertIsNone(pipeline.close_spider(None))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ingestion-queue-tests'}})
+class IngestionQueueTests(SimpleTestCase):
+    def test_manual_uploads_before_scraped_and_large_crawls_lose_priority(self):
+        manual = ingestion_queue.ingestion_priority('manual', company_backlog=500)
+        small_crawl = ingestion_queue.ingestion_priority('webscraped', company_backlog=2)
+        large_crawl = ingestion_queue.ingestion_priority('webscraped', company_backlog=300)
+        reindex = ingestion_queue.ingestion_priority('reindex')
+
+        # Redis transport: lower numbers are served first
+        self.assertLess(manual, small_crawl)
+        self.assertLess(small_crawl, large_crawl)
+        self.assertLess(large_crawl, reindex)
+
+    def test_wait_stats_per_source(self):
+        for seconds in (1, 2, 3, 10):
+            ingestion_queue.record_wait('webscraped', seconds)
+        stats = ingestion_queue.wait_stats()
+
+        self.assertEqual(stats['webscraped'], {'n': 4, 'avg': 4.0, 'p95': 10, 'max': 10})
+        self.assertIsNone(stats['manual'])
+
+
+class PipelineMetricsTests(SimpleTestCase):
+    def test_timed_observes_also_when_the_block_raises(self):
+        labels = {'stage': 'test_stage', 'model': 'test-model'}
+        before = metrics.registry().get_sample_value('esg_pipeline_stage_seconds_count', labels) or 0
+
+        with self.assertRaises(ValueError):
+            with metrics.timed(metrics.STAGE_SECONDS, **labels):
+                raise ValueError
+
+        self.assertEqual(metrics.registry().get_sample_value('esg_pipeline_stage_seconds_count', labels), before + 1)
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        metrics.count_cache('test_cache', hits=2, misses=1)
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'esg_cache_requests_total{cache="test_cache",result="hit"} 2.0', response.content)
+
+    def test_worker_metrics_server_is_not_started_without_multiprocess_dir(self):
+        with socket.socket() as sock:
+            sock.bind(('', 0))
+            port = sock.getsockname()[1]
+        multiproc_dir = os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        if multiproc_dir is not None:
+            self.addCleanup(os.environ.__setitem__, 'PROMETHEUS_MULTIPROC_DIR', multiproc_dir)
+
+        with override_settings(WORKER_METRICS_PORT=port), redirect_stderr(StringIO()) as stderr:
+            start_metrics_server()
+
+        self.assertIn('NOT started', stderr.getvalue())
+        with socket.socket() as sock:
+            sock.bind(('', port))  # still free
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profile_dir = os.path.join(tmp.name, 'profiles')
+        settings_override = override_settings(MEDIA_ROOT=tmp.name, PROFILING_ENABLED=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_profiled_block_writes_stats_and_memory_report(self):
+        with profiled('unit-test'):
+            sum(i * i for i in range(10000))
+
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, 'unit-test.prof')))
+        with open(os.path.join(self.profile_dir, 'unit-test.txt'), encoding='utf-8') as f:
+            report = f.read()
+        self.assertIn('peak traced memory', report)
+        self.assertIn('functions by cumulative time', report)
+
+    def test_task_profiles_are_named_by_pdf_id(self):
+        stage = SimpleNamespace(name='backend.llm_module.pdf_preprocessor.parse_pdf_stage')
+        other = SimpleNamespace(name='api.tasks.run_scraping_task')
+
+        self.assertEqual(task_profile_name(stage, 'abcdef123456', [{'pdf_id': 7}], {}), 'parse_pdf_stage-pdf7-abcdef12')
+        self.assertEqual(task_profile_name(other, 'abcdef123456', [], {}), 'run_scraping_task-abcdef123456')
+
+    def test_header_only_profiles_staff_requests(self):
+        middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/llm-evaluate/', HTTP_X_PROFILE='1')
+
+        request.user = SimpleNamespace(is_staff=False)
+        self.assertNotIn('X-Profile-Name', middleware(request))
+        self.assertFalse(os.path.exists(self.profile_dir))
+
+        request.user = SimpleNamespace(is_staff=True)
+        response = middleware(request)
+        self.assertTrue(response['X-Profile-Name'].startswith('view-llm-evaluate-'))
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, response['X-Profile-Name'] + '.prof')))
+
+    def test_header_profiles_token_requests_of_staff_users(self):
+        middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+        staff = Token.objects.create(user=User.objects.create_user('staff', is_staff=True))
+        other = Token.objects.create(user=User.objects.create_user('other'))
+
+        def token_request(key):
+            # As the API views see it in the middleware: not logged in by session
+            request = RequestFactory().get('/llm-evaluate/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=f'Token {key}')
+            request.user = AnonymousUser()
+            return request
+
+        self.assertNotIn('X-Profile-Name', middleware(token_request(other.key)))
+        self.assertNotIn('X-Profile-Name', middleware(token_request('invalid')))
+        self.assertIn('X-Profile-Name', middleware(token_request(staff.key)))
+
+
+def write_synthetic_pdf(path, n_pages):
+    """A minimal valid PDF with one line of text per page, written without any PDF library."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, needs the page object numbers
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page_num in range(1, n_pages + 1):
+        content = f"BT /F1 12 Tf 72 720 Td (Page {page_num}: Scope 1 emissions were {page_num * 7} t CO2e.) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(page_refs), n_pages)
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+class FixedYearProvider(LLMProviderInterface):
+    def generate(self, prompt, **kwargs):
+        return {'text': '2023', 'confidence': 1.0}
+
+
+# The stages chain into each other and queue the company index task; eager tasks still open a producer
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pipeline-tests'}},
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_BROKER_URL='memory://',
+)
+class IngestionPipelineTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()  # ingestion and company index locks
+
+        embedding_provider = SimpleNamespace(
+            model_name='test-model', encode=lambda texts: np.random.default_rng(0).random((len(texts), 16), dtype='float32'),
+        )
+        preprocessor = pdf_preprocessor.PDFPreprocessor(embedding_provider=embedding_provider, llm_provider=FixedYearProvider())
+        previous, pdf_preprocessor._preprocessor = pdf_preprocessor._preprocessor, preprocessor
+        self.addCleanup(setattr, pdf_preprocessor, '_preprocessor', previous)
+
+        os.makedirs(os.path.join(tmp.name, 'pdfs'))
+        self.pdf_path = os.path.join(tmp.name, 'pdfs', 'report.pdf')
+        write_synthetic_pdf(self.pdf_path, 3)
+        # Not 'pending', the test runs the pipeline itself
+        self.pdf = PDFFile.objects.create(
+            company=CompanyProfile.objects.create(name='ACME'), file='pdfs/report.pdf', file_hash='ab' * 32,
+            file_size=1, processing_status='success',
+        )
+
+    def intermediates(self):
+        directory = artifacts.artifact_dir(self.pdf.file_hash)
+        return [name for name in (artifacts.CHUNKS_ARTIFACT, artifacts.EMBEDDINGS_ARTIFACT)
+                if os.path.exists(os.path.join(directory, name))]
+
+    def test_stage_chain_records_indexes_and_removes_intermediates(self):
+        state = pdf_preprocessor.ingestion_pipeline(self.pdf.id, self.pdf_path).apply().get()
+
+        self.pdf.refresh_from_db()
+        self.assertEqual(self.pdf.processing_status, 'success')
+        self.assertEqual((self.pdf.report_year, self.pdf.embedding_model), (2023, 'test-model'))
+        self.assertEqual(self.pdf.chunk_vector_index_path, state['fields']['chunk_vector_index_path'])
+        manifest = artifacts.find_artifacts(self.pdf.file_hash, 'test-model')
+        self.assertEqual((manifest['built_for_pdf_id'], manifest['n_chunks']), (self.pdf.id, state['n_chunks']))
+        self.assertGreater(state['n_chunks'], 0)
+        self.assertEqual(self.intermediates(), [])
+        self.assertTrue(CompanyIndex(self.pdf.company_id).exists())
+        self.assertIsNotNone(artifacts.acquire_ingestion_lock(self.pdf.file_hash, 'test-model'))  # released
+
+    def test_year_stage_is_timed_with_the_llm_model(self):
+        def count(model):
+            labels = {'stage': 'infer_year', 'model': model}
+            return metrics.registry().get_sample_value('esg_pipeline_stage_seconds_count', labels) or 0
+        before = count('FixedYearProvider'), count('test-model')
+
+        pdf_preprocessor.ingestion_pipeline(self.pdf.id, self.pdf_path).apply().get()
+
+        self.assertEqual((count('FixedYearProvider'), count('test-model')), (before[0] + 1, before[1]))
+
+    def test_failed_stage_removes_intermediates_and_marks_the_pdf_failed(self):
+        state = pdf_preprocessor.parse_pdf_stage.apply(({'pdf_id': self.pdf.id, 'pdf_path': self.pdf_path},)).get()
+        pdf_preprocessor.embed_chunks_stage.apply((state,)).get()
+        self.assertEqual(len(self.intermediates()), 2)
+
+        pdf_preprocessor.build_index_stage.on_failure(RuntimeError('disk full'), 'task-id', (state,), {}, None)
+
+        self.assertEqual(self.intermediates(), [])
+        self.assertEqual(PDFFile.objects.get(pk=self.pdf.id).processing_status, 'failed')
+        self.assertIsNotNone(artifacts.acquire_ingestion_lock(self.pdf.file_hash, 'test-model'))
+
+    def test_reindex_reports_a_pdf_whose_hash_stays_locked_as_failed(self):
+        artifacts.acquire_ingestion_lock(self.pdf.file_hash, 'test-model')  # held by a stuck worker
+        wait, retries = pdf_preprocessor.INGESTION_LOCK_WAIT, pdf_preprocessor.INGESTION_LOCK_RETRIES
+        pdf_preprocessor.INGESTION_LOCK_WAIT, pdf_preprocessor.INGESTION_LOCK_RETRIES = 0, 2
+        stderr = StringIO()
+        try:
+            call_command('reindex_pdfs', stdout=StringIO(), stderr=stderr)
+        finally:
+            pdf_preprocessor.INGESTION_LOCK_WAIT, pdf_preprocessor.INGESTION_LOCK_RETRIES = wait, retries
+
+        self.assertIn('stayed locked', stderr.getvalue())
+        self.assertEqual(PDFFile.objects.get(pk=self.pdf.id).processing_status, 'failed')
+
+    def reindex_celery(self, interrupt=False, **options):
+        """
+        Runs reindex_pdfs --celery with pipelines that are queued but never run, as if lost; with `interrupt`
+        the run is interrupted while it waits for them. Returns the PDF ids it queued and its stderr.
+        """
+        def interrupted(seconds):
+            raise KeyboardInterrupt
+
+        queued = []
+        previous = reindex_pdfs.ingestion_pipeline, reindex_pdfs.time.sleep
+        reindex_pdfs.ingestion_pipeline = lambda pdf_id, *args, **kwargs: SimpleNamespace(
+            apply_async=lambda: queued.append(pdf_id)
+        )
+        if interrupt:
+            reindex_pdfs.time.sleep = interrupted
+        stderr = StringIO()
+        try:
+            call_command(
+                'reindex_pdfs', celery=True, report_every=0, checkpoint=self.checkpoint_path,
+                stdout=StringIO(), stderr=stderr, **options
+            )
+        finally:
+            reindex_pdfs.ingestion_pipeline, reindex_pdfs.time.sleep = previous
+        return queued, stderr.getvalue()
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'reindex.json')
+
+    def test_reindex_celery_marks_lost_pipelines_failed_after_the_timeout(self):
+        queued, stderr = self.reindex_celery(timeout=0)
+
+        self.assertEqual(queued, [self.pdf.id])
+        self.assertIn('marking 1 outstanding PDFs failed', stderr)
+        self.assertEqual(PDFFile.objects.get(pk=self.pdf.id).processing_status, 'failed')
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        self.assertEqual((checkpoint['failed'], checkpoint['queued']), ([self.pdf.id], []))
+
+    def test_resumed_reindex_celery_does_not_queue_pending_pipelines_again(self):
+        first, _ = self.reindex_celery(interrupt=True)
+        resumed, _ = self.reindex_celery(interrupt=True)
+        forced, _ = self.reindex_celery(timeout=0, force=True)
+
+        self.assertEqual((first, resumed, forced), ([self.pdf.id], [], [self.pdf.id]))
+
+
+class PDFParserLimitTests(SimpleTestCase):
+    RSS_GROWTH_LIMIT_MB = 60  # about 100 MB without page windows and cache release
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_page_limit_and_byte_limit_degrade_gracefully(self):
+        path = os.path.join(self.tmp, 'long.pdf')
+        write_synthetic_pdf(path, 30)
+
+        paragraphs = PDFParser(max_pages=10, page_window=4).parse_pdf(path)
+        self.assertEqual([p['page_num'] for p in paragraphs], list(range(1, 11)))
+        self.assertIn('Page 10:', paragraphs[-1]['text'])
+
+        parser = PDFParser(max_bytes=1024)
+        self.assertFalse(parser.tables_enabled(path))
+        self.assertEqual(parser.extract_table_chunks(path, paragraphs), [])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'ru_maxrss is reported in KiB on Linux')
+    def test_peak_rss_of_1000_page_pdf_stays_bounded(self):
+        path = os.path.join(self.tmp, 'large.pdf')
+        write_synthetic_pdf(path, 1000)
+        # Separate interpreter, so the peak RSS is not that of the test process
+        script = (
+            "import resource, sys\n"
+            "from backend.llm_module.parser import PDFParser\n"
+            "baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "parser = PDFParser(max_pages=None)\n"
+            "paragraphs = parser.parse_pdf(sys.argv[1])\n"
+            "parser.extract_table_chunks(sys.argv[1], paragraphs)\n"
+            "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "print(len(paragraphs), (peak - baseline) // 1024)\n"
+        )
+        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, '-c', script, path], cwd=web_dir, capture_output=True, text=True, check=True
+        ).stdout.split()
+
+        n_paragraphs, growth_mb = int(output[-2]), int(output[-1])
+        self.assertEqual(n_paragraphs, 1000)
+        self.assertLess(growth_mb, self.RSS_GROWTH_LIMIT_MB)
+
+
+class CrawlStateTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'state', '1.sqlite3')
+
+    def test_interrupted_crawl_resumes_frontier_and_skips_fresh_pages(self):
+        state = CrawlState(self.path, recrawl_after=3600)
+        state.schedule('https://acme.test/a', 'page', 'https://acme.test/')
+        state.schedule('https://acme.test/b', 'page', 'https://acme.test/')
+        state.schedule('https://acme.test/r.pdf', 'pdf', 'https://acme.test/a')
+        state.visited('https://acme.test/a', 'page')
+        state.visited('https://acme.test/r.pdf', 'pdf')
+        state.close(finished=False)  # interrupted
+
+        resumed = CrawlState(self.path, recrawl_after=3600)
+        # Downloaded PDFs stay until a crawl finishes, they are only stored afterwards
+        self.assertEqual([url for url, _, _ in resumed.frontier()], ['https://acme.test/b', 'https://acme.test/r.pdf'])
+        self.assertTrue(resumed.is_fresh('https://acme.test/a'))
+        self.assertTrue(resumed.is_fresh('https://acme.test/a?'))  # same canonical URL
+        self.assertFalse(resumed.is_fresh('https://acme.test/b'))
+        resumed.visited('https://acme.test/b', 'page')
+        resumed.close(finished=True)
+
+        full = CrawlState(self.path, recrawl_after=0)
+        self.assertEqual(full.frontier(), [])
+        self.assertFalse(full.is_fresh('https://acme.test/a'))
+        full.close(finished=True)
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    """Pages under /slow/ answer their first request with 429 and Retry-After; /fast/ pages always succeed."""
+    RETRY_AFTER = 2
+    throttled = set()
+
+    def do_GET(self):
+        if self.path.startswith('/slow/') and self.path not in self.throttled:
+            self.throttled.add(self.path)
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.RETRY_AFTER))
+        else:
+            time.sleep(0.02)
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class CrawlTestServer(ThreadingHTTPServer):
+    request_queue_size = 64  # with the default backlog of 5, concurrent connects stall for a SYN retry
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'needs 127.0.0.2 on the loopback interface')
+class DynamicDelayRetryMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        server = CrawlTestServer(('', 0), ThrottledHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        self.port = server.server_address[1]
+
+    def test_throttled_domain_does_not_stall_other_domains(self):
+        # Own interpreter, the reactor of a crawl cannot be restarted. 127.0.0.1 and 127.0.0.2 are two download slots.
+        script = (
+            "import json, os, sys, time\n"
+            "import scrapy\n"
+            "from scrapy.crawler import CrawlerProcess\n"
+            "from scrapy.utils.project import get_project_settings\n"
+            "port = sys.argv[1]\n"
+            "done = {}\n"
+            "class TimingSpider(scrapy.Spider):\n"
+            "    name = 'timing'\n"
+            "    start_urls = [f'http://127.0.0.1:{port}/slow/{i}' for i in range(2)] + \\\n"
+            "                 [f'http://127.0.0.2:{port}/fast/{i}' for i in range(40)]\n"
+            "    def parse(self, response):\n"
+            "        done[response.url] = time.monotonic()\n"
+            "os.environ['SCRAPY_SETTINGS_MODULE'] = 'backend.scraper_module.settings'\n"
+            "settings = get_project_settings()\n"
+            "settings.set('LOG_LEVEL', 'ERROR')\n"
+            "process = CrawlerProcess(settings)\n"
+            "process.crawl(TimingSpider)\n"
+            "started = time.monotonic()\n"
+            "process.start()\n"
+            "print(json.dumps({url: at - started for url, at in done.items()}))\n"
+        )
+        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, '-c', script, str(self.port)], cwd=web_dir, capture_output=True, text=True, check=True
+        ).stdout
+        done = json.loads(output.strip().splitlines()[-1])
+
+        slow = [at for url, at in done.items() if '/slow/' in url]
+        fast = [at for url, at in done.items() if '/fast/' in url]
+        self.assertEqual((len(slow), len(fast)), (2, 40))
+        # The throttled domain waits for Retry-After, the other domain finishes meanwhile
+        self.assertGreaterEqual(min(slow), ThrottledHandler.RETRY_AFTER)
+        self.assertLess(max(fast), min(slow))
+
+
+class ValidatorHandler(BaseHTTPRequestHandler):
+    """An index page linking three PDFs: one with an ETag, one without validators and one that changed."""
+    PDF = b'%PDF-1.4 ' + b'x' * 5000
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == '/':
+            body = b'<a href="/etag.pdf"></a><a href="/plain.pdf"></a><a href="/changed.pdf"></a>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+        elif self.path == '/etag.pdf' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        else:
+            body = self.PDF
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            if self.path == '/changed.pdf':
+                self.send_header('ETag', '"v2"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConditionalCrawlTests(SimpleTestCase):
+    def setUp(self):
+        server = CrawlTestServer(('127.0.0.1', 0), ValidatorHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        self.base = f'http://127.0.0.1:{server.server_address[1]}'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def crawl(self, known, state_dir=''):
+        script = (
+            "import json, sys\n"
+            "from backend.scraper_module.runner import crawl_companies\n"
+            "base, folder, known, state_dir = sys.argv[1], sys.argv[2], json.loads(sys.argv[3]), sys.argv[4]\n"
+            "known = {int(company_id): urls for company_id, urls in known.items()}\n"
+            "spider = crawl_companies([{'company_id': 1, 'company_url_id': 7, 'url': base + '/'}], folder,\n"
+            "                         known=known, state_dir=state_dir or None, recrawl_after=3600)\n"
+            "print(json.dumps({'unchanged': spider.unchanged[1], 'stats': spider.company_stats[1],\n"
+            "                  'downloaded': spider.pdf_files[1]}))\n"
+        )
+        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, '-c', script, self.base, os.path.join(self.tmp, 'pdfs'), json.dumps(known), state_dir],
+            cwd=web_dir, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def known(self, etag='"v1"'):
+        size = len(ValidatorHandler.PDF)
+        return {1: {
+            f'{self.base}/etag.pdf': {'pdf_id': 10, 'etag': '"v1"', 'last_modified': '', 'content_length': size},
+            f'{self.base}/plain.pdf': {'pdf_id': 11, 'etag': '', 'last_modified': '', 'content_length': size},
+            f'{self.base}/changed.pdf': {'pdf_id': 12, 'etag': etag, 'last_modified': '', 'content_length': size},
+        }}
+
+    def test_unchanged_pdfs_are_skipped_and_changed_ones_streamed_to_disk(self):
+        size = len(ValidatorHandler.PDF)
+        result = self.crawl(self.known())
+
+        self.assertEqual(sorted(result['unchanged']), [10, 11])
+        [downloaded] = result['downloaded']
+        self.assertEqual(downloaded['url'], f'{self.base}/changed.pdf')
+        # Hashed while streaming to disk
+        self.assertEqual(downloaded['sha256'], hashlib.sha256(ValidatorHandler.PDF).hexdigest())
+        self.assertEqual(downloaded['size'], size)
+        with open(downloaded['file_path'], 'rb') as f:
+            self.assertEqual(f.read(), ValidatorHandler.PDF)
+        self.assertEqual(result['stats']['bytes_saved'], 2 * size)
+        self.assertEqual(result['stats']['bytes'], size)
+
+    def test_incremental_crawl_only_requests_the_start_page(self):
+        state_dir = os.path.join(self.tmp, 'state')
+        first = self.crawl(self.known(), state_dir)
+        self.assertEqual(len(first['downloaded']), 1)
+
+        # changed.pdf is stored now; recently seen stored PDFs are not requested again
+        del ValidatorHandler.hits[:]
+        second = self.crawl(self.known(etag='"v2"'), state_dir)
+        self.assertEqual(ValidatorHandler.hits, ['/'])
+        self.assertEqual(sorted(second['unchanged']), [10, 11, 12])
+        self.assertEqual(second['stats']['fresh'], 3)
+
+
+class BrokenDownloadHandler(BaseHTTPRequestHandler):
+    """An index page linking a PDF whose connection drops after the first bytes of the body."""
+
+    def do_GET(self):
+        if self.path == '/':
+            body = b'<a href="/broken.pdf"></a>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', '100000')
+        self.end_headers()
+        self.wfile.write(b'%PDF-1.4 ' + b'x' * 1000)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class BrokenDownloadTests(SimpleTestCase):
+    def test_failed_pdf_download_leaves_no_partial_file(self):
+        server = CrawlTestServer(('127.0.0.1', 0), BrokenDownloadHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        folder = os.path.join(tmp.name, 'pdfs')
+
+        script = (
+            "import json, sys\n"
+            "from backend.scraper_module.runner import crawl_companies\n"
+            "spider = crawl_companies([{'company_id': 1, 'url': sys.argv[1] + '/'}], sys.argv[2])\n"
+            "print(json.dumps({'downloaded': spider.pdf_files[1]}))\n"
+        )
+        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, '-c', script, base, folder], cwd=web_dir, capture_output=True, text=True, check=True
+        ).stdout
+
+        self.assertEqual(json.loads(output.strip().splitlines()[-1])['downloaded'], [])
+        partial = os.path.join(folder, 'partial')
+        self.assertEqual(os.listdir(partial) if os.path.isdir(partial) else [], [])
+
+
+class LinkScorerTests(SimpleTestCase):
+    def test_report_links_rank_above_catalogue_and_news(self):
+        sustainability = score_link('https://acme.test/sustainability/esg-reports/')
+        self.assertGreater(sustainability, score_link('https://acme.test/investors/'))
+        self.assertGreater(score_link('https://acme.test/investors/'), score_link('https://acme.test/about/'))
+        self.assertLess(score_link('https://acme.test/products/pumps/'), 0)
+        self.assertLess(score_link('https://acme.test/news/2023/'), 0)
+        # Anchor text counts for URLs that say nothing, short terms only at the start of a word
+        self.assertGreater(score_link('https://acme.test/d/7/', 'Nachhaltigkeitsbericht 2023'), 0)
+        self.assertEqual(score_link('https://acme.test/agriculture/'), 0)
+
+    def test_priority_puts_pdfs_and_shallow_pages_first(self):
+        self.assertGreater(link_priority(0, 3, is_pdf=True), link_priority(5, 1, is_pdf=False))
+        self.assertGreater(link_priority(5, 1, is_pdf=False), link_priority(5, 2, is_pdf=False))
+        self.assertGreater(link_priority(1, 4, is_pdf=False), link_priority(0, 1, is_pdf=False))
+
+
+class CatalogueHandler(BaseHTTPRequestHandler):
+    """A start page linking 20 product pages before its sustainability page, which holds a report and an archive."""
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == '/':
+            links = [f'/products/{i}/' for i in range(20)] + ['/sustainability/']
+        elif self.path == '/sustainability/':
+            links = ['/sustainability/report-2023.pdf', '/sustainability/archive/']
+        elif self.path.endswith('.pdf'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', '8')
+            self.end_headers()
+            self.wfile.write(b'%PDF-1.4')
+            return
+        else:
+            links = ['/sustainability/archive/report-2019.pdf']
+        body = ''.join(f'<a href="{link}">{link}</a>' for link in links).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CrawlBudgetTests(SimpleTestCase):
+    def setUp(self):
+        server = CrawlTestServer(('127.0.0.1', 0), CatalogueHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        self.base = f'http://127.0.0.1:{server.server_address[1]}'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_budget_goes_to_the_best_scored_links_within_max_depth(self):
+        script = (
+            "import json, sys\n"
+            "from backend.scraper_module.runner import crawl_companies\n"
+            "spider = crawl_companies([{'company_id': 1, 'url': sys.argv[1] + '/'}], sys.argv[2],\n"
+            "                         max_depth=1, max_pages=2, concurrency=1, per_domain=1)\n"
+            "print(json.dumps({'stats': spider.company_stats[1], 'pdfs': [pdf['url'] for pdf in spider.pdf_files[1]]}))\n"
+        )
+        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, '-c', script, self.base, self.tmp], cwd=web_dir, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        # Two pages: the start page and the best link on it; the archive is below max_depth, products over budget
+        pages = [path for path in CatalogueHandler.hits if not path.endswith('.pdf')]
+        self.assertEqual(pages, ['/', '/sustainability/'])
+        self.assertEqual(result['pdfs'], [f'{self.base}/sustainability/report-2023.pdf'])
+        self.assertEqual(result['stats']['over_budget'], 20)
@@ -8,6 +8,9 @@ urlpatterns = [
     path('scrape/status/', ScrapeTriggerView.as_view(), name='scrape_status'),
     path('reevaluate/', TriggerEvaluationView.as_view(), name='reevaluate'),
     path('reevaluate/status/', TriggerEvaluationView.as_view(), name='reevaluate_status'),
+    path('jobs/<uuid:pk>/', JobStatusView.as_view(), name='job_status'),
+    path('jobs/<uuid:pk>/stream/', JobStreamView.as_view(), name='job_stream'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('company/<int:pk>/', CompanyDetailView.as_view(), name='company_detail'),
     path('company/<int:pk>/upload_pdf/', PDFUploadView.as_view(), name='upload_pdf'),
     path('company/create/', CompanyCreateUpdateView.as_view(), name='company_create'),
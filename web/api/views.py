@@ -4,23 +4,20 @@ from .forms import CompanyProfileForm, CompanyURLFormSet, QueryForm
 import json
 
 import hashlib
-import threading
+import time
 import traceback
 
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views import View
 from django.views.generic import TemplateView, DetailView
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse, reverse_lazy
-from django.utils.timezone import now
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Count, Max, Q
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
-from django.core.cache import cache
-from django.utils import timezone
-from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.files.base import ContentFile
 from rest_framework import viewsets
 from rest_framework.views import APIView
@@ -28,17 +25,28 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
-from .serializers import LLMQuerySerializer, LLMDataPointSerializer, PDFFileSerializer, EvaluationResultSerializer
-from .models import CompanyProfile, Query, EvaluationResult, PDFFile, PDFScrapeDate
-from backend.llm_module.llm_provider import HuggingFaceLLMProvider, SentenceTransformersEmbeddingProvider
-from backend.llm_module.processor import LLMProcessor
+from .serializers import (
+    LLMQuerySerializer, LLMDataPointSerializer, PDFFileSerializer, EvaluationResultSerializer,
+    EvaluationResultBatchItemSerializer
+)
+from .persistence import bulk_create_evaluation_results
+from .models import CompanyProfile, Query, EvaluationResult, Job, PDFFile, PDFScrapeDate
+from backend.llm_module.company_index import sync_pdf_activation
+from backend.llm_module.ingestion_queue import queue_depths, wait_stats
+from backend.llm_module import metrics
+from backend.llm_module.pdf_store import ORMPDFStore
+from .tasks import run_evaluation_matrix_task, run_llm_evaluation_task, run_scraping_task
 from rest_framework import status
 
 
 
 
-SCRAPING_STATUS_KEY = "scraping_running"
-EVALUATION_STATUS_KEY = "evaluation_running"
+
+# Fields the preprocessing worker may set through PDFFileViewSet.batch_update
+PDF_BATCH_UPDATE_FIELDS = {
+    'processing_status', 'chunk_vector_index_path', 'document_vector_index_path', 'report_year', 'embedding_model'
+}
+PROCESSING_STATUSES = {value for value, _ in PDFFile._meta.get_field('processing_status').choices}
 
 
 class PDFFileViewSet(viewsets.ModelViewSet):
@@ -52,6 +60,26 @@ class PDFFileViewSet(viewsets.ModelViewSet):
         pdf_file = self.get_object()
         return Response({'file_hash': pdf_file.file_hash}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['patch'])
+    def batch_update(self, request):
+        """Update the processing fields of many PDFs, given as a list of {"id": ..., <field>: ...}."""
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of updates.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        updates = {}
+        for item in request.data:
+            fields = {key: value for key, value in item.items() if key in PDF_BATCH_UPDATE_FIELDS}
+            if 'id' not in item or len(fields) != len(item) - 1:
+                return Response(
+                    {'error': f'Each update needs an id and may only set {sorted(PDF_BATCH_UPDATE_FIELDS)}.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if 'processing_status' in fields and fields['processing_status'] not in PROCESSING_STATUSES:
+                return Response({'error': f"Invalid processing_status for PDF {item['id']}."}, status=status.HTTP_400_BAD_REQUEST)
+            updates[item['id']] = fields
+
+        return Response({'updated': ORMPDFStore().update_many(updates)}, status=status.HTTP_200_OK)
+
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = "api/dashboard.html"
 
@@ -95,10 +123,31 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             "search_query": search_query,
             "all_companies_active": all_companies_active,
             "all_queries_active": all_queries_active,
-            "scraping_running": cache.get("scraping_running", False)
+            "scraping_running": Job.active_jobs('scrape').exists(),
+            "ingestion_queues": queue_depths(),
+            "ingestion_sources": self.ingestion_sources(),
         })
         return context
 
+    @staticmethod
+    def ingestion_sources():
+        """Pending PDFs and recent queue wait times per source, for the dashboard's processing table."""
+        pending = dict(
+            PDFFile.objects.filter(processing_status='pending')
+            .values_list('source').annotate(n=Count('id')).order_by()
+        )
+        return [
+            {"source": source, "pending": pending.get(source, 0), "wait": stats}
+            for source, stats in wait_stats().items()
+        ]
+
+
+class MetricsView(View):
+    """Prometheus scrape endpoint of the web process, see backend/llm_module/metrics.py."""
+    def get(self, request):
+        body, content_type = metrics.render()
+        return HttpResponse(body, content_type=content_type)
+
 
 class AnalyzeView(View):
     def get(self, request):
@@ -130,8 +179,8 @@ class PDFUploadView(View):
             # SHA-256 Hash berechnen
             sha256 = hashlib.sha256(content).hexdigest()
 
-            # Nur manuelle Uploads prüfen
-            pdf = PDFFile.objects.filter(file_hash=sha256, source='manual').first()
+            # Duplikate nur innerhalb der Firma prüfen, gleiche Reports anderer Firmen teilen sich die Indizes
+            pdf = PDFFile.objects.filter(company=company, file_hash=sha256).first()
 
             if pdf:
                 PDFScrapeDate.objects.create(pdf_file=pdf)
@@ -228,46 +277,44 @@ class QueryCreateUpdateView(View):
             return JsonResponse({'success': False, 'html': html})
 
 
+def _queue_job(job, task, **kwargs):
+    """Queues `task` for `job` and remembers the Celery task id; marks the job failed if the broker is down."""
+    try:
+        result = task.delay(job_id=str(job.id), **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        job.mark_finished(error=f"Could not queue task: {e}")
+        return False
+    Job.objects.filter(pk=job.pk).update(celery_task_id=result.id)
+    return True
+
+
+def _job_urls(job):
+    return {
+        "job_id": str(job.id),
+        "status_url": reverse('job_status', args=[job.id]),
+        "stream_url": reverse('job_stream', args=[job.id]),
+    }
+
+
 class ScrapeTriggerView(View):
     def get(self, request):
         """Check scrape status."""
-        return JsonResponse({"scraping": bool(cache.get(SCRAPING_STATUS_KEY))})
+        job = Job.active_jobs('scrape').first()
+        return JsonResponse({"scraping": job is not None, "job": job.as_dict() if job else None})
 
     def post(self, request):
-        if cache.get(SCRAPING_STATUS_KEY):
+        if Job.active_jobs('scrape').exists():
             return JsonResponse({"status": "already running"}, status=400)
 
-        cache.set(SCRAPING_STATUS_KEY, True, timeout=3600)
-
-        def run_scraping():
-            try:
-                active_companies = CompanyProfile.objects.filter(active=True).prefetch_related('urls')
-
-                for company in active_companies:
-                    urls = company.urls.filter(active=True)
-                    for url in urls:
-                        try:
-                            print(f"Starte Scraper für Firma {company.name} mit URL: {url.url}")
-                            call_command('run_scraper', domain=url.url, company_id=company.id)
-                        except Exception as cmd_error:
-                            print(f"Fehler beim Scrapen von {company.name} / {url.url}: {cmd_error}")
-                            traceback.print_exc()
-
-                # Scrape-Zeitstempel aktualisieren
-                CompanyProfile.objects.filter(active=True).update(last_scraped=now())
-                cache.delete(SCRAPING_STATUS_KEY)
-
-                print("Scraping abgeschlossen.")
-            except Exception as e:
-                print("Fehler im Scrape-Thread:")
-                traceback.print_exc()
-                cache.delete(SCRAPING_STATUS_KEY)
-
-        threading.Thread(target=run_scraping).start()
+        job = Job.objects.create(kind='scrape')
+        if not _queue_job(job, run_scraping_task):
+            return JsonResponse({"status": "error", **_job_urls(job)}, status=500)
 
         companies = CompanyProfile.objects.filter(active=True).values('id', 'last_scraped')
         return JsonResponse({
             "status": "started",
+            **_job_urls(job),
             "companies": list(companies)
         })
 
@@ -275,46 +322,22 @@ class ScrapeTriggerView(View):
 
 class TriggerEvaluationView(View):
     def get(self, request):
-        running = bool(cache.get(EVALUATION_STATUS_KEY))
-        return JsonResponse({"running": running})
+        # total/done/skipped pairs, pairs_per_sec, ... as written by run_evaluation_matrix_task
+        job = Job.active_jobs('evaluation_matrix').first()
+        return JsonResponse({"running": job is not None, "job": job.as_dict() if job else None})
 
     def post(self, request):
-        if cache.get(EVALUATION_STATUS_KEY):
+        if Job.active_jobs('evaluation_matrix').exists():
             return JsonResponse({"status": "already running"}, status=400)
 
-        cache.set(EVALUATION_STATUS_KEY, True, timeout=3600)
-
-        def run_evaluation():
-            try:
-                import time
-                time.sleep(15)  # Simuliere Auswertung
-
-                # Beispiel: genutzte Query-IDs
-                used_query_ids = [1, 3, 7]
-                queries = Query.objects.filter(id__in=used_query_ids)
-
-                # Für jede Firma und jede Query ein leeres EvaluationResult anlegen
-                for company in CompanyProfile.objects.filter(active=True):
-                    for query in queries:
-                        EvaluationResult.objects.create(
-                            query=query,
-                            company=company,
-                            pdf_file=None,  # falls noch nicht vorhanden
-                            result_data={},  # leeres Ergebnis
-                            timestamp=now()
-                        )
-
-                cache.delete(EVALUATION_STATUS_KEY)
-            except Exception:
-                import traceback
-                traceback.print_exc()
-                cache.delete(EVALUATION_STATUS_KEY)
-
-        threading.Thread(target=run_evaluation).start()
+        # force=1 re-evaluates pairs whose inputs did not change since their latest result
+        force = request.POST.get("force", "").lower() in ("1", "true", "on")
+        job = Job.objects.create(kind='evaluation_matrix', params={"force": force})
+        if not _queue_job(job, run_evaluation_matrix_task, force=force):
+            return JsonResponse({"status": "error", **_job_urls(job)}, status=500)
 
         # Rückgabe der letzten Evaluationszeitpunkte pro Firma (aggregiert)
         # Beispiel: Hole das neueste Ergebnis je Firma
-        from django.db.models import Max
         latest = (EvaluationResult.objects
             .values('company_id')
             .annotate(last_evaluated=Max('timestamp'))
@@ -339,77 +362,100 @@ class TriggerEvaluationView(View):
 
         return JsonResponse({
             "status": "started",
+            **_job_urls(job),
             "updated_companies": response_data
         })
 
 
-class LLMRunEvaluationView(APIView):
+class JobStatusView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.provider = HuggingFaceLLMProvider()
-        self.embedding_provider = SentenceTransformersEmbeddingProvider()
-        self.processor = LLMProcessor(provider=self.provider, embedding_provider=self.embedding_provider)
+    def get(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        return JsonResponse(job.as_dict())
 
-    def post(self, request):
-        serializer = LLMQuerySerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
 
+class JobStreamView(APIView):
+    """
+    Streams the progress of a job as NDJSON: a `job` line whenever its status or counters change and a
+    `result` line per EvaluationResult produced by the job, until the job has finished.
+    Only reads the database, the work itself happens in the Celery worker.
+
+    A stream ends after `max_duration`, so that it does not hold a web worker for the whole job: a
+    `reconnect` line then carries the id of the last sent result, and the client resumes with
+    `?after=<id>`.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    poll_interval = 1.0  # seconds
+    max_duration = 55  # seconds, below the usual proxy and gunicorn timeouts
+
+    def get(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
         try:
-            # Run the RAG processor
-            result_data = self.processor.rag_analyze(
-                company_id=data['company_id'],
-                query_id=data['query_id'],
-                query_text=data['query'],
-                pdf_files=PDFFile.objects.filter(company_id=data['company_id'], active=True),
-                top_k=5,
-                filter_by_document_level_index=True,
-                extended_search=True
-            )
+            after = int(request.query_params.get('after', 0))
+        except ValueError:
+            return Response({'error': 'after must be a result id.'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(self.stream(job.pk, after), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # no proxy buffering, lines are sent as they come
+        return response
+
+    def stream(self, job_id, last_result_id=0):
+        deadline = time.monotonic() + self.max_duration
+        last_state = None
+        while True:
+            job = Job.objects.get(pk=job_id)
+            new_results = list(job.results.filter(id__gt=last_result_id).order_by('id')[:500])
+            for result in new_results:
+                yield self.line({"type": "result", "result": LLMDataPointSerializer(result).data})
+            if new_results:
+                last_result_id = new_results[-1].id
+
+            state = job.as_dict()
+            state.pop("duration_seconds")
+            if state != last_state:
+                yield self.line({"type": "job", "job": job.as_dict()})
+                last_state = state
+
+            # Keep going while results are pending, even if the job has already finished
+            if job.is_finished and not new_results:
+                return
+            if time.monotonic() > deadline:
+                yield self.line({
+                    "type": "reconnect",
+                    "after": last_result_id,
+                    "stream_url": f"{reverse('job_stream', args=[job_id])}?after={last_result_id}",
+                })
+                return
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def line(payload):
+        return json.dumps(payload, cls=DjangoJSONEncoder) + "\n"
 
-            if not result_data:
-                return Response({'message': 'No relevant chunks found.'}, status=204)
-
-            # Fetch required objects
-            company = CompanyProfile.objects.get(pk=data['company_id'])
-            query = Query.objects.get(pk=data['query_id'])
-
-            saved_results = []
-            for chunk in result_data:
-                pdf_id = chunk.get("pdf_id")
-                try:
-                    pdf_file = PDFFile.objects.get(pk=pdf_id)
-                except PDFFile.DoesNotExist:
-                    continue  # Skip chunks referencing missing PDFs
-
-                evaluation_result = EvaluationResult(
-                    query=query,
-                    company=company,
-                    pdf_file=pdf_file,
-                    timestamp=timezone.now(),
-                    answer=chunk.get("answer"),
-                    report_year=chunk.get("report_year"),
-                    chunk_id=chunk.get("chunk_id"),
-                    chunk_type=chunk.get("chunk_type"),
-                    cosine_similarity=chunk.get("cosine_similarity"),
-                    confidence=chunk.get("confidence"),
-                    references=chunk.get("references"),
-                    model_version=chunk.get("provider")
-                )
-                evaluation_result.save()
-                saved_results.append(evaluation_result)
 
-            # Serialize the results
-            result_serializer = LLMDataPointSerializer(saved_results, many=True)
-            return Response(result_serializer.data)
+class LLMRunEvaluationView(APIView):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        except (CompanyProfile.DoesNotExist, Query.DoesNotExist) as e:
-            return Response({'error': f'Related object not found: {str(e)}'}, status=400)
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
+    def post(self, request):
+        """
+        Queues the RAG pipeline for a company and query and returns the job id immediately (202).
+        The results can be followed on the job's stream URL.
+        """
+        serializer = LLMQuerySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        job = Job.objects.create(kind='evaluation', params=dict(data))
+        if not _queue_job(
+            job, run_llm_evaluation_task,
+            company_id=data['company_id'], query_id=data['query_id'], query=data['query'],
+        ):
+            return Response({'error': 'Could not queue the evaluation task.', **_job_urls(job)}, status=503)
+        return Response({'status': 'queued', **_job_urls(job)}, status=status.HTTP_202_ACCEPTED)
 
 
 
@@ -423,6 +469,8 @@ def toggle_pdf_active(request):
         pdf = PDFFile.objects.get(id=pdf_id)
         pdf.active = use_for_analysis
         pdf.save()
+        # Only appends to the company index tombstone log, no index rebuild
+        sync_pdf_activation(pdf)
         return JsonResponse({'success': True})
     except PDFFile.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'PDF nicht gefunden'}, status=404)
@@ -446,6 +494,21 @@ class EvaluationResultViewSet(viewsets.ModelViewSet):
     serializer_class = EvaluationResultSerializer
     permission_classes = [IsAuthenticated]  # Requires authentication
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Create many results from a list in one transaction; related objects are looked up in bulk."""
+        serializer = EvaluationResultBatchItemSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        data_points = [
+            dict(item, company_id=item['company'], query_id=item['query'], pdf_id=item['pdf_file'])
+            for item in serializer.validated_data
+        ]
+        created, skipped = bulk_create_evaluation_results(data_points)
+        return Response(
+            {'created': len(created), 'skipped': skipped, 'ids': [result.id for result in created]},
+            status=status.HTTP_201_CREATED
+        )
+
 
 @csrf_exempt
 def toggle_company_active(request):
@@ -0,0 +1,141 @@
+"""
+File: web/backend/llm_module/artifacts.py
+
+Role:
+    Bookkeeping for the files the ingestion pipeline produces per file hash below
+    `MEDIA_ROOT/pipeline/<file_hash>/`: intermediate artifacts (chunks, embeddings) and one manifest per
+    embedding model recording a finished, successful index set. A PDF whose hash already has a manifest
+    for the current embedding model reuses those indexes instead of being parsed and embedded again
+    (the same report uploaded for several companies, or re-uploaded after deletion).
+    A lock in the shared cache keeps two workers from processing the same hash at the same time.
+
+Interactions:
+    - `pdf_preprocessor.py`: The ingestion stages look up, lock and record artifacts here.
+    - `processor.py`: Chunks of reused indexes still carry the `source_pdf_id` of the PDF they were
+      built for; `build_data_point` remaps it to the searched PDF.
+"""
+
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+PIPELINE_DIR = 'pipeline'  # below MEDIA_ROOT, one directory per file hash
+CHUNKS_ARTIFACT = 'chunks.pkl'
+EMBEDDINGS_ARTIFACT = 'embeddings.npy'
+INGESTION_LOCK_TIMEOUT = 2 * 60 * 60  # seconds; a crashed worker's lock expires after this
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+
+def embedding_model_name() -> str:
+    return getattr(settings, 'EMBEDDING_MODEL_NAME', DEFAULT_EMBEDDING_MODEL)
+
+
+def model_slug(model_name: str) -> str:
+    """File-name safe form of a model name, e.g. 'sentence-transformers/all-MiniLM-L6-v2'."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+
+
+def artifact_dir(file_hash: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, PIPELINE_DIR, file_hash)
+
+
+def write_artifact(path: str, write):
+    """Writes via a temporary file, so a retried or concurrent stage never reads a partial artifact."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def discard_intermediates(file_hash: str):
+    """
+    Removes the chunks and embeddings of a hash. They are only read by the later stages of the run that
+    wrote them; once its indexes and manifest exist, or the run failed for good, they are dead weight.
+    """
+    for name in (CHUNKS_ARTIFACT, EMBEDDINGS_ARTIFACT):
+        try:
+            os.remove(os.path.join(artifact_dir(file_hash), name))
+        except FileNotFoundError:
+            pass
+
+
+def manifest_path(file_hash: str, model_name: str) -> str:
+    return os.path.join(artifact_dir(file_hash), f"manifest.{model_slug(model_name)}.json")
+
+
+def find_artifacts(file_hash: str, model_name: str) -> Optional[Dict[str, Any]]:
+    """
+    The manifest of a finished index set for this hash and model, or None. Manifests whose index
+    files are gone are ignored.
+    """
+    try:
+        with open(manifest_path(file_hash, model_name), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    for key in ('chunk_vector_index_path', 'document_vector_index_path'):
+        path = manifest.get('fields', {}).get(key)
+        if path and not os.path.exists(os.path.join(settings.MEDIA_ROOT, path)):
+            return None
+    return manifest
+
+
+def record_artifacts(
+    file_hash: str, model_name: str, pdf_id: int, n_chunks: int, fields: Dict[str, Any], n_pages: Optional[int] = None
+):
+    """Records a successfully built index set; written last, after all index files exist."""
+    manifest = {
+        'file_hash': file_hash,
+        'embedding_model': model_name,
+        'built_for_pdf_id': pdf_id,
+        'n_chunks': n_chunks,
+        'n_pages': n_pages,
+        'fields': fields,
+        'created_at': timezone.now().isoformat(),
+    }
+    write_artifact(manifest_path(file_hash, model_name), lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')))
+
+
+def discard_artifacts(file_hash: str, model_name: str, built_before: Optional[datetime] = None) -> bool:
+    """
+    Removes the manifest, so the next ingestion of this hash builds the indexes again. With
+    `built_before`, newer manifests (e.g. built earlier in the same reindex run) are kept.
+    """
+    manifest = find_artifacts(file_hash, model_name)
+    if manifest is None:
+        return False
+    if built_before and datetime.fromisoformat(manifest['created_at']) >= built_before:
+        return False
+    try:
+        os.remove(manifest_path(file_hash, model_name))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _lock_key(file_hash: str, model_name: str) -> str:
+    return f"ingestion-lock:{file_hash}:{model_slug(model_name)}"
+
+
+def acquire_ingestion_lock(file_hash: str, model_name: str) -> Optional[str]:
+    """Returns a token if the lock was acquired, None if another worker holds it."""
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(file_hash, model_name), token, timeout=INGESTION_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_ingestion_lock(file_hash: str, model_name: str, token: str):
+    """Releases the lock if it is still held with `token` (it may have expired and been taken over)."""
+    key = _lock_key(file_hash, model_name)
+    if cache.get(key) == token:
+        cache.delete(key)
@@ -0,0 +1,209 @@
+"""
+File: web/backend/llm_module/company_index.py
+
+Role:
+    Maintains one chunk-level and one document-level vector store per company, built from the per-PDF
+    indexes written by `pdf_preprocessor.py`. Chunks of a PDF get the ids `pdf_id << 32 | ordinal`, so a
+    whole PDF can be removed or restored as one id range by appending a line to the stores' tombstone
+    logs, without loading or rewriting the index. Tombstoned vectors are dropped by a periodic
+    compaction task.
+
+    Adding a PDF and compacting load, change and rewrite the whole index. A lock per company in the shared
+    cache keeps two workers from doing so at the same time, which would silently drop the PDF of one of them.
+
+Interactions:
+    - `vector_store.py`: Uses `ChunkVectorStore`, `DocumentVectorStore` and `TombstoneLog`.
+    - `processor.py`: Searches the company index instead of the per-PDF indexes it contains.
+    - `pdf_preprocessor.py`: Queues `add_pdf_to_company_index_task` after a PDF was processed.
+    - `web/api/views.py` & `web/api/signals.py`: Call `sync_pdf_activation` when a PDF is activated,
+      deactivated or deleted.
+"""
+
+import os
+import glob
+import re
+import uuid
+from typing import Optional
+
+import numpy as np
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .vector_store import ChunkVectorStore, DocumentVectorStore, TombstoneLog, meta_path_for, tombstone_path_for
+
+PDF_ID_SHIFT = 32
+COMPANY_INDEX_LOCK_TIMEOUT = 30 * 60  # seconds; a crashed worker's lock expires after this
+COMPANY_INDEX_LOCK_RETRIES = 60  # 30 minutes at 30 s, matches COMPANY_INDEX_LOCK_TIMEOUT
+
+
+def pdf_chunk_id_range(pdf_id: int):
+    """Half-open id range [lo, hi) holding the chunks of `pdf_id` in a company index."""
+    return pdf_id << PDF_ID_SHIFT, (pdf_id + 1) << PDF_ID_SHIFT
+
+
+def acquire_company_index_lock(company_id: int) -> Optional[str]:
+    """Returns a token if the lock was acquired, None if another worker changes the company index."""
+    token = uuid.uuid4().hex
+    if cache.add(f"company-index-lock:{company_id}", token, timeout=COMPANY_INDEX_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_company_index_lock(company_id: int, token: str):
+    """Releases the lock if it is still held with `token` (it may have expired and been taken over)."""
+    key = f"company-index-lock:{company_id}"
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+class CompanyIndex:
+    def __init__(self, company_id: int, dim: Optional[int] = None, index_dir: str = None):
+        self.company_id = company_id
+        self.dim = dim
+        self.index_dir = index_dir or os.path.join(settings.MEDIA_ROOT, 'vector_indexes')
+        self.chunk_index_path = os.path.join(self.index_dir, f"company_{company_id}.faiss")
+        self.doc_index_path = os.path.join(self.index_dir, f"company_{company_id}.doc.faiss")
+        self._chunk_store = None
+        self._document_store = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.chunk_index_path) and os.path.exists(self.doc_index_path)
+
+    @property
+    def chunk_store(self) -> ChunkVectorStore:
+        if self._chunk_store is None:
+            self._chunk_store = ChunkVectorStore(
+                dim=self.dim, index_path=self.chunk_index_path, meta_path=meta_path_for(self.chunk_index_path)
+            )
+            self.dim = self._chunk_store.dim
+        return self._chunk_store
+
+    @property
+    def document_store(self) -> DocumentVectorStore:
+        if self._document_store is None:
+            store = DocumentVectorStore(dim=self.dim or self.chunk_store.dim)
+            if os.path.exists(self.doc_index_path):
+                store.load_index(self.doc_index_path, meta_path_for(self.doc_index_path))
+            self._document_store = store
+        return self._document_store
+
+    def add_pdf(self, pdf_id: int, pdf_chunk_store: ChunkVectorStore, document_vector: np.ndarray, replace: bool = False):
+        """
+        Copies the vectors of a per-PDF chunk store into the company stores. If the PDF is already
+        contained, it is only restored from its tombstones, unless `replace` is set (reprocessed PDF).
+        """
+        lo, hi = pdf_chunk_id_range(pdf_id)
+        if pdf_id in self.document_store.metas and not replace:
+            self.activate_pdf(pdf_id)
+            return
+
+        self.dim = self.dim or pdf_chunk_store.dim
+        self.chunk_store.discard_range(lo, hi)
+        self.document_store.discard_range(pdf_id, pdf_id + 1)
+
+        source_ids = pdf_chunk_store.ids()
+        vectors = pdf_chunk_store.vectors_for_ids(source_ids)
+        metas = [dict(pdf_chunk_store.metas[int(i)], source_pdf_id=pdf_id) for i in source_ids]
+        if len(metas):
+            self.chunk_store.add_with_ids(vectors, metas, lo + np.arange(len(metas), dtype='int64'))
+        self.document_store.add_document_vector(document_vector, {'pdf_id': pdf_id}, doc_id=pdf_id)
+
+        # Drop earlier tombstones of this PDF, its vectors are live again
+        self.chunk_store.restore_range(lo, hi)
+        self.document_store.restore_range(pdf_id, pdf_id + 1)
+        self.save()
+
+    def deactivate_pdf(self, pdf_id: int):
+        """Hides a PDF from searches by appending to the tombstone logs; the indexes are not loaded."""
+        if not self.exists():
+            return  # Nothing to hide, the add task checks `active` itself
+        lo, hi = pdf_chunk_id_range(pdf_id)
+        TombstoneLog(tombstone_path_for(self.chunk_index_path)).remove(lo, hi)
+        TombstoneLog(tombstone_path_for(self.doc_index_path)).remove(pdf_id, pdf_id + 1)
+
+    def activate_pdf(self, pdf_id: int) -> bool:
+        """
+        Restores a deactivated PDF whose vectors are still in the index. Returns False if they were
+        compacted away (or never added), in which case the PDF has to be added again.
+        """
+        if not self.exists() or pdf_id not in self.document_store.metas:
+            return False
+        lo, hi = pdf_chunk_id_range(pdf_id)
+        TombstoneLog(tombstone_path_for(self.chunk_index_path)).restore(lo, hi)
+        TombstoneLog(tombstone_path_for(self.doc_index_path)).restore(pdf_id, pdf_id + 1)
+        return True
+
+    def compact(self) -> int:
+        if not self.exists():
+            return 0
+        removed = self.chunk_store.compact()
+        self.document_store.compact()
+        return removed
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.chunk_store.save_index(self.chunk_index_path, meta_path_for(self.chunk_index_path))
+        self.document_store.save_index(self.doc_index_path, meta_path_for(self.doc_index_path))
+
+
+def sync_pdf_activation(pdf_file):
+    """
+    Mirrors `pdf_file.active` into its company index: deactivation and re-activation only touch the
+    tombstone logs, PDFs whose vectors were compacted away are queued to be added again.
+    """
+    company_index = CompanyIndex(pdf_file.company_id)
+    if not pdf_file.active:
+        company_index.deactivate_pdf(pdf_file.id)
+    elif not company_index.activate_pdf(pdf_file.id) and pdf_file.chunk_vector_index_path:
+        add_pdf_to_company_index_task.delay(pdf_file.id)
+
+
+@shared_task(bind=True)
+def add_pdf_to_company_index_task(self, pdf_id: int, replace: bool = False):
+    from api.models import PDFFile
+
+    pdf_file = PDFFile.objects.get(pk=pdf_id)
+    chunk_index_path = os.path.join(settings.MEDIA_ROOT, pdf_file.chunk_vector_index_path)
+    doc_index_path = os.path.join(settings.MEDIA_ROOT, pdf_file.document_vector_index_path)
+
+    pdf_chunk_store = ChunkVectorStore(
+        dim=None, index_path=chunk_index_path, meta_path=meta_path_for(chunk_index_path)
+    )
+
+    pdf_doc_store = DocumentVectorStore(dim=pdf_chunk_store.dim)
+    pdf_doc_store.load_index(doc_index_path, meta_path_for(doc_index_path))
+    document_vector = pdf_doc_store.vectors_for_ids(pdf_doc_store.ids()[:1])[0]
+
+    token = acquire_company_index_lock(pdf_file.company_id)
+    if not token:
+        # Another worker adds a PDF of the same company; the retry loads the index it wrote
+        raise self.retry(countdown=30, max_retries=COMPANY_INDEX_LOCK_RETRIES)
+    try:
+        company_index = CompanyIndex(pdf_file.company_id, dim=pdf_chunk_store.dim)
+        company_index.add_pdf(pdf_id, pdf_chunk_store, document_vector, replace=replace)
+        if not pdf_file.active:
+            company_index.deactivate_pdf(pdf_id)
+    finally:
+        release_company_index_lock(pdf_file.company_id, token)
+
+
+@shared_task
+def compact_vector_indexes_task():
+    """Periodic task: compacts every company index with too many tombstoned vectors."""
+    index_dir = os.path.join(settings.MEDIA_ROOT, 'vector_indexes')
+    for path in glob.glob(os.path.join(index_dir, 'company_*.faiss')):
+        match = re.fullmatch(r'company_(\d+)\.faiss', os.path.basename(path))
+        if not match:
+            continue
+        company_id = int(match.group(1))
+        token = acquire_company_index_lock(company_id)
+        if not token:
+            continue  # being changed, compacted on the next run
+        try:
+            company_index = CompanyIndex(company_id)
+            if company_index.exists() and company_index.chunk_store.needs_compaction():
+                removed = company_index.compact()
+                print(f"Compacted index of company {company_id}: dropped {removed} vectors.")
+        finally:
+            release_company_index_lock(company_id, token)
@@ -0,0 +1,142 @@
+"""
+File: web/backend/llm_module/evaluator.py
+
+Role:
+    This file contains the `LLMEvaluator`, the engine behind the dashboard's evaluation matrix. It
+    evaluates every active company against every active query: the query texts are embedded once for
+    the whole run, each company's PDF indexes are loaded once and searched with the full query
+    matrix, and the report years of all retrieved text chunks of a company are extracted in one
+    batched LLM call (a chunk's year does not depend on the query, so it is cached per chunk).
+    `input_fingerprint` hashes everything a (company, query) result depends on, so that unchanged
+    pairs can be skipped on re-evaluation.
+
+Interactions:
+    - `processor.py`: Uses `LLMProcessor.batch_retrieve` for retrieval and `build_data_point` to
+      produce the same result dicts as `rag_analyze`.
+    - `web/api/tasks.py`: `run_evaluation_matrix_task` drives the evaluator and stores the results
+      as `EvaluationResult` rows.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .processor import LLMProcessor
+
+
+class LLMEvaluator:
+    def __init__(self, processor: LLMProcessor, top_k: int = 5, extended_search: bool = True):
+        self.processor = processor
+        self.top_k = top_k
+        self.extended_search = extended_search
+        self._year_cache: Dict[str, Optional[int]] = {}  # chunk_id -> LLM-extracted year
+
+    @staticmethod
+    def plan(company_ids: Iterable[int], queries: List[Any]) -> List[Tuple[int, int]]:
+        """All (company_id, query_id) pairs of the evaluation matrix."""
+        return [(company_id, query.id) for company_id in company_ids for query in queries]
+
+    def model_versions(self) -> Dict[str, str]:
+        """Names of the embedding and LLM models used by the processor."""
+        def version(provider):
+            if provider is None:
+                return None
+            return getattr(provider, 'model_name', None) or provider.__class__.__name__
+        return {
+            "embedding_model": version(self.processor.embedding_provider),
+            "llm_model": version(self.processor.provider),
+        }
+
+    def input_fingerprint(self, query: Any, pdf_files: List[Any]) -> str:
+        """
+        SHA-256 over the inputs of one (company, query) pair: the active PDFs of the company with
+        their file hashes, the query text and edit time, the model versions and the retrieval settings.
+        """
+        payload = {
+            "pdfs": sorted((pdf_file.id, pdf_file.file_hash) for pdf_file in pdf_files),
+            "question": query.question,
+            "enriched_text": getattr(query, 'enriched_text', ''),
+            "last_edited": query.last_edited.isoformat() if getattr(query, 'last_edited', None) else None,
+            "top_k": self.top_k,
+            "extended_search": self.extended_search,
+            **self.model_versions(),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def evaluate_company(
+        self,
+        company_id: int,
+        queries: List[Any],
+        pdf_files: List[Any],
+        query_matrix: Optional[np.ndarray] = None
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Evaluates all `queries` against the PDFs of one company.
+
+        Returns {query_id: [data_point, ...]} with one data point per retrieved chunk, queries
+        without any retrieved chunk map to an empty list.
+        """
+        results = {query.id: [] for query in queries}
+        for _, pdf_results in self.iter_evaluate_company(company_id, queries, pdf_files, query_matrix):
+            for query_id, data_points in pdf_results.items():
+                results[query_id].extend(data_points)
+        return results
+
+    def iter_evaluate_company(
+        self,
+        company_id: int,
+        queries: List[Any],
+        pdf_files: List[Any],
+        query_matrix: Optional[np.ndarray] = None
+    ) -> Iterator[Tuple[Any, Dict[int, List[Dict[str, Any]]]]]:
+        """
+        Generator variant of `evaluate_company`: yields (pdf_file, {query_id: [data_point, ...]}) per
+        PDF, so that results can be stored while the remaining PDFs are searched.
+        """
+        if query_matrix is None and pdf_files:
+            query_matrix = self.processor.embed_queries(queries)
+
+        embedding_model = metrics.model_name(self.processor.embedding_provider)
+        for pdf_file in pdf_files:
+            with metrics.timed(metrics.STAGE_SECONDS, stage='batch_retrieve', model=embedding_model):
+                retrieved = self.processor.batch_retrieve(
+                    queries,
+                    [pdf_file],
+                    top_k=self.top_k,
+                    extended_search=self.extended_search,
+                    query_matrix=query_matrix,
+                )
+            self._extract_text_years(chunk_meta for rows in retrieved.values() for chunk_meta, _ in rows)
+
+            pdf_results = {}
+            for (query_id, _), rows in retrieved.items():
+                pdf_results[query_id] = [
+                    self.processor.build_data_point(
+                        company_id, query_id, pdf_file, chunk_meta, cosine_sim,
+                        self.processor.resolve_report_year(
+                            chunk_meta, pdf_file, self._year_cache.get(chunk_meta.get("chunk_id"))
+                        )
+                    )
+                    for chunk_meta, cosine_sim in rows
+                ]
+            yield pdf_file, pdf_results
+
+    def _extract_text_years(self, chunk_metas: Iterable[Dict[str, Any]]):
+        """Extracts the years of all not yet seen text chunks in one batched LLM call."""
+        pending = {}
+        hits = 0
+        for chunk_meta in chunk_metas:
+            chunk_id = chunk_meta.get("chunk_id")
+            if chunk_meta.get("chunk_type") != "text":
+                continue
+            if chunk_id in self._year_cache:
+                hits += 1
+            else:
+                pending[chunk_id] = chunk_meta.get("text", "")
+        metrics.count_cache('report_year', hits=hits, misses=len(pending))
+        if pending:
+            years = self.processor.extract_report_years_from_text_chunks(list(pending.values()))
+            self._year_cache.update(zip(pending.keys(), years))
@@ -0,0 +1,87 @@
+"""
+File: web/backend/llm_module/ingestion_queue.py
+
+Role:
+    Priorities and metrics of the PDF ingestion queues. Manual uploads are queued ahead of webscraped
+    PDFs, and a company's webscraped PDFs drop one priority level for every `FAIRNESS_STEP` of its PDFs
+    that are already waiting, so one large crawl cannot starve the PDFs of other companies. Reindex runs
+    get the lowest priority. How long PDFs waited before their first stage started is sampled per source
+    in the cache; the dashboard shows these wait times next to the queue depths.
+
+    Priorities follow the Redis transport (`CELERY_BROKER_TRANSPORT_OPTIONS`): 0 is served first, 9 last.
+
+Interactions:
+    - `pdf_preprocessor.py`: `ingestion_pipeline` sends every stage with the priority, `parse_pdf_stage`
+      records the wait.
+    - `web/api/signals.py`: Computes the priority of a new PDFFile from its source and company backlog.
+    - `web/api/views.py`: `DashboardView` shows `queue_depths()` and `wait_stats()`.
+"""
+
+from typing import Dict, Optional
+
+from django.core.cache import cache
+
+MANUAL_PRIORITY = 0
+SCRAPED_PRIORITY = 3
+BULK_PRIORITY = 9  # reindex runs, below every scraped PDF
+FAIRNESS_STEP = 10  # waiting webscraped PDFs of the same company per lost priority level
+
+INGESTION_QUEUES = ('cpu', 'model', 'celery')
+WAIT_SOURCES = ('manual', 'webscraped', 'reindex')
+WAIT_SAMPLES = 200  # most recent waits kept per source
+
+
+def ingestion_priority(source: str, company_backlog: int = 0) -> int:
+    """Priority of a PDF's pipeline; `company_backlog` is the number of the company's PDFs already waiting."""
+    if source == 'manual':
+        return MANUAL_PRIORITY
+    if source == 'reindex':
+        return BULK_PRIORITY
+    return min(SCRAPED_PRIORITY + company_backlog // FAIRNESS_STEP, BULK_PRIORITY - 1)
+
+
+def _wait_key(source: str) -> str:
+    return f"ingestion-wait:{source}"
+
+
+def record_wait(source: str, seconds: float):
+    # Read-modify-write without a lock: a sample lost to a concurrent write does not matter for the stats
+    samples = cache.get(_wait_key(source), [])
+    samples.append(round(seconds, 2))
+    cache.set(_wait_key(source), samples[-WAIT_SAMPLES:], timeout=None)
+
+
+def wait_stats() -> Dict[str, Optional[Dict[str, float]]]:
+    """{source: {'n', 'avg', 'p95', 'max'} in seconds} over the recent samples, None for sources without any."""
+    stats = {}
+    for source in WAIT_SOURCES:
+        samples = sorted(cache.get(_wait_key(source), []))
+        if not samples:
+            stats[source] = None
+            continue
+        stats[source] = {
+            'n': len(samples),
+            'avg': round(sum(samples) / len(samples), 1),
+            'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'max': samples[-1],
+        }
+    return stats
+
+
+def queue_depths() -> Dict[str, Optional[int]]:
+    """Messages waiting per ingestion queue (all priorities), None for all queues if the broker is unreachable."""
+    from celery import current_app
+
+    depths = {name: None for name in INGESTION_QUEUES}
+    try:
+        with current_app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=1)
+            channel = conn.default_channel
+            for name in INGESTION_QUEUES:
+                try:
+                    depths[name] = channel.queue_declare(queue=name, passive=True).message_count
+                except Exception:
+                    depths[name] = 0  # Redis drops empty queues
+    except Exception as e:
+        print(f"Could not read queue depths: {e}")
+    return depths
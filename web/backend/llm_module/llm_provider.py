@@ -34,6 +34,12 @@ class LLMProviderInterface(ABC):
         """
         pass
 
+    def generate_batch(self, prompts, **kwargs) -> list:
+        """
+        Generate responses for several prompts. Providers that can batch inference should override this.
+        """
+        return [self.generate(prompt, **kwargs) for prompt in prompts]
+
 
 # === Interface for Embedding Providers ===
 class EmbeddingProviderInterface(ABC):
@@ -48,14 +54,24 @@ class EmbeddingProviderInterface(ABC):
 
 # === Concrete LLM Provider ===
 class HuggingFaceLLMProvider(LLMProviderInterface):
-    def __init__(self, model_name="deepset/roberta-base-squad2", task="question-answering", device=0, **kwargs):
+    DEFAULT_MODEL = "deepset/roberta-base-squad2"
+
+    def __init__(self, model_name=DEFAULT_MODEL, task="question-answering", device=0, **kwargs):
         self.generator = pipeline(task, model=model_name, device=device, **kwargs)
         self.model_name = model_name
 
     def generate(self, prompt, **kwargs):
         result = self.generator(prompt, **kwargs)
-        text = result[0].get('generated_text') or result[0].get('summary_text') or str(result[0])
+        return self._to_response(result[0], kwargs.get('max_new_tokens', 256))
+
+    def generate_batch(self, prompts, batch_size=8, **kwargs):
+        outputs = self.generator(list(prompts), batch_size=batch_size, **kwargs)
         max_len = kwargs.get('max_new_tokens', 256)
+        # Pipelines return one list of candidates per prompt for generation tasks, a dict otherwise
+        return [self._to_response(out[0] if isinstance(out, list) else out, max_len) for out in outputs]
+
+    def _to_response(self, output, max_len):
+        text = output.get('generated_text') or output.get('summary_text') or str(output)
         conf = min(len(text) / max_len, 1.0) if max_len else 1.0
         return {
             'text': text,
@@ -0,0 +1,104 @@
+"""
+File: web/backend/llm_module/metrics.py
+
+Role:
+    Prometheus metrics of the LLM pipeline: histograms for the duration of each ingestion and retrieval
+    stage, parse time per page, chunks per PDF, embedding and LLM call latency, vector index load and
+    search latency, and counters for cache hits and misses. Model-bound metrics carry a `model` label,
+    pipeline metrics a `stage` label.
+
+    The Django process serves them at `/metrics/` (`MetricsView`); every Celery worker serves them on
+    `WORKER_METRICS_PORT` (see `api/celery.py`). With several processes per server (gunicorn, Celery
+    prefork) set `PROMETHEUS_MULTIPROC_DIR` to an empty directory before start, so that the served metrics
+    aggregate over all processes of that server.
+
+Interactions:
+    - `pdf_preprocessor.py`, `processor.py`, `evaluator.py`: Record their stages with `timed()`.
+    - `web/api/views.py`, `web/api/celery.py`: Expose the metrics via `render()` and `start_worker_server()`.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    'esg_pipeline_stage_seconds', 'Duration of one pipeline stage for one PDF or query',
+    ['stage', 'model'], buckets=LATENCY_BUCKETS,
+)
+PARSE_SECONDS_PER_PAGE = Histogram(
+    'esg_pdf_parse_seconds_per_page', 'Parse time of a PDF divided by its page count',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CHUNKS_PER_PDF = Histogram(
+    'esg_pdf_chunks', 'Chunks extracted per PDF', ['chunk_type'],
+    buckets=(0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+EMBEDDING_SECONDS = Histogram(
+    'esg_embedding_batch_seconds', 'Latency of one embedding call', ['model', 'stage'], buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_TEXTS = Counter('esg_embedding_texts_total', 'Texts embedded', ['model', 'stage'])
+LLM_CALL_SECONDS = Histogram(
+    'esg_llm_call_seconds', 'Latency of one (batched) LLM call', ['model', 'stage'], buckets=LATENCY_BUCKETS,
+)
+INDEX_LOAD_SECONDS = Histogram(
+    'esg_vector_index_load_seconds', 'Time to load a FAISS index and its metadata', ['kind'], buckets=LATENCY_BUCKETS,
+)
+INDEX_SEARCH_SECONDS = Histogram(
+    'esg_vector_index_search_seconds', 'Latency of one (batched) FAISS search', ['kind'], buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter('esg_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result'])
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observes the duration of the block on `histogram`, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+
+def count_cache(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        CACHE_REQUESTS.labels(cache=cache, result='hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache=cache, result='miss').inc(misses)
+
+
+def model_name(provider) -> str:
+    """Label value for a provider: its model name, else its class name."""
+    if provider is None:
+        return 'none'
+    return getattr(provider, 'model_name', None) or provider.__class__.__name__
+
+
+def registry():
+    """The aggregate over all processes in multiprocess mode, else this process' registry."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        aggregate = CollectorRegistry()
+        multiprocess.MultiProcessCollector(aggregate)
+        return aggregate
+    return REGISTRY
+
+
+def render():
+    """(body, content type) of the Prometheus text format."""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def start_worker_server(port: int):
+    start_http_server(port, registry=registry())
+
+
+def mark_process_dead(pid: int):
+    """Drops the live gauges of an exited process in multiprocess mode."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -1,8 +1,13 @@
 import hashlib
-from typing import List, Dict, Any, Optional
+import os
+from typing import List, Dict, Any, Iterator, Optional
 import pdfplumber
 import pandas as pd
 
+DEFAULT_MAX_PAGES = 1500
+DEFAULT_MAX_BYTES = 150 * 1024 * 1024
+DEFAULT_PAGE_WINDOW = 200
+
 class PDFParser:
     """
     PDFParser extracts and chunks content from PDF files, supporting two main formats:
@@ -25,18 +30,80 @@ class PDFParser:
         - row_labels (List[str]): Row labels (for tables only).
         - values (List[str]): Corresponding row values (for tables only).
         - embedding (List[float], optional): Vector embedding if enabled.
+
+    Memory stays bounded for very large reports: pages are read in windows of `page_window` pages
+    (the PDF is reopened per window, which drops pdfminer's object cache) and each page's cached
+    layout objects are released after use. PDFs beyond the limits are degraded instead of rejected:
+    only the first `max_pages` pages are parsed, and files above `max_bytes` are parsed without tables.
     """
 
-    def __init__(self, overlap: int = 1, embedding_provider=None):
+    def __init__(
+        self,
+        overlap: int = 1,
+        embedding_provider=None,
+        max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        page_window: Optional[int] = DEFAULT_PAGE_WINDOW
+    ):
         """
         Initialize the PDFParser.
 
         Args:
             overlap (int): Number of overlapping paragraphs between chunks.
             embedding_provider: Optional embedding provider with `.encode(List[str]) -> List[List[float]]`.
+            max_pages (int, optional): Only the first `max_pages` pages are parsed, None = all.
+            max_bytes (int, optional): Tables are not extracted from larger files, None = no limit.
+            page_window (int, optional): Pages per opened window, None = all pages in one window.
         """
         self.overlap = overlap
         self.embedding_provider = embedding_provider
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.page_window = page_window
+
+    def page_limit(self, pdf_path: str) -> int:
+        """
+        Number of pages to parse: all pages, or the first `max_pages` of longer PDFs.
+        """
+        with pdfplumber.open(pdf_path) as pdf:
+            n_pages = len(pdf.pages)
+        if self.max_pages and n_pages > self.max_pages:
+            print(f"{pdf_path} has {n_pages} pages, only the first {self.max_pages} are parsed.")
+            return self.max_pages
+        return n_pages
+
+    def tables_enabled(self, pdf_path: str) -> bool:
+        """
+        Whether tables are extracted; table extraction is skipped for files above `max_bytes`.
+        """
+        size = os.path.getsize(pdf_path)
+        if self.max_bytes and size > self.max_bytes:
+            print(f"{pdf_path} has {size / 2**20:.0f} MiB, tables are not extracted (limit {self.max_bytes / 2**20:.0f} MiB).")
+            return False
+        return True
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Any]:
+        """
+        Yields the pdfplumber pages within the page limit, one window of `page_window` pages open at a time.
+        A page's cached objects are released as soon as the caller asks for the next page, so callers
+        must not keep page objects around.
+
+        Args:
+            pdf_path (str): Path to the PDF file.
+
+        Returns:
+            Iterator[pdfplumber.page.Page]: The pages in order, `page.page_number` is 1-based.
+        """
+        n_pages = self.page_limit(pdf_path)
+        window = self.page_window or n_pages or 1
+        for start in range(1, n_pages + 1, window):
+            page_numbers = list(range(start, min(start + window, n_pages + 1)))
+            with pdfplumber.open(pdf_path, pages=page_numbers) as pdf:
+                for page in pdf.pages:
+                    try:
+                        yield page
+                    finally:
+                        page.close()
 
     def _generate_chunk_id(self, pdf_id: int, chunk_type: str, page_num: int, text: str) -> str:
         """
@@ -69,20 +136,19 @@ class PDFParser:
                 - para_idx (int)
         """
         paragraphs = []
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text(x_tolerance=2, y_tolerance=2)
-                if not text:
-                    continue
-                raw_paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-                for idx, para in enumerate(raw_paragraphs):
-                    bbox = page.bbox
-                    paragraphs.append({
-                        'text': para,
-                        'page_num': page_num,
-                        'bbox': bbox,
-                        'para_idx': idx
-                    })
+        for page in self.iter_pages(pdf_path):
+            text = page.extract_text(x_tolerance=2, y_tolerance=2)
+            if not text:
+                continue
+            raw_paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+            for idx, para in enumerate(raw_paragraphs):
+                bbox = page.bbox
+                paragraphs.append({
+                    'text': para,
+                    'page_num': page.page_number,
+                    'bbox': bbox,
+                    'para_idx': idx
+                })
         return paragraphs
 
     def chunk_paragraphs(
@@ -194,60 +260,63 @@ class PDFParser:
             page = para['page_num']
             paragraphs_by_page.setdefault(page, []).append(para)
 
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                raw_tables = page.extract_tables()
-                if not raw_tables:
+        if not self.tables_enabled(pdf_path):
+            return table_chunks
+
+        for page in self.iter_pages(pdf_path):
+            page_num = page.page_number
+            raw_tables = page.extract_tables()
+            if not raw_tables:
+                continue
+
+            all_paras = paragraphs_by_page.get(page_num, [])
+            context_before = all_paras[-1]['text'] if all_paras else ""
+            context_after = all_paras[0]['text'] if all_paras else ""
+
+            for table in raw_tables:
+                if not table or len(table) < 2:
+                    continue
+
+                df = pd.DataFrame(table[1:], columns=table[0])
+                if df.empty or df.shape[1] < 2:
+                    continue
+
+                year_columns = [col for col in df.columns if str(col).isdigit() and 1900 < int(col) < 2100]
+                if not year_columns:
                     continue
 
-                all_paras = paragraphs_by_page.get(page_num, [])
-                context_before = all_paras[-1]['text'] if all_paras else ""
-                context_after = all_paras[0]['text'] if all_paras else ""
-
-                for table in raw_tables:
-                    if not table or len(table) < 2:
-                        continue
-
-                    df = pd.DataFrame(table[1:], columns=table[0])
-                    if df.empty or df.shape[1] < 2:
-                        continue
-
-                    year_columns = [col for col in df.columns if str(col).isdigit() and 1900 < int(col) < 2100]
-                    if not year_columns:
-                        continue
-
-                    for year in year_columns:
-                        year_val = int(year)
-                        row_labels = []
-                        values = []
-                        text_lines = [f"Year: {year_val}"]
-
-                        for _, row in df.iterrows():
-                            label = row[df.columns[0]]
-                            value = row[year]
-                            row_labels.append(label)
-                            values.append(value)
-                            text_lines.append(f"{label}: {value}")
-
-                        chunk_text = '\n'.join(text_lines)
-                        full_text = f"{context_before}\n\n{chunk_text}\n\n{context_after}"
-
-                        chunk = {
-                            'chunk_id': self._generate_chunk_id(pdf_id or 0, 'table_column', page_num, chunk_text),
-                            'source_pdf_id': pdf_id,
-                            'chunk_type': 'table_column',
-                            'page_nums': [page_num],
-                            'bbox_list': [page.bbox],
-                            'para_indices': [],
-                            'text': chunk_text.strip(),
-                            'context_before': context_before,
-                            'context_after': context_after,
-                            'year': year_val,
-                            'row_labels': row_labels,
-                            'values': values
-                        }
-
-                        table_chunks.append(chunk)
+                for year in year_columns:
+                    year_val = int(year)
+                    row_labels = []
+                    values = []
+                    text_lines = [f"Year: {year_val}"]
+
+                    for _, row in df.iterrows():
+                        label = row[df.columns[0]]
+                        value = row[year]
+                        row_labels.append(label)
+                        values.append(value)
+                        text_lines.append(f"{label}: {value}")
+
+                    chunk_text = '\n'.join(text_lines)
+                    full_text = f"{context_before}\n\n{chunk_text}\n\n{context_after}"
+
+                    chunk = {
+                        'chunk_id': self._generate_chunk_id(pdf_id or 0, 'table_column', page_num, chunk_text),
+                        'source_pdf_id': pdf_id,
+                        'chunk_type': 'table_column',
+                        'page_nums': [page_num],
+                        'bbox_list': [page.bbox],
+                        'para_indices': [],
+                        'text': chunk_text.strip(),
+                        'context_before': context_before,
+                        'context_after': context_after,
+                        'year': year_val,
+                        'row_labels': row_labels,
+                        'values': values
+                    }
+
+                    table_chunks.append(chunk)
 
         if embed and self.embedding_provider:
             texts = [c['text'] for c in table_chunks]
@@ -1,59 +1,193 @@
 import os
 import pickle
+import time
 import numpy as np
 from typing import Dict, List, Any
 from pypdf import PdfReader
 from datetime import datetime
 
-from celery import shared_task
+from celery import Task, chain, shared_task
 
 from django.conf import settings
 
-from .parser import PDFParser
+from .parser import DEFAULT_MAX_BYTES, DEFAULT_MAX_PAGES, DEFAULT_PAGE_WINDOW, PDFParser
 from .vector_store import ChunkVectorStore, DocumentVectorStore
 from .llm_provider import SentenceTransformersEmbeddingProvider, HuggingFaceLLMProvider, LLMProviderInterface, EmbeddingProviderInterface
 from .processor import LLMProcessor
-from .utils import get_api_client
+from .company_index import add_pdf_to_company_index_task
+from .pdf_store import PDFStoreInterface, get_pdf_store
+from .ingestion_queue import record_wait
+from . import metrics
+from .artifacts import (
+    CHUNKS_ARTIFACT, EMBEDDINGS_ARTIFACT, acquire_ingestion_lock, artifact_dir, discard_intermediates,
+    embedding_model_name, find_artifacts, model_slug, record_artifacts, release_ingestion_lock, write_artifact
+)
+
+INGESTION_LOCK_WAIT = 30  # seconds between two attempts to take the ingestion lock of a hash
+INGESTION_LOCK_RETRIES = 240  # 2 hours at 30 s, matches INGESTION_LOCK_TIMEOUT
+
 
 class PDFPreprocessor:
-    def __init__(self, embedding_provider: EmbeddingProviderInterface = None, llm_provider: LLMProviderInterface = None):
-        self.embedding_provider = embedding_provider or SentenceTransformersEmbeddingProvider()
-        self.llm_provider = llm_provider or HuggingFaceLLMProvider()
-        self.llm_processor = LLMProcessor(provider=self.llm_provider)
-        self.parser = PDFParser(embedding_provider=self.embedding_provider)
+    """
+    Turns a PDF into its chunk and document vector indexes. The steps can be run one after another
+    (`process_and_embed_pdf`) or as separate pipeline stages, see the stage tasks below. The models are
+    only loaded by the steps that need them, so parsing workers never load them.
+    """
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProviderInterface = None,
+        llm_provider: LLMProviderInterface = None,
+        pdf_store: PDFStoreInterface = None
+    ):
+        self.pdf_store = pdf_store or get_pdf_store()
+        self._embedding_provider = embedding_provider
+        self._llm_provider = llm_provider
+        self.parser = PDFParser(
+            max_pages=getattr(settings, 'PDF_MAX_PAGES', DEFAULT_MAX_PAGES),
+            max_bytes=getattr(settings, 'PDF_MAX_BYTES', DEFAULT_MAX_BYTES),
+            page_window=getattr(settings, 'PDF_PAGE_WINDOW', DEFAULT_PAGE_WINDOW),
+        )
         self.index_dir = os.path.join(settings.MEDIA_ROOT, 'vector_indexes')
         os.makedirs(self.index_dir, exist_ok=True)
 
-    def process_and_embed_pdf(self, pdf_id: int, pdf_path: str):
+    @property
+    def embedding_provider(self) -> EmbeddingProviderInterface:
+        if self._embedding_provider is None:
+            self._embedding_provider = SentenceTransformersEmbeddingProvider(model_name=embedding_model_name())
+        return self._embedding_provider
+
+    @property
+    def embedding_model(self) -> str:
+        """Model name the indexes are built with, known without loading the model."""
+        if self._embedding_provider is not None:
+            return getattr(self._embedding_provider, 'model_name', embedding_model_name())
+        return embedding_model_name()
+
+    @property
+    def llm_model(self) -> str:
+        """Model name the report year is inferred with, known without loading the model."""
+        if self._llm_provider is not None:
+            return metrics.model_name(self._llm_provider)
+        return HuggingFaceLLMProvider.DEFAULT_MODEL
+
+    @property
+    def llm_processor(self) -> LLMProcessor:
+        if self._llm_provider is None:
+            self._llm_provider = HuggingFaceLLMProvider()
+        return LLMProcessor(provider=self._llm_provider)
+
+    def process_and_embed_pdf(self, pdf_id: int, pdf_path: str) -> Dict[str, Any]:
+        """
+        Builds and saves the chunk and document indexes of a PDF. Returns the PDFFile fields to
+        update (index paths, report year); the caller writes them together with the status.
+        """
         print(f"Starting pre-processing for PDF: {pdf_path}")
 
-        paragraphs = self.parser.parse_pdf(pdf_path)
-        if not paragraphs:
+        chunks = self.parse(pdf_id, pdf_path)
+        if not chunks:
             print(f"No text could be extracted from {pdf_path}. Skipping.")
-            return
+            return {}
 
-        text_chunks = self.parser.chunk_paragraphs(paragraphs, embed=True)
-        table_chunks = self.parser.extract_table_chunks(pdf_path, paragraphs, pdf_id=pdf_id, embed=True)
+        file_hash = self.pdf_store.get_file_hash(pdf_id)
+        if not file_hash:
+            raise ValueError(f"Could not retrieve file hash for PDFFile {pdf_id}")
 
-        all_chunks = text_chunks + table_chunks
-        vectors = np.array([c.pop('embedding') for c in all_chunks]).astype('float32')
-        metas = all_chunks
+        fields = self.build_indexes(pdf_id, file_hash, self.embed(chunks), chunks)
+        fields['report_year'] = self.infer_year(pdf_path)
+        fields['embedding_model'] = self.embedding_model
+        return fields
+
+    def index_pdf(self, pdf_id: int, pdf_path: str, file_hash: str) -> Dict[str, Any]:
+        """
+        Synchronous counterpart of the ingestion pipeline, used for bulk reindexing: reuses the finished
+        index set of the hash if there is one, otherwise builds and records it. Returns the PDFFile
+        fields and the work done as {'fields', 'n_pages', 'n_chunks', 'reused'}; the caller writes the fields.
+        """
+        model_name = self.embedding_model
+        lock_token = manifest = None
+        for attempt in range(INGESTION_LOCK_RETRIES + 1):
+            # After taking the lock the manifest is looked up once more, it may have finished in the meantime
+            manifest = find_artifacts(file_hash, model_name)
+            if manifest or lock_token:
+                break
+            lock_token = acquire_ingestion_lock(file_hash, model_name)
+            if not lock_token and attempt < INGESTION_LOCK_RETRIES:
+                time.sleep(INGESTION_LOCK_WAIT)  # another worker processes the same file, wait for its manifest
+
+        if manifest:
+            if lock_token:
+                release_ingestion_lock(file_hash, model_name, lock_token)
+            metrics.count_cache('ingestion_artifacts', hits=1)
+            return {'fields': manifest['fields'], 'n_pages': 0, 'n_chunks': 0, 'reused': True}
+        if not lock_token:
+            # Like the retries of the parse stage: the caller reports the PDF as failed
+            raise TimeoutError(
+                f"File hash {file_hash} stayed locked by another worker for "
+                f"{INGESTION_LOCK_RETRIES * INGESTION_LOCK_WAIT} s"
+            )
 
-        chunk_dim = self.embedding_provider.model.get_sentence_embedding_dimension()
+        metrics.count_cache('ingestion_artifacts', misses=1)
+        try:
+            n_pages = count_pages(pdf_path)
+            chunks = self.parse(pdf_id, pdf_path, n_pages=n_pages)
+            fields = {}
+            if chunks:
+                fields = self.build_indexes(pdf_id, file_hash, self.embed(chunks), chunks)
+                fields['report_year'] = self.infer_year(pdf_path)
+                fields['embedding_model'] = model_name
+                record_artifacts(file_hash, model_name, pdf_id, len(chunks), fields, n_pages=n_pages)
+            else:
+                print(f"No text could be extracted from {pdf_path}.")
+            return {'fields': fields, 'n_pages': n_pages, 'n_chunks': len(chunks), 'reused': False}
+        finally:
+            release_ingestion_lock(file_hash, model_name, lock_token)
+
+    # --- Pipeline steps ---
+
+    def parse(self, pdf_id: int, pdf_path: str, n_pages: int = None) -> List[Dict[str, Any]]:
+        """
+        Text and table chunks of the PDF, without embeddings (CPU-bound, pdfplumber).
+        `n_pages` is only used for the parse time per page metric.
+        """
+        start = time.perf_counter()
+        with metrics.timed(metrics.STAGE_SECONDS, stage='parse', model=self.embedding_model):
+            paragraphs = self.parser.parse_pdf(pdf_path)
+            text_chunks, table_chunks = [], []
+            if paragraphs:
+                text_chunks = self.parser.chunk_paragraphs(paragraphs, pdf_id=pdf_id)
+                table_chunks = self.parser.extract_table_chunks(pdf_path, paragraphs, pdf_id=pdf_id)
+        if n_pages:
+            metrics.PARSE_SECONDS_PER_PAGE.observe((time.perf_counter() - start) / n_pages)
+        metrics.CHUNKS_PER_PDF.labels(chunk_type='text').observe(len(text_chunks))
+        metrics.CHUNKS_PER_PDF.labels(chunk_type='table_column').observe(len(table_chunks))
+        return text_chunks + table_chunks
+
+    def embed(self, chunks: List[Dict[str, Any]]) -> np.ndarray:
+        """One embedding call for all chunks of the PDF (model-bound)."""
+        model = self.embedding_model
+        metrics.EMBEDDING_TEXTS.labels(model=model, stage='ingestion').inc(len(chunks))
+        with metrics.timed(metrics.EMBEDDING_SECONDS, model=model, stage='ingestion'), \
+                metrics.timed(metrics.STAGE_SECONDS, stage='embed', model=model):
+            return np.asarray(self.embedding_provider.encode([c['text'] for c in chunks])).astype('float32')
+
+    def build_indexes(self, pdf_id: int, file_hash: str, vectors: np.ndarray, metas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Writes the chunk- and document-level FAISS indexes and returns their paths relative to MEDIA_ROOT.
+        The files are named by file hash and embedding model, so identical PDFs can share them.
+        """
+        with metrics.timed(metrics.STAGE_SECONDS, stage='build_index', model=self.embedding_model):
+            return self._build_indexes(pdf_id, file_hash, vectors, metas)
+
+    def _build_indexes(self, pdf_id: int, file_hash: str, vectors: np.ndarray, metas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        chunk_dim = vectors.shape[1]
+        index_name = f"{file_hash}.{model_slug(self.embedding_model)}"
 
         # --- Chunk-level FAISS index ---
         chunk_store = ChunkVectorStore(dim=chunk_dim)
         chunk_store.add_chunk_vectors(vectors, metas)
 
-        api_client = get_api_client()
-        hash_response = api_client.get(f'/api/pdffiles/{pdf_id}/file_hash/')
-        file_hash = hash_response.json().get('file_hash') if hash_response.status_code == 200 else None
-
-        if not file_hash:
-            raise ValueError(f"Could not retrieve file hash for PDFFile {pdf_id}")
-
-        index_filename = f"{file_hash}.faiss"
-        meta_filename = f"{file_hash}.meta"
+        index_filename = f"{index_name}.faiss"
+        meta_filename = f"{index_name}.meta"
         index_filepath = os.path.join(self.index_dir, index_filename)
         meta_filepath = os.path.join(self.index_dir, meta_filename)
 
@@ -66,8 +200,8 @@ class PDFPreprocessor:
         document_store = DocumentVectorStore(dim=chunk_dim)
         document_store.add_document_vector(document_embedding, {'pdf_id': pdf_id})
 
-        doc_index_filename = f"{file_hash}.doc.faiss"
-        doc_meta_filename = f"{file_hash}.doc.meta"
+        doc_index_filename = f"{index_name}.doc.faiss"
+        doc_meta_filename = f"{index_name}.doc.meta"
         doc_index_filepath = os.path.join(self.index_dir, doc_index_filename)
         doc_meta_filepath = os.path.join(self.index_dir, doc_meta_filename)
 
@@ -75,47 +209,187 @@ class PDFPreprocessor:
 
         relative_doc_index_path = os.path.join('vector_indexes', doc_index_filename)
 
-        report_year = infer_report_year(pdf_path, self.llm_processor)
-
-        patch_response = api_client.patch(
-            f'/api/pdffiles/{pdf_id}/',
-            {
-                'chunk_vector_index_path': relative_chunk_index_path,
-                'document_vector_index_path': relative_doc_index_path,
-                'report_year': report_year
-            }
+        return {
+            'chunk_vector_index_path': relative_chunk_index_path,
+            'document_vector_index_path': relative_doc_index_path,
+        }
+
+    def infer_year(self, pdf_path: str):
+        # The LLM is only loaded if the PDF metadata has no creation date
+        with metrics.timed(metrics.STAGE_SECONDS, stage='infer_year', model=self.llm_model):
+            year = get_pdf_creation_year(pdf_path)
+            return year if year else infer_report_year(pdf_path, self.llm_processor)
+
+
+# === Ingestion pipeline ===
+# parse (cpu) -> embed (model) -> index (cpu) -> year (model). Each stage is its own task with its own
+# retries; the stages pass a small JSON state along the chain and exchange the bulky data through files
+# under MEDIA_ROOT/pipeline/<file_hash>/, which are deleted once the indexes are recorded or the pipeline
+# failed. The queues are set up in CELERY_TASK_ROUTES.
+# If the hash already has finished indexes for the embedding model (see artifacts.py), the parse stage
+# marks the state as `reused` and the later stages only write the PDFFile fields.
+# All stages of a PDF are sent with the same priority, see ingestion_queue.py.
+
+_preprocessor = None
+
+
+def get_preprocessor() -> PDFPreprocessor:
+    """One preprocessor per worker process, so models are loaded once per worker."""
+    global _preprocessor
+    if _preprocessor is None:
+        _preprocessor = PDFPreprocessor()
+    return _preprocessor
+
+
+class IngestionStageTask(Task):
+    autoretry_for = (Exception,)
+    retry_backoff = 30
+    retry_backoff_max = 60 * 10
+    retry_kwargs = {'max_retries': 3}
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # Retries are exhausted, the PDF stays failed until it is reprocessed
+        state = args[0] if args else kwargs.get('state', {})
+        if not isinstance(state, dict):
+            state = {}
+        pdf_id = state.get('pdf_id')
+        print(f"Ingestion stage {self.name} failed for PDF {pdf_id}: {exc}")
+        if state.get('lock_token'):
+            # Only the run holding the lock writes intermediates; the next attempt starts from the PDF
+            discard_intermediates(state['file_hash'])
+            release_ingestion_lock(state['file_hash'], state['embedding_model'], state['lock_token'])
+        if pdf_id is not None:
+            try:
+                get_pdf_store().update(pdf_id, processing_status='failed')
+            except Exception as store_err:
+                print(f"Failed to update failure status for PDF {pdf_id}: {store_err}")
+
+
+def _reused_state(state: Dict[str, Any], manifest: Dict[str, Any]) -> Dict[str, Any]:
+    print(f"Reusing indexes of file hash {state['file_hash']} built for PDF {manifest['built_for_pdf_id']}.")
+    return {**state, 'reused': True, 'n_chunks': manifest['n_chunks'], 'fields': manifest['fields']}
+
+
+@shared_task(base=IngestionStageTask, bind=True)
+def parse_pdf_stage(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    pdf_id, pdf_path = state['pdf_id'], state['pdf_path']
+    print(f"Starting pre-processing for PDF: {pdf_path}")
+    if state.get('queued_at') and not self.request.retries:
+        record_wait(state.get('source', 'manual'), time.time() - state['queued_at'])
+
+    preprocessor = get_preprocessor()
+    file_hash = preprocessor.pdf_store.get_file_hash(pdf_id)
+    if not file_hash:
+        raise ValueError(f"Could not retrieve file hash for PDFFile {pdf_id}")
+    model_name = preprocessor.embedding_model
+    state = {**state, 'file_hash': file_hash, 'embedding_model': model_name}
+
+    manifest = find_artifacts(file_hash, model_name)
+    if manifest:
+        metrics.count_cache('ingestion_artifacts', hits=1)
+        return _reused_state(state, manifest)
+
+    lock_token = acquire_ingestion_lock(file_hash, model_name)
+    if not lock_token:
+        # Another worker processes the same file; once it is done, the retry reuses its indexes
+        raise self.retry(countdown=INGESTION_LOCK_WAIT, max_retries=INGESTION_LOCK_RETRIES)
+    manifest = find_artifacts(file_hash, model_name)  # it may have finished in the meantime
+    if manifest:
+        release_ingestion_lock(file_hash, model_name, lock_token)
+        metrics.count_cache('ingestion_artifacts', hits=1)
+        return _reused_state(state, manifest)
+
+    metrics.count_cache('ingestion_artifacts', misses=1)
+    n_pages = count_pages(pdf_path)
+    chunks = preprocessor.parse(pdf_id, pdf_path, n_pages=n_pages)
+    chunks_path = os.path.join(artifact_dir(file_hash), CHUNKS_ARTIFACT)
+    write_artifact(chunks_path, lambda f: pickle.dump(chunks, f))
+    if not chunks:
+        print(f"No text could be extracted from {pdf_path}.")
+    return {**state, 'lock_token': lock_token, 'n_chunks': len(chunks), 'n_pages': n_pages}
+
+
+@shared_task(base=IngestionStageTask, bind=True)
+def embed_chunks_stage(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    if state.get('reused') or not state['n_chunks']:
+        return state
+    directory = artifact_dir(state['file_hash'])
+    with open(os.path.join(directory, CHUNKS_ARTIFACT), 'rb') as f:
+        chunks = pickle.load(f)
+
+    vectors = get_preprocessor().embed(chunks)
+    write_artifact(os.path.join(directory, EMBEDDINGS_ARTIFACT), lambda f: np.save(f, vectors))
+    return state
+
+
+@shared_task(base=IngestionStageTask, bind=True)
+def build_index_stage(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    if state.get('reused'):
+        return state
+    if not state['n_chunks']:
+        return {**state, 'fields': {}}
+    directory = artifact_dir(state['file_hash'])
+    with open(os.path.join(directory, CHUNKS_ARTIFACT), 'rb') as f:
+        chunks = pickle.load(f)
+    vectors = np.load(os.path.join(directory, EMBEDDINGS_ARTIFACT))
+
+    fields = get_preprocessor().build_indexes(state['pdf_id'], state['file_hash'], vectors, chunks)
+    return {**state, 'fields': fields}
+
+
+@shared_task(base=IngestionStageTask, bind=True)
+def infer_year_stage(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    pdf_id = state['pdf_id']
+    fields = dict(state['fields'])
+    if state['n_chunks'] and not state.get('reused'):
+        # The year is inferred from the file, so a reused index set brings it along
+        fields['report_year'] = get_preprocessor().infer_year(state['pdf_path'])
+        fields['embedding_model'] = state['embedding_model']
+        record_artifacts(
+            state['file_hash'], state['embedding_model'], pdf_id, state['n_chunks'], fields, n_pages=state.get('n_pages')
         )
-
-        if patch_response.status_code == 200:
-            print(f"Updated PDFFile {pdf_id} with index paths.")
-        else:
-            print(f"Failed to update PDFFile {pdf_id}: {patch_response.status_code} - {patch_response.text}")
-
-
-@shared_task(bind=True, retry_backoff=True, retry_kwargs={'max_retries': 5})
-def process_and_embed_pdf_task(self, pdf_id: int, pdf_path: str):
+    if state.get('lock_token'):
+        # The index files and the manifest exist now, chunks and embeddings are not read again
+        discard_intermediates(state['file_hash'])
+        release_ingestion_lock(state['file_hash'], state['embedding_model'], state['lock_token'])
+
+    # Index paths, report year and status in one write
+    if get_pdf_store().update(pdf_id, processing_status='success', **fields):
+        print(f"Updated PDFFile {pdf_id} with index paths.")
+    else:
+        print(f"Warning: Failed to update PDFFile {pdf_id} after processing")
+
+    if fields:
+        # Reprocessed PDFs replace their previous vectors in the company index
+        add_pdf_to_company_index_task.delay(pdf_id, replace=True)
+    return {**state, 'fields': fields}
+
+
+def ingestion_pipeline(pdf_id: int, pdf_path: str, source: str = 'manual', priority: int = None):
+    """The chained stages for one PDF; call `.apply_async()` to run it."""
+    stages = [
+        parse_pdf_stage.s({'pdf_id': pdf_id, 'pdf_path': pdf_path, 'source': source, 'queued_at': time.time()}),
+        embed_chunks_stage.s(),
+        build_index_stage.s(),
+        infer_year_stage.s(),
+    ]
+    if priority is not None:
+        stages = [stage.set(priority=priority) for stage in stages]
+    return chain(*stages)
+
+
+@shared_task
+def process_and_embed_pdf_task(pdf_id: int, pdf_path: str, source: str = 'manual', priority: int = None):
+    """Starts the staged ingestion pipeline for a PDF from a worker (the post_save signal starts it directly)."""
+    ingestion_pipeline(pdf_id, pdf_path, source=source, priority=priority).apply_async()
+
+
+def count_pages(pdf_path) -> int:
     try:
-        preprocessor = PDFPreprocessor()
-        preprocessor.process_and_embed_pdf(pdf_id, pdf_path)
-
-        api_client = get_api_client()
-        response = api_client.patch(
-            f'/api/pdffiles/{pdf_id}/',
-            {'processing_status': 'success'}
-        )
-        if response.status_code != 200:
-            print(f"Warning: Failed to update processing_status for {pdf_id} to 'success'")
+        return len(PdfReader(pdf_path).pages)
     except Exception as e:
-        print(f"Error processing PDF {pdf_id}: {e}")
-        try:
-            api_client = get_api_client()
-            api_client.patch(
-                f'/api/pdffiles/{pdf_id}/',
-                {'processing_status': 'failed'}
-            )
-        except Exception as api_err:
-            print(f"Failed to update failure status for PDF {pdf_id}: {api_err}")
-        self.retry(exc=e, countdown=60 * 5 * self.request.retries)
+        print(f"Error counting pages of {pdf_path}: {e}")
+        return 0
 
 
 def get_pdf_creation_year(pdf_path):
@@ -146,7 +420,7 @@ def infer_report_year(pdf_path, llm_processor: LLMProcessor):
 
 Which year does this report most likely correspond to? Return only the year as a 4-digit number."""
 
-    result = llm_processor.analyze(prompt)
+    result = llm_processor.analyze(prompt, stage='document_year')
     try:
         parsed = int(result['summary'][:4])
         return parsed
@@ -0,0 +1,102 @@
+"""
+File: web/backend/llm_module/pdf_store.py
+
+Role:
+    Storage abstraction for the `PDFFile` state the preprocessing worker reads and writes (file hash,
+    index paths, report year, processing status). Workers that share the database with the web tier
+    use `ORMPDFStore`, which writes with a single `QuerySet.update()` per PDF. Workers without database
+    access use `APIPDFStore`, which talks to the REST API over one pooled session and can send many
+    updates in one request.
+
+Interactions:
+    - `pdf_preprocessor.py`: `process_and_embed_pdf_task` gets its store from `get_pdf_store()`.
+    - `utils.py`: `APIPDFStore` uses the pooled client returned by `get_api_client()`.
+    - `web/api/views.py`: `PDFFileViewSet.batch_update` is the endpoint behind `APIPDFStore.update_many`.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from .utils import get_api_client
+
+
+# === Interface for PDF stores ===
+class PDFStoreInterface(ABC):
+    @abstractmethod
+    def get_file_hash(self, pdf_id: int) -> Optional[str]:
+        """Returns the SHA-256 of the PDF, or None if the PDF does not exist."""
+        pass
+
+    @abstractmethod
+    def update(self, pdf_id: int, **fields) -> bool:
+        """Writes all `fields` of one PDF at once. Returns False if the PDF does not exist."""
+        pass
+
+    def update_many(self, updates: Dict[int, Dict[str, Any]]) -> int:
+        """
+        Applies {pdf_id: fields} and returns the number of updated PDFs. Stores that can batch
+        should override this.
+        """
+        return sum(self.update(pdf_id, **fields) for pdf_id, fields in updates.items())
+
+
+# === Direct database access (worker shares the database) ===
+class ORMPDFStore(PDFStoreInterface):
+    def get_file_hash(self, pdf_id: int) -> Optional[str]:
+        from api.models import PDFFile
+        return PDFFile.objects.filter(pk=pdf_id).values_list('file_hash', flat=True).first()
+
+    def update(self, pdf_id: int, **fields) -> bool:
+        # .update() skips PDFFile.save() and the post_save signal, which would queue the PDF again
+        from api.models import PDFFile
+        return PDFFile.objects.filter(pk=pdf_id).update(**fields) > 0
+
+    def update_many(self, updates: Dict[int, Dict[str, Any]]) -> int:
+        from django.db import transaction
+        with transaction.atomic():
+            return super().update_many(updates)
+
+
+# === REST API access (remote worker) ===
+class APIPDFStore(PDFStoreInterface):
+    def __init__(self, api_client=None):
+        self.api_client = api_client or get_api_client()  # pooled, shared by all calls
+
+    def get_file_hash(self, pdf_id: int) -> Optional[str]:
+        response = self.api_client.get(f'/pdffiles/{pdf_id}/file_hash/')
+        if response.status_code != 200:
+            return None
+        return response.json().get('file_hash')
+
+    def update(self, pdf_id: int, **fields) -> bool:
+        response = self.api_client.patch(f'/pdffiles/{pdf_id}/', json=fields)
+        if response.status_code != 200:
+            print(f"Failed to update PDFFile {pdf_id}: {response.status_code} - {response.text}")
+        return response.status_code == 200
+
+    def update_many(self, updates: Dict[int, Dict[str, Any]]) -> int:
+        if not updates:
+            return 0
+        payload = [{'id': pdf_id, **fields} for pdf_id, fields in updates.items()]
+        response = self.api_client.patch('/pdffiles/batch_update/', json=payload)
+        if response.status_code != 200:
+            print(f"Failed to update {len(payload)} PDFFiles: {response.status_code} - {response.text}")
+            return 0
+        return response.json().get('updated', 0)
+
+
+PDF_STORES = {
+    'orm': ORMPDFStore,
+    'api': APIPDFStore,
+}
+
+
+def get_pdf_store() -> PDFStoreInterface:
+    """The store configured by `settings.PDF_STORE_BACKEND` ('orm' or 'api')."""
+    backend = getattr(settings, 'PDF_STORE_BACKEND', 'orm')
+    try:
+        return PDF_STORES[backend]()
+    except KeyError:
+        raise ValueError(f"Unknown PDF_STORE_BACKEND '{backend}', expected one of {sorted(PDF_STORES)}")
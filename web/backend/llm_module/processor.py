@@ -13,44 +13,96 @@ Interactions:
       embedding provider to vectorize the user query.
     - `vector_store.py`: In the `rag_analyze` method, it uses a `ChunkVectorStore` instance to
       perform a similarity search and retrieve the most relevant text chunks for the query.
+      `batch_retrieve` searches each index once with the embeddings of many queries.
+    - `company_index.py`: `batch_retrieve` searches the company-wide index, loaded once per company, instead
+      of the per-PDF indexes of the PDFs it contains.
     - `evaluator.py`: The `LLMEvaluator` uses this processor to perform the main analysis step.
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from .vector_store import DocumentVectorStore, ChunkVectorStore
+from django.conf import settings
+from .vector_store import DocumentVectorStore, ChunkVectorStore, meta_path_for
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from .llm_provider import LLMProviderInterface, EmbeddingProviderInterface
+from .company_index import CompanyIndex, pdf_chunk_id_range
+from . import metrics
 
 DOCUMENT_SIMILARITY_THRESHOLD = 0.7
+DEFAULT_RETRIEVAL_WORKERS = 8
+
+
+def query_text(query) -> str:
+    """Text used to embed a Query: the enriched text if available, else the question."""
+    return getattr(query, 'enriched_text', '') or query.question
+
 
 class LLMProcessor:
-    def __init__(self, provider: LLMProviderInterface = None, embedding_provider: EmbeddingProviderInterface = None):
+    def __init__(
+        self,
+        provider: LLMProviderInterface = None,
+        embedding_provider: EmbeddingProviderInterface = None,
+        retrieval_workers: Optional[int] = None
+    ):
         self.provider = provider  # e.g. HuggingFaceLLMProvider instance
         self.embedding_provider = embedding_provider  # e.g. SentenceTransformersEmbeddingProvider
+        # Threads used to load and search the per-PDF indexes of `rag_analyze`, 1 = sequential
+        self.retrieval_workers = retrieval_workers or getattr(settings, 'RAG_RETRIEVAL_WORKERS', DEFAULT_RETRIEVAL_WORKERS)
 
-    def analyze(self, prompt: str, **kwargs) -> Dict[str, Any]:
+    def analyze(self, prompt: str, stage: str = 'analyze', **kwargs) -> Dict[str, Any]:
         """
         Calls the LLM provider with the prompt and returns the result and confidence.
+        `stage` labels the call in the LLM latency metrics.
         """
-        result = self.provider.generate(prompt, **kwargs)
+        with metrics.timed(metrics.LLM_CALL_SECONDS, model=metrics.model_name(self.provider), stage=stage):
+            result = self.provider.generate(prompt, **kwargs)
         return {
             'summary': result['text'],
             'confidence': result.get('confidence', 0.5),  # Normalized 0-1
             'provider': self.provider.__class__.__name__
         }
 
+    def analyze_batch(self, prompts: List[str], stage: str = 'analyze', **kwargs) -> List[Dict[str, Any]]:
+        """
+        Like `analyze`, for several prompts in one batched provider call.
+        """
+        with metrics.timed(metrics.LLM_CALL_SECONDS, model=metrics.model_name(self.provider), stage=stage):
+            results = self.provider.generate_batch(prompts, **kwargs)
+        return [
+            {
+                'summary': result['text'],
+                'confidence': result.get('confidence', 0.5),
+                'provider': self.provider.__class__.__name__
+            }
+            for result in results
+        ]
+
     def extract_report_year_from_text_chunk(self, text_chunk: str) -> Optional[int]:
-        prompt = f"""
+        result = self.analyze(self._report_year_prompt(text_chunk), stage='report_year')
+        return self._parse_year(result.get('summary', ''))
+
+    def extract_report_years_from_text_chunks(self, text_chunks: List[str]) -> List[Optional[int]]:
+        """Batched variant of `extract_report_year_from_text_chunk`."""
+        if not text_chunks:
+            return []
+        results = self.analyze_batch([self._report_year_prompt(text) for text in text_chunks], stage='report_year')
+        return [self._parse_year(result.get('summary', '')) for result in results]
+
+    @staticmethod
+    def _report_year_prompt(text_chunk: str) -> str:
+        return f"""
         Extract the reporting year mentioned in the following text paragraph.
         If there is no explicit year, return 'None'.
 
         Text:
         \"\"\"{text_chunk}\"\"\"
         """
-        result = self.analyze(prompt)
-        year_str = result.get('summary', '').strip()
-        match = re.search(r"\b(19|20)\d{2}\b", year_str)
+
+    @staticmethod
+    def _parse_year(year_str: str) -> Optional[int]:
+        match = re.search(r"\b(19|20)\d{2}\b", year_str.strip())
         if match:
             return int(match.group(0))
         return None
@@ -63,7 +115,8 @@ class LLMProcessor:
         pdf_files: List[Any],  # List of PDFFile objects with metadata
         top_k: int = 5,
         filter_by_document_level_index: bool = False,
-        extended_search: bool = False
+        extended_search: bool = False,
+        max_workers: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Perform RAG analysis for a company and query.
@@ -71,111 +124,292 @@ class LLMProcessor:
         - Filter pdf_files by company_id
         - Optionally filter on document level using document vector index similarity
         - For each relevant PDF, search chunk index for top-k relevant chunks
-        - Filter chunk types based on extended_search flag
+          (restricted to table columns inside the index search unless extended_search is set)
         - Extract report year from text chunks with fallback to pdf.report_year
         - Return list of data points (one dict per chunk)
+
+        See `iter_rag_analyze` to process the data points while the remaining PDFs are searched.
+        """
+        return list(self.iter_rag_analyze(
+            company_id, query_id, query_text, pdf_files, top_k=top_k,
+            filter_by_document_level_index=filter_by_document_level_index,
+            extended_search=extended_search, max_workers=max_workers
+        ))
+
+    def iter_rag_analyze(self, *args, **kwargs) -> Iterator[Dict[str, Any]]:
+        """Generator variant of `rag_analyze`, yields the data points of each PDF as soon as it is done."""
+        for _, data_points in self.iter_rag_analyze_by_pdf(*args, **kwargs):
+            yield from data_points
+
+    def iter_rag_analyze_by_pdf(
+        self,
+        company_id: int,
+        query_id: int,
+        query_text: str,
+        pdf_files: List[Any],
+        top_k: int = 5,
+        filter_by_document_level_index: bool = False,
+        extended_search: bool = False,
+        max_workers: Optional[int] = None
+    ) -> Iterator[Tuple[Any, List[Dict[str, Any]]]]:
+        """
+        Yields (pdf_file, data_points) for every PDF of the company, in the order of `pdf_files`;
+        PDFs filtered out on document level or without matching chunks yield an empty list.
+
+        Loading and searching the per-PDF indexes runs on `max_workers` threads (default:
+        `self.retrieval_workers`); index reads and FAISS searches release the GIL. The report years of
+        a PDF's text chunks are extracted in one batched LLM call while later PDFs are still searched.
         """
+        max_workers = max_workers or self.retrieval_workers
 
         # Step 1: Filter pdf_files by company_id
         relevant_pdfs = [pdf for pdf in pdf_files if pdf.company_id == company_id]
         if not relevant_pdfs:
-            return []
+            return
 
-        # Step 2: If filtering by document level index, narrow down relevant_pdfs
-        if filter_by_document_level_index:
-            query_vector = self.embedding_provider.embed([query_text])[0]
-            filtered_pdfs = []
-            for pdf_file in relevant_pdfs:
+        # Embed the query vector once
+        query_vector = self._embed([query_text])[0]
+        # Step 4: Restrict chunk types inside the search if extended_search is False
+        chunk_types = None if extended_search else ["table_column"]
+        company_store = self._load_company_store(company_id)
+
+        def retrieve(pdf_file):
+            # Step 2: If filtering by document level index, skip PDFs with low similarity
+            if filter_by_document_level_index:
                 try:
                     doc_store = self._load_document_store(pdf_file.document_vector_index_path)
                 except Exception as e:
                     print(f"Failed to load document vector index for PDF {pdf_file.id}: {e}")
-                    continue
+                    return []
+                with metrics.timed(metrics.INDEX_SEARCH_SECONDS, kind='document'):
+                    doc_scores = doc_store.search(query_vector, top_k=1)
+                if not doc_scores or doc_scores[0][1] < DOCUMENT_SIMILARITY_THRESHOLD:
+                    return []
+
+            # Step 3: Find top-k relevant chunks, in the company index if it contains the PDF
+            if company_store is not None and len(company_store.ids_in_range(*pdf_chunk_id_range(pdf_file.id))):
+                with metrics.timed(metrics.INDEX_SEARCH_SECONDS, kind='company'):
+                    return company_store.search(query_vector, top_k=top_k, chunk_types=chunk_types, pdf_ids=[pdf_file.id])
+            try:
+                chunk_store = self._load_chunk_store(pdf_file.chunk_vector_index_path)
+            except Exception as e:
+                print(f"Failed to load chunk vector index for PDF {pdf_file.id}: {e}")
+                return []
+            with metrics.timed(metrics.INDEX_SEARCH_SECONDS, kind='chunk'):
+                return chunk_store.search(query_vector, top_k=top_k, chunk_types=chunk_types)
+
+        embedding_model = metrics.model_name(self.embedding_provider)
 
-                doc_scores = doc_store.search(query_vector, top_k=1)
-                if doc_scores:
-                    top_score = doc_scores[0].get('score', 0)
-                    if top_score >= DOCUMENT_SIMILARITY_THRESHOLD:
-                        filtered_pdfs.append(pdf_file) # Only keep PDFs with high similarity
-            relevant_pdfs = filtered_pdfs
+        def timed_retrieve(pdf_file):
+            with metrics.timed(metrics.STAGE_SECONDS, stage='retrieve', model=embedding_model):
+                return retrieve(pdf_file)
 
-        results = []
+        for pdf_file, top_chunks in zip(relevant_pdfs, self._imap_pdfs(timed_retrieve, relevant_pdfs, max_workers)):
+            # Step 5: Extract reference years, one LLM batch per PDF
+            text_chunks = [meta for meta, _ in top_chunks if meta.get("chunk_type") == "text"]
+            text_years = dict(zip(
+                (id(meta) for meta in text_chunks),
+                self.extract_report_years_from_text_chunks([meta.get("text", "") for meta in text_chunks])
+            ))
 
-        # Embed the query vector once (if not done above)
-        if not filter_by_document_level_index:
-            query_vector = self.embedding_provider.embed([query_text])[0]
+            data_points = []
+            for chunk_meta, cosine_sim in top_chunks:
+                year = self.resolve_report_year(chunk_meta, pdf_file, text_years.get(id(chunk_meta)))
+                data_points.append(self.build_data_point(company_id, query_id, pdf_file, chunk_meta, cosine_sim, year))
+            yield pdf_file, data_points
+
+    @staticmethod
+    def resolve_report_year(chunk_meta: Dict[str, Any], pdf_file: Any, text_year: Optional[int] = None) -> Optional[int]:
+        """
+        Year of a retrieved chunk: the LLM-extracted year for text chunks, the column year for
+        table columns, falling back to the report year of the PDF.
+        """
+        chunk_type = chunk_meta.get("chunk_type", "unknown")
+        if chunk_type == "text":
+            return text_year if text_year is not None else pdf_file.report_year
+        if chunk_type == "table_column":
+            return chunk_meta.get("report_year") or pdf_file.report_year
+        return pdf_file.report_year
+
+    def build_data_point(
+        self,
+        company_id: int,
+        query_id: int,
+        pdf_file: Any,
+        chunk_meta: Dict[str, Any],
+        cosine_sim: float,
+        year: Optional[int]
+    ) -> Dict[str, Any]:
+        """One result dict per retrieved chunk, as returned by `rag_analyze`."""
+        chunk_type = chunk_meta.get("chunk_type", "unknown")
+        return {
+            "company_id": company_id,
+            "pdf_id": pdf_file.id,
+            "query_id": query_id,
+            "report_year": year,
+            "source": getattr(pdf_file, 'source_url', None) or getattr(pdf_file, 'file_name', None),
+            "chunk_id": chunk_meta.get("chunk_id"),
+            "chunk_type": chunk_type,
+            "cosine_similarity": cosine_sim,
+            "answer": chunk_meta.get("text", ""),
+            "confidence": cosine_sim,
+            "provider": getattr(self.provider, 'name', 'unknown'),
+
+            # Unified reference metadata for traceability
+            "references": {
+                "chunk_id": chunk_meta.get("chunk_id"),
+                # Indexes are shared between PDFs with the same file hash, the searched PDF is the source
+                "source_pdf_id": pdf_file.id,
+                "chunk_type": chunk_type,
+                "page_nums": chunk_meta.get("page_nums", []),
+                "para_indices": chunk_meta.get("para_indices", []),
+                "bbox_list": chunk_meta.get("bbox_list", []),
+                "year": chunk_meta.get("year"),
+                "row_labels": chunk_meta.get("row_labels", []),
+                "values": chunk_meta.get("values", []),
+                "context_before": chunk_meta.get("context_before"),
+                "context_after": chunk_meta.get("context_after"),
+            }
+        }
+
+    def embed_queries(self, queries: List[Any]) -> np.ndarray:
+        """Embeds the texts of all queries in a single call, returns an (n_queries, dim) matrix."""
+        embeddings = self._embed([query_text(q) for q in queries])
+        return np.ascontiguousarray(embeddings, dtype='float32')
+
+    def _embed(self, texts: List[str]):
+        model = metrics.model_name(self.embedding_provider)
+        metrics.EMBEDDING_TEXTS.labels(model=model, stage='query').inc(len(texts))
+        with metrics.timed(metrics.EMBEDDING_SECONDS, model=model, stage='query'):
+            return self.embedding_provider.encode(texts)
+
+    def batch_retrieve(
+        self,
+        queries: List[Any],  # List of Query objects
+        pdf_files: List[Any],  # List of PDFFile objects with metadata
+        top_k: int = 5,
+        extended_search: bool = False,
+        use_company_index: bool = True,
+        query_matrix: Optional[np.ndarray] = None
+    ) -> Dict[Tuple[int, int], List[Tuple[Dict[str, Any], float]]]:
+        """
+        Retrieve the top-k chunks per PDF for many queries at once.
+
+        - Embed all query texts in one call
+        - Search the company index of each company once per PDF with the full query matrix, restricted
+          to the PDF's chunks; a deactivated PDF is tombstoned there and yields nothing. PDFs not yet in
+          their company index (or with `use_company_index` off) are searched in their own index.
+        - Return {(query_id, pdf_id): [(chunk_meta, cosine_similarity), ...]}
+
+        `query_matrix` can be passed in when the same queries are run against many companies.
+        """
+        if not queries or not pdf_files:
+            return {}
+
+        query_ids = [q.id for q in queries]
+        if query_matrix is None:
+            query_matrix = self.embed_queries(queries)
+        chunk_types = None if extended_search else ["table_column"]
+        grouped = {}
 
-        # Step 3: For each relevant PDF, find top-k relevant chunks
-        for pdf_file in relevant_pdfs:
+        remaining = pdf_files
+        if use_company_index:
+            remaining = self._search_company_indexes(pdf_files, query_ids, query_matrix, top_k, chunk_types, grouped)
+
+        for pdf_file in remaining:
             try:
                 chunk_store = self._load_chunk_store(pdf_file.chunk_vector_index_path)
             except Exception as e:
                 print(f"Failed to load chunk vector index for PDF {pdf_file.id}: {e}")
                 continue
 
-            top_chunks = chunk_store.search(query_vector, top_k=top_k)
+            with metrics.timed(metrics.INDEX_SEARCH_SECONDS, kind='chunk'):
+                rows = chunk_store.search_batch(query_matrix, top_k=top_k, chunk_types=chunk_types)
+            for query_id, row in zip(query_ids, rows):
+                grouped[(query_id, pdf_file.id)] = row
 
-            for chunk_meta, cosine_sim in top_chunks:
-                chunk_type = chunk_meta.get("chunk_type", "unknown")
+        return grouped
 
-                # Step 4: Filter by chunk type if extended_search is False
-                if not extended_search and chunk_type != "table_column":
+    @staticmethod
+    def _search_company_indexes(pdf_files, query_ids, query_matrix, top_k, chunk_types, grouped) -> List[Any]:
+        """
+        Adds the results of the PDFs contained in their company index to `grouped`, loading each company
+        index once. Returns the PDFs that have to be searched in their own index.
+        """
+        pdfs_by_company = {}
+        for pdf_file in pdf_files:
+            pdfs_by_company.setdefault(pdf_file.company_id, []).append(pdf_file)
+
+        remaining = []
+        for company_id, company_pdfs in pdfs_by_company.items():
+            chunk_store = LLMProcessor._load_company_store(company_id)
+            if chunk_store is None:
+                remaining.extend(company_pdfs)
+                continue
+
+            for pdf_file in company_pdfs:
+                if not len(chunk_store.ids_in_range(*pdf_chunk_id_range(pdf_file.id))):
+                    remaining.append(pdf_file)  # not added yet
                     continue
+                with metrics.timed(metrics.INDEX_SEARCH_SECONDS, kind='company'):
+                    rows = chunk_store.search_batch(
+                        query_matrix, top_k=top_k, chunk_types=chunk_types, pdf_ids=[pdf_file.id]
+                    )
+                for query_id, row in zip(query_ids, rows):
+                    grouped[(query_id, pdf_file.id)] = row
+        return remaining
+
+    @staticmethod
+    def _map_pdfs(fn, pdf_files: List[Any], max_workers: int) -> List[Any]:
+        """`[fn(pdf) for pdf in pdf_files]`, run on a thread pool; results keep the input order."""
+        return list(LLMProcessor._imap_pdfs(fn, pdf_files, max_workers))
 
-                answer = chunk_meta.get("text", "")
-                confidence = cosine_sim
-
-                # Step 5: Extract reference year
-                if chunk_type == "text":
-                    year = self.extract_report_year_from_text_chunk(answer)
-                    if year is None:
-                        year = pdf_file.report_year
-                elif chunk_type == "table_column":
-                    year = chunk_meta.get("report_year") or pdf_file.report_year
-                else:
-                    year = pdf_file.report_year
-
-                    data_point = {
-                    "company_id": company_id,
-                    "pdf_id": pdf_file.id,
-                    "query_id": query_id,
-                    "report_year": year,
-                    "source": getattr(pdf_file, 'source_url', None) or getattr(pdf_file, 'file_name', None),
-                    "chunk_id": chunk_meta.get("chunk_id"),
-                    "chunk_type": chunk_type,
-                    "cosine_similarity": cosine_sim,
-                    "answer": answer,
-                    "confidence": confidence,
-                    "provider": getattr(self.provider, 'name', 'unknown'),
-
-                    # Unified reference metadata for traceability
-                    "references": {
-                        "chunk_id": chunk_meta.get("chunk_id"),
-                        "source_pdf_id": chunk_meta.get("source_pdf_id"),
-                        "chunk_type": chunk_type,
-                        "page_nums": chunk_meta.get("page_nums", []),
-                        "para_indices": chunk_meta.get("para_indices", []),
-                        "bbox_list": chunk_meta.get("bbox_list", []),
-                        "year": chunk_meta.get("year"),
-                        "row_labels": chunk_meta.get("row_labels", []),
-                        "values": chunk_meta.get("values", []),
-                        "context_before": chunk_meta.get("context_before"),
-                        "context_after": chunk_meta.get("context_after"),
-                    }
-                }
-
-                results.append(data_point)
-
-        return results
+    @staticmethod
+    def _imap_pdfs(fn, pdf_files: List[Any], max_workers: int) -> Iterator[Any]:
+        """Lazy `_map_pdfs`: yields each result in input order as soon as it and its predecessors are done."""
+        if max_workers <= 1 or len(pdf_files) <= 1:
+            for pdf_file in pdf_files:
+                yield fn(pdf_file)
+            return
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(pdf_files)))
+        try:
+            yield from executor.map(fn, pdf_files)
+        finally:
+            # The consumer may stop early, do not search the remaining PDFs then
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _load_company_store(company_id: int) -> Optional[ChunkVectorStore]:
+        """Chunk store of the company index, None if the company has none (yet)."""
+        company_index = CompanyIndex(company_id)
+        if not company_index.exists():
+            return None
+        try:
+            with metrics.timed(metrics.INDEX_LOAD_SECONDS, kind='company'):
+                return company_index.chunk_store
+        except Exception as e:
+            print(f"Failed to load company index of company {company_id}: {e}")
+            return None
 
     def _load_chunk_store(self, index_path: str):
         chunk_dim = self.embedding_provider.model.get_sentence_embedding_dimension()
         chunk_store = ChunkVectorStore(dim=chunk_dim)
-        chunk_store.load_index(index_path)
+        index_path = self._resolve_index_path(index_path)
+        with metrics.timed(metrics.INDEX_LOAD_SECONDS, kind='chunk'):
+            chunk_store.load_index(index_path, meta_path_for(index_path))
         return chunk_store
 
     def _load_document_store(self, index_path: str):
         chunk_dim = self.embedding_provider.model.get_sentence_embedding_dimension()
         document_store = DocumentVectorStore(dim=chunk_dim)
-        document_store.load_index(index_path)
+        index_path = self._resolve_index_path(index_path)
+        with metrics.timed(metrics.INDEX_LOAD_SECONDS, kind='document'):
+            document_store.load_index(index_path, meta_path_for(index_path))
         return document_store
+
+    @staticmethod
+    def _resolve_index_path(index_path: str) -> str:
+        """Index paths are stored relative to MEDIA_ROOT on the PDFFile."""
+        if not index_path:
+            raise FileNotFoundError("PDF has no vector index yet.")
+        return index_path if os.path.isabs(index_path) else os.path.join(settings.MEDIA_ROOT, index_path)
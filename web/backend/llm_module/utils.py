@@ -7,15 +7,19 @@ Role:
     parts of the LLM pipeline.
 
 Interactions:
-    - `evaluator.py`: Uses the `timing` context manager for simple performance logging of different
-      pipeline stages.
+    - The `timing` context manager prints a duration for ad-hoc measurements; pipeline stages are
+      recorded as Prometheus metrics in `metrics.py`.
+    - `pdf_store.py`: `APIPDFStore` talks to the REST API through the pooled `get_api_client()` session.
     - Other modules can import functions from here as needed.
 """
 
 import time
+import threading
 from contextlib import contextmanager
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 
 
@@ -27,16 +31,46 @@ def timing(description: str = "Operation"):
     print(f"{description} took {end - start:.2f} seconds.")
 
 
+class APIClientSession(requests.Session):
+    """requests.Session that resolves relative paths against `settings.API_BASE_URL`."""
+    def __init__(self, base_url: str = ''):
+        super().__init__()
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith('/'):
+            url = self.base_url + url
+        return super().request(method, url, *args, **kwargs)
+
+
+_api_client = None
+_api_client_lock = threading.Lock()
+
+
 def get_api_client():
     """
-    Returns an API client (requests.Session) with authentication headers.
+    Returns the API client (requests.Session) with authentication headers. The session is created once
+    per process and reused, so its connections are kept alive between calls.
     """
-    session = requests.Session()
-    if hasattr(settings, 'API_AUTH_TOKEN'):
-        session.headers.update({'Authorization': f'Token {settings.API_AUTH_TOKEN}'})
-    else:
-        print("Warning: API_AUTH_TOKEN not found in settings. API calls will be unauthenticated.")
-    return session
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            session = APIClientSession(getattr(settings, 'API_BASE_URL', ''))
+            # Only idempotent methods are retried: a POST or PATCH that reached the server before a 502
+            # would be applied twice
+            retry = Retry(
+                total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if hasattr(settings, 'API_AUTH_TOKEN'):
+                session.headers.update({'Authorization': f'Token {settings.API_AUTH_TOKEN}'})
+            else:
+                print("Warning: API_AUTH_TOKEN not found in settings. API calls will be unauthenticated.")
+            _api_client = session
+        return _api_client
 
 
 def create_and_persist_evaluation_result(api_client, query_id, company_id, pdf_file_id, result_data):
@@ -53,7 +87,18 @@ def create_and_persist_evaluation_result(api_client, query_id, company_id, pdf_f
         'model_version': result_data.get('model_version'),
         'processing_time': result_data.get('processing_time')
     }
-    response = api_client.post('/api/evaluationresults/', json=payload)
+    response = api_client.post('/evaluationresults/', json=payload)
     if response.status_code != 201:
         print(f"Error creating evaluation result: {response.status_code} - {response.text}")
     return response
+
+
+def persist_evaluation_results_batch(api_client, results):
+    """
+    Creates many EvaluationResults with a single POST to the batch endpoint. `results` are dicts
+    with the model fields, related objects given by id (`query`, `company`, `pdf_file`).
+    """
+    response = api_client.post('/evaluationresults/batch/', json=list(results))
+    if response.status_code != 201:
+        print(f"Error creating evaluation results: {response.status_code} - {response.text}")
+    return response
@@ -10,91 +10,654 @@ Role:
         FAISS index for extremely fast similarity searches. This is used for the fine-grained retrieval
         step in the RAG pipeline. It can save/load its index to/from disk.
 
+    The FAISS index type of a `ChunkVectorStore` is chosen from the number of vectors it is built with
+    (see `choose_index_type`): exact flat search for small indexes, HNSW or IVF for company- and
+    corpus-wide indexes. The chosen build parameters are stored next to the chunk metadata.
+
 Interactions:
     - `processor.py`: The `LLMProcessor` uses an instance of `ChunkVectorStore` to find document chunks
       that are semantically similar to a user's query.
     - `evaluator.py` & `pdf_preprocessor.py`: These modules create and populate `ChunkVectorStore` instances
       with chunk embeddings. The `pdf_preprocessor` also saves the index to disk.
+    - `api/management/commands/benchmark_vector_index.py`: Uses `build_faiss_index` to compare the
+      index types on recall, latency and build time.
 """
 
 import os
+import math
+from abc import ABC, abstractmethod
+import time
 import pickle
 import faiss
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import numpy as np
+from django.core.files import locks
+
+# Index type selection by number of vectors. Below FLAT_INDEX_MAX_VECTORS exact search is fast enough,
+# up to HNSW_INDEX_MAX_VECTORS an HNSW graph gives the best recall/latency trade-off, above that IVF
+# keeps build time and memory in check.
+FLAT_INDEX_MAX_VECTORS = 10_000
+HNSW_INDEX_MAX_VECTORS = 250_000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
+
+IVF_MIN_TRAINING_POINTS_PER_LIST = 39  # FAISS warns below this ratio
+IVF_NPROBE_FRACTION = 1 / 16
+
+# Filtered searches matching at most this many chunks are answered by exact search over the matching
+# vectors, approximate indexes tend to miss neighbours when the selector rejects most of the graph/lists.
+FILTER_EXACT_SEARCH_MAX_VECTORS = 4096
+
+# Share of tombstoned vectors above which a store should be compacted (see `compact_vector_indexes_task`)
+COMPACTION_TOMBSTONE_RATIO = 0.2
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf')
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Returns the index type ('flat', 'hnsw' or 'ivf') suited for `n_vectors` vectors."""
+    if n_vectors <= FLAT_INDEX_MAX_VECTORS:
+        return 'flat'
+    if n_vectors <= HNSW_INDEX_MAX_VECTORS:
+        return 'hnsw'
+    return 'ivf'
+
+
+def build_faiss_index(
+    dim: int,
+    vectors: np.ndarray,
+    index_type: Optional[str] = None,
+    metric: int = faiss.METRIC_L2,
+    ids: Optional[np.ndarray] = None
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Builds a FAISS index over `vectors` and returns it together with its build parameters.
+
+    Args:
+        dim (int): Vector dimension.
+        vectors (np.ndarray): float32 array of shape (n, dim).
+        index_type (str, optional): One of INDEX_TYPES. Chosen from the vector count if omitted.
+        metric (int): FAISS metric, L2 by default.
+        ids (np.ndarray, optional): Stable int64 ids. If given, the index is wrapped in an
+            `IndexIDMap2` and searches return these ids instead of insertion positions.
+
+    Returns:
+        Tuple[faiss.Index, Dict[str, Any]]: The populated index and a dict with the factory string,
+        search parameters, vector count and build time.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n_vectors = len(vectors)
+    index_type = index_type or choose_index_type(n_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    params = {'index_type': index_type, 'dim': dim, 'metric': int(metric)}
+    start = time.perf_counter()
+
+    if index_type == 'flat':
+        params['factory'] = 'Flat'
+    elif index_type == 'hnsw':
+        params.update({
+            'factory': f'HNSW{HNSW_M}',
+            'ef_construction': HNSW_EF_CONSTRUCTION,
+            'ef_search': HNSW_EF_SEARCH,
+        })
+    else:
+        nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+        nlist = max(1, min(nlist, n_vectors // IVF_MIN_TRAINING_POINTS_PER_LIST))
+        params.update({
+            'factory': f'IVF{nlist},Flat',
+            'nlist': nlist,
+            'nprobe': max(1, int(nlist * IVF_NPROBE_FRACTION)),
+        })
+
+    index = faiss.index_factory(dim, params['factory'], metric)
+    if index_type == 'hnsw':
+        index.hnsw.efConstruction = params['ef_construction']
+    if not index.is_trained:
+        index.train(vectors)
+    if index_type == 'ivf':
+        faiss.extract_index_ivf(index).make_direct_map()  # Needed for reconstruct()
+    apply_search_params(index, params)
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        if n_vectors:
+            index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype='int64'))
+    elif n_vectors:
+        index.add(vectors)
+
+    params['n_vectors'] = n_vectors
+    params['build_seconds'] = round(time.perf_counter() - start, 4)
+    return index, params
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]):
+    """Applies the query-time parameters recorded in `params` (not all of them survive write_index)."""
+    index_type = params.get('index_type', 'flat')
+    if index_type == 'hnsw' and 'ef_search' in params:
+        base_index(index).hnsw.efSearch = params['ef_search']
+    elif index_type == 'ivf' and 'nprobe' in params:
+        faiss.extract_index_ivf(index).nprobe = params['nprobe']
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """Unwraps an `IndexIDMap`/`IndexIDMap2` to the index doing the actual search."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_parameters(params: Dict[str, Any], selector) -> faiss.SearchParameters:
+    """Builds per-call FAISS search parameters restricting the search to `selector`."""
+    index_type = params.get('index_type', 'flat')
+    if index_type == 'hnsw':
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params.get('ef_search', HNSW_EF_SEARCH))
+    if index_type == 'ivf':
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params.get('nprobe', 1))
+    return faiss.SearchParameters(sel=selector)
+
+
+def meta_path_for(index_path: str) -> str:
+    """Returns the metadata file belonging to an index file (`<hash>.faiss` -> `<hash>.meta`)."""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.meta" if ext == '.faiss' else f"{index_path}.meta"
 
-class ChunkVectorStore:
+
+def tombstone_path_for(index_path: str) -> str:
+    """Returns the tombstone log belonging to an index file (`<hash>.faiss` -> `<hash>.tomb`)."""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.tomb" if ext == '.faiss' else f"{index_path}.tomb"
+
+
+def l2_to_cosine(distances: np.ndarray) -> np.ndarray:
+    """Converts squared L2 distances between unit vectors into cosine similarities."""
+    return 1.0 - distances / 2.0
+
+
+class TombstoneLog:
+    """
+    Append-only log of removed and restored id ranges, stored next to an index file.
+
+    Removing vectors from a FAISS index in place is slow (HNSW does not support it at all), so removals
+    are recorded here and excluded at search time until the store is compacted. Each line is
+    `-<lo>:<hi>` (remove) or `+<lo>:<hi>` (restore) for the half-open id range [lo, hi); later lines win.
+    Appending a line does not require loading the index, which keeps activating and deactivating a PDF
+    in the millisecond range. Without a path the log only lives in memory.
+    """
+    def __init__(self, path: str = None):
+        self.path = path
+        self.entries: List[Tuple[str, int, int]] = []
+        self._read_offset = 0
+        self.refresh()
+
+    def remove(self, lo: int, hi: int):
+        self._append([('-', lo, hi)])
+
+    def restore(self, lo: int, hi: int):
+        self._append([('+', lo, hi)])
+
+    def remove_ids(self, ids: Iterable[int]):
+        self._append([('-', lo, hi) for lo, hi in _id_ranges(ids)])
+
+    def restore_ids(self, ids: Iterable[int]):
+        self._append([('+', lo, hi) for lo, hi in _id_ranges(ids)])
+
+    def refresh(self):
+        """Picks up lines appended by other processes since the last read."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < self._read_offset:
+            # Truncated by a compaction in another process
+            self.entries, self._read_offset = [], 0
+        with open(self.path, 'r') as f:
+            f.seek(self._read_offset)
+            for line in f:
+                if line.endswith('\n'):
+                    self.entries.append(_parse_tombstone_line(line))
+                    self._read_offset += len(line.encode())
+
+    def deleted_mask(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask over `ids`, True where the id is currently removed."""
+        mask = np.zeros(len(ids), dtype=bool)
+        for op, lo, hi in self.entries:
+            mask[(ids >= lo) & (ids < hi)] = (op == '-')
+        return mask
+
+    def move_to(self, path: str):
+        """Writes the current entries to `path` and keeps appending there."""
+        if path == self.path:
+            return
+        self.path = path
+        if self.entries or os.path.exists(path):
+            self._rewrite(self.entries)  # Also clears a stale log of a previous index at that path
+        else:
+            self._read_offset = 0
+
+    def truncate(self, upto: int):
+        """Drops the first `upto` entries (already applied by a compaction), keeping later appends."""
+        if self.path:
+            with open(self.path, 'a+') as f:
+                locks.lock(f, locks.LOCK_EX)
+                self.refresh()
+                self.entries = self.entries[upto:]
+                f.seek(0)
+                f.truncate()
+                f.writelines(_format_tombstone_line(e) for e in self.entries)
+                self._read_offset = f.tell()
+        else:
+            self.entries = self.entries[upto:]
+
+    def _append(self, entries):
+        if not entries:
+            return
+        if self.path:
+            with open(self.path, 'a') as f:
+                locks.lock(f, locks.LOCK_EX)
+                f.writelines(_format_tombstone_line(e) for e in entries)
+            self.refresh()
+        else:
+            self.entries.extend(entries)
+
+    def _rewrite(self, entries):
+        with open(self.path, 'w') as f:
+            f.writelines(_format_tombstone_line(e) for e in entries)
+        self.entries, self._read_offset = list(entries), os.path.getsize(self.path)
+
+
+def _format_tombstone_line(entry: Tuple[str, int, int]) -> str:
+    op, lo, hi = entry
+    return f"{op}{lo}:{hi}\n"
+
+
+def _parse_tombstone_line(line: str) -> Tuple[str, int, int]:
+    lo, hi = line[1:].strip().split(':')
+    return line[0], int(lo), int(hi)
+
+
+def _id_ranges(ids: Iterable[int]) -> List[Tuple[int, int]]:
+    """Collapses ids into half-open ranges of consecutive values."""
+    ranges = []
+    for i in sorted(int(i) for i in ids):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        elif not ranges or ranges[-1][1] < i:
+            ranges.append([i, i + 1])
+    return [(lo, hi) for lo, hi in ranges]
+
+
+def _write_atomic(path: str, write):
+    """Writes through a temporary file so readers never see a half-written index or meta file."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class IdMappedVectorStore(ABC):
+    """
+    Shared id bookkeeping of the chunk and document stores.
+
+    Vectors carry stable int64 ids (`IndexIDMap2`), removals go to a `TombstoneLog` and `compact()`
+    rebuilds the index from the surviving vectors. Subclasses keep their metadata in `self.metas`
+    (id -> meta dict) and implement `_rebuild`.
+    """
+    index: faiss.Index
+    metas: Dict[int, Dict[str, Any]]
+    tombstones: TombstoneLog
+
+    _ids_cache = None
+    _deleted_cache = None
+    _columns = None
+
+    def ids(self) -> np.ndarray:
+        """All stored ids (including tombstoned ones) in insertion order."""
+        if self._ids_cache is None or len(self._ids_cache) != len(self.metas):
+            self._ids_cache = np.fromiter(self.metas.keys(), dtype='int64', count=len(self.metas))
+        return self._ids_cache
+
+    def next_id(self) -> int:
+        return int(max(self.metas)) + 1 if self.metas else 0
+
+    def remove_ids(self, ids: Iterable[int]):
+        """Marks vectors as removed; they are skipped by searches and dropped on the next compaction."""
+        self.tombstones.remove_ids(ids)
+
+    def restore_ids(self, ids: Iterable[int]):
+        """Undoes `remove_ids` for vectors that have not been compacted away yet."""
+        self.tombstones.restore_ids(ids)
+
+    def remove_range(self, lo: int, hi: int):
+        self.tombstones.remove(lo, hi)
+
+    def restore_range(self, lo: int, hi: int):
+        self.tombstones.restore(lo, hi)
+
+    def ids_in_range(self, lo: int, hi: int) -> np.ndarray:
+        ids = self.ids()
+        return ids[(ids >= lo) & (ids < hi)]
+
+    def deleted_ids(self) -> np.ndarray:
+        return self.ids()[self._deleted_mask()]
+
+    def _deleted_mask(self) -> np.ndarray:
+        """Tombstone mask aligned with `ids()`, cached until the log or the ids change."""
+        self.tombstones.refresh()
+        key = (len(self.tombstones.entries), len(self.metas))
+        if self._deleted_cache is None or self._deleted_cache[0] != key:
+            self._deleted_cache = (key, self.tombstones.deleted_mask(self.ids()))
+        return self._deleted_cache[1]
+
+    def _invalidate(self):
+        self._ids_cache = self._deleted_cache = self._columns = None
+
+    def live_count(self) -> int:
+        return len(self.metas) - len(self.deleted_ids())
+
+    def needs_compaction(self, ratio: float = COMPACTION_TOMBSTONE_RATIO) -> bool:
+        return bool(self.metas) and len(self.deleted_ids()) / len(self.metas) > ratio
+
+    def vectors_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        if len(ids) == 0:
+            return np.empty((0, self.dim), dtype='float32')
+        return self.index.reconstruct_batch(np.ascontiguousarray(ids, dtype='int64')).astype('float32')
+
+    def discard_range(self, lo: int, hi: int):
+        """Physically removes all vectors with ids in [lo, hi), e.g. before re-adding a reprocessed PDF."""
+        ids = self.ids_in_range(lo, hi)
+        if len(ids) == 0:
+            return
+        try:
+            self.index.remove_ids(faiss.IDSelectorRange(lo, hi))
+        except RuntimeError:
+            # HNSW cannot remove vectors, rebuild without them
+            keep = self.ids()
+            keep = keep[(keep < lo) | (keep >= hi)]
+            self._rebuild(keep, self.vectors_for_ids(keep))
+        for i in ids:
+            self.metas.pop(int(i), None)
+        self._invalidate()
+
+    def compact(self) -> int:
+        """
+        Rebuilds the index without tombstoned vectors and clears the applied part of the log.
+        The index type is chosen again for the new size. Returns the number of dropped vectors.
+        """
+        self.tombstones.refresh()
+        applied = len(self.tombstones.entries)
+        ids = self.ids()
+        deleted = self.tombstones.deleted_mask(ids)
+        if not deleted.any():
+            return 0
+        keep = ids[~deleted]
+        self._rebuild(keep, self.vectors_for_ids(keep))
+        self.metas = {int(i): self.metas[int(i)] for i in keep}
+        self._invalidate()
+        if self.index_path:
+            self.save_index(self.index_path, self.meta_path)
+        self.tombstones.truncate(applied)
+        return int(deleted.sum())
+
+    def _search_selector(self, ids: Optional[np.ndarray]):
+        """Selector allowing `ids` (all live ids if None), or None if nothing needs to be excluded."""
+        if ids is not None:
+            return faiss.IDSelectorBatch(ids)
+        deleted = self.deleted_ids()
+        return faiss.IDSelectorNot(faiss.IDSelectorBatch(deleted)) if len(deleted) else None
+
+    @abstractmethod
+    def _rebuild(self, ids: np.ndarray, vectors: np.ndarray):
+        """Replaces the index by one holding `vectors` under `ids`."""
+
+
+class ChunkVectorStore(IdMappedVectorStore):
     """
     Stores and retrieves chunk-level embeddings using FAISS for fast similarity search.
+
+    The index type is picked by `build_faiss_index` when the first batch of vectors is added, so an
+    empty store always starts out as an exact flat index. The build parameters are kept in
+    `index_params` and saved together with the chunk metadata. Every chunk has a stable id; company-wide
+    stores use `pdf_id << 32 | chunk_ordinal` so that all chunks of a PDF form one id range.
     """
-    def __init__(self, dim: int, index_path: str = None, meta_path: str = None):
+    def __init__(self, dim: int, index_path: str = None, meta_path: str = None, index_type: str = None):
         self.dim = dim
         self.index_path = index_path
         self.meta_path = meta_path
+        self.index_type = index_type  # Forces an index type instead of choosing it by size
+        self._columns = None  # Lazily built metadata columns for filtered search
 
         if index_path and meta_path and os.path.exists(index_path) and os.path.exists(meta_path):
             self.load_index(index_path, meta_path)
         else:
-            self.index = faiss.IndexFlatL2(dim)
-            self.chunk_meta = []  # List of dicts with metadata for each chunk
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+            self.index_params = {'index_type': 'flat', 'factory': 'Flat', 'dim': dim, 'n_vectors': 0}
+            self.metas = {}  # chunk id -> dict with metadata for the chunk
+            self.tombstones = TombstoneLog()
+
+    @property
+    def chunk_meta(self) -> List[Dict[str, Any]]:
+        """Metadata of all stored chunks in insertion order."""
+        return list(self.metas.values())
 
     def add_chunk_vectors(self, vectors: np.ndarray, metas: List[Dict[str, Any]]):
-        self.index.add(vectors)
-        self.chunk_meta.extend(metas)
+        """Adds chunks with ids continuing after the highest id in the store."""
+        start = self.next_id()
+        self.add_with_ids(vectors, metas, np.arange(start, start + len(metas), dtype='int64'))
+
+    def add_with_ids(self, vectors: np.ndarray, metas: List[Dict[str, Any]], ids: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        ids = np.ascontiguousarray(ids, dtype='int64')
+        if self.index.ntotal == 0:
+            # First batch decides the index type (IVF needs the vectors for training anyway)
+            self.index, self.index_params = build_faiss_index(
+                self.dim, vectors, index_type=self.index_type, ids=ids
+            )
+        else:
+            self.index.add_with_ids(vectors, ids)
+            self.index_params['n_vectors'] = self.index.ntotal
+        self.metas.update({int(i): meta for i, meta in zip(ids, metas)})
+        self._invalidate()
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = 5,
+        chunk_types: Optional[Iterable[str]] = None,
+        years: Optional[Iterable[int]] = None,
+        pdf_ids: Optional[Iterable[int]] = None
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Returns the top-k chunks as (meta, cosine_similarity) tuples, best match first.
+
+        The optional `chunk_types`, `years` and `pdf_ids` filters (matched against the `chunk_type`,
+        `year` and `source_pdf_id` metadata) are applied inside the index search, so the result holds
+        the true top-k among the matching chunks rather than whatever survives a post-filter.
+        Tombstoned chunks are excluded the same way.
+        """
+        return self.search_batch(
+            query_vector.reshape(1, -1), top_k=top_k, chunk_types=chunk_types, years=years, pdf_ids=pdf_ids
+        )[0]
+
+    def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = 5,
+        chunk_types: Optional[Iterable[str]] = None,
+        years: Optional[Iterable[int]] = None,
+        pdf_ids: Optional[Iterable[int]] = None
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Like `search`, for a whole (n_queries, dim) matrix in a single FAISS call.
+        Returns one result list per query row.
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype='float32')
+        ids = self._filtered_ids(chunk_types, years, pdf_ids)
+
+        if ids is not None and len(ids) == 0:
+            return [[] for _ in range(len(queries))]
+        if ids is not None and len(ids) <= FILTER_EXACT_SEARCH_MAX_VECTORS \
+                and self.index_params.get('index_type') != 'flat':
+            D, I = self._exact_search(queries, ids, top_k)
+        else:
+            selector = self._search_selector(ids)
+            if selector is None:
+                D, I = self.index.search(queries, top_k)
+            else:
+                D, I = self.index.search(queries, top_k, params=search_parameters(self.index_params, selector))
+
+        return [
+            [
+                (self.metas[int(i)], float(sim))
+                for i, sim in zip(row_ids, l2_to_cosine(row_distances))
+                if int(i) in self.metas
+            ]
+            for row_ids, row_distances in zip(I, D)
+        ]
 
-    def search(self, query_vector: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
-        D, I = self.index.search(query_vector.reshape(1, -1), top_k)
-        return [self.chunk_meta[i] for i in I[0] if i < len(self.chunk_meta)]
+    def _filtered_ids(self, chunk_types, years, pdf_ids) -> Optional[np.ndarray]:
+        """Returns the live chunk ids matching all given filters, or None if nothing is filtered."""
+        if chunk_types is None and years is None and pdf_ids is None:
+            return None
+        columns = self._meta_columns()
+        mask = ~self._deleted_mask()
+        if chunk_types is not None:
+            mask &= np.isin(columns['chunk_type'], list(chunk_types))
+        if years is not None:
+            mask &= np.isin(columns['year'], [int(y) for y in years])
+        if pdf_ids is not None:
+            mask &= np.isin(columns['source_pdf_id'], [int(p) for p in pdf_ids])
+        return columns['id'][mask]
+
+    def _meta_columns(self) -> Dict[str, np.ndarray]:
+        """Column arrays of the filterable metadata, rebuilt whenever chunks were added or removed."""
+        if self._columns is None:
+            metas = list(self.metas.values())
+            self._columns = {
+                'id': self.ids(),
+                'chunk_type': np.array([m.get('chunk_type', 'unknown') for m in metas], dtype=object),
+                'year': np.array([m.get('year') or -1 for m in metas], dtype='int64'),
+                'source_pdf_id': np.array([m.get('source_pdf_id') or -1 for m in metas], dtype='int64'),
+            }
+        return self._columns
+
+    def _exact_search(self, queries: np.ndarray, ids: np.ndarray, top_k: int):
+        """Brute force search of all query rows restricted to `ids`, used for highly selective filters."""
+        try:
+            vectors = self.vectors_for_ids(ids)
+        except RuntimeError:
+            # Index type without reconstruction support, let FAISS apply the selector instead
+            selector = faiss.IDSelectorBatch(ids)
+            return self.index.search(queries, top_k, params=search_parameters(self.index_params, selector))
+        # Squared L2 as |q|^2 + |v|^2 - 2 q.v, shape (n_queries, len(ids))
+        distances = (queries ** 2).sum(axis=1)[:, None] + (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+        order = np.argsort(distances, axis=1)[:, :top_k]
+        return np.take_along_axis(distances, order, axis=1), ids[order]
+
+    def _rebuild(self, ids: np.ndarray, vectors: np.ndarray):
+        self.index, self.index_params = build_faiss_index(self.dim, vectors, index_type=self.index_type, ids=ids)
 
     def save_index(self, index_path: str, meta_path: str):
-        """Saves the FAISS index and metadata to disk."""
-        faiss.write_index(self.index, index_path)
-        with open(meta_path, 'wb') as f:
-            pickle.dump(self.chunk_meta, f)
+        """Saves the FAISS index and metadata (including the index build parameters) to disk."""
+        _write_atomic(index_path, lambda path: faiss.write_index(self.index, path))
+
+        def write_meta(path):
+            with open(path, 'wb') as f:
+                pickle.dump({'chunks': self.metas, 'index_params': self.index_params}, f)
+        _write_atomic(meta_path, write_meta)
+
+        self.tombstones.move_to(tombstone_path_for(index_path))
         self.index_path = index_path
         self.meta_path = meta_path
 
     def load_index(self, index_path: str, meta_path: str):
-        """Loads the FAISS index and metadata from disk."""
-        import faiss
+        """Loads the FAISS index, metadata and tombstone log from disk."""
         self.index = faiss.read_index(index_path)
+        self.dim = self.index.d
         with open(meta_path, 'rb') as f:
-            self.chunk_meta = pickle.load(f)
+            meta = pickle.load(f)
+        if isinstance(meta, dict):
+            chunks = meta['chunks']
+            self.index_params = meta.get('index_params', {})
+        else:
+            # Indexes written before build parameters were recorded are always flat
+            chunks = meta
+            self.index_params = {'index_type': 'flat', 'factory': 'Flat', 'dim': self.dim}
+        if isinstance(chunks, list):
+            # Indexes written before stable ids used insertion positions
+            chunks = dict(enumerate(chunks))
+        self.metas = chunks
+        self.index_params['n_vectors'] = self.index.ntotal
+        apply_search_params(self.index, self.index_params)
+        self.tombstones = TombstoneLog(tombstone_path_for(index_path))
+        self._invalidate()
         self.index_path = index_path
         self.meta_path = meta_path
 
+        if not isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            # Wrap legacy position-based indexes so that ids can be added and removed
+            self._rebuild(self.ids(), self.index.reconstruct_n(0, self.index.ntotal))
+
 
-class DocumentVectorStore:
+class DocumentVectorStore(IdMappedVectorStore):
+    """
+    Stores one normalized vector per document; ids default to the `pdf_id` in the metadata so that a
+    company-wide store can remove and restore single PDFs.
+    """
     def __init__(self, dim: int):
         self.dim = dim
-        self.index = faiss.IndexFlatIP(dim)  # Inner Product (cosine similarity after normalization)
-        self.metas = []
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))  # Inner Product (cosine similarity after normalization)
+        self.metas = {}
+        self.tombstones = TombstoneLog()
+        self.index_path = None
+        self.meta_path = None
 
-    def add_document_vector(self, vector: np.ndarray, meta: dict):
+    def add_document_vector(self, vector: np.ndarray, meta: dict, doc_id: int = None):
         """
         Fügt einen Dokument-Vektor mit Metadaten hinzu.
-        vector: numpy array shape (dim,)
+        vector: numpy array shape (dim,) oder (1, dim)
         meta: dict mit Metainformationen
+        doc_id: stabile ID, standardmäßig meta['pdf_id']
         """
+        vector = np.asarray(vector).reshape(-1)
         assert vector.shape == (self.dim,), f"Vector dimension mismatch: expected {self.dim}, got {vector.shape}"
         # Normalisierung (wichtig für inner product als cosine similarity)
         norm = np.linalg.norm(vector)
         if norm > 0:
             vector = vector / norm
-        self.index.add(np.expand_dims(vector.astype('float32'), axis=0))
-        self.metas.append(meta)
+        if doc_id is None:
+            doc_id = meta.get('pdf_id', self.next_id())
+        self.index.add_with_ids(np.expand_dims(vector.astype('float32'), axis=0), np.array([doc_id], dtype='int64'))
+        self.metas[int(doc_id)] = meta
+        self._invalidate()
 
     def save_index(self, index_filepath: str, meta_filepath: str):
-        faiss.write_index(self.index, index_filepath)
-        with open(meta_filepath, 'wb') as f:
-            pickle.dump(self.metas, f)
+        _write_atomic(index_filepath, lambda path: faiss.write_index(self.index, path))
+
+        def write_meta(path):
+            with open(path, 'wb') as f:
+                pickle.dump(self.metas, f)
+        _write_atomic(meta_filepath, write_meta)
+
+        self.tombstones.move_to(tombstone_path_for(index_filepath))
+        self.index_path = index_filepath
+        self.meta_path = meta_filepath
 
     def load_index(self, index_filepath: str, meta_filepath: str):
         if os.path.exists(index_filepath) and os.path.exists(meta_filepath):
             self.index = faiss.read_index(index_filepath)
+            self.dim = self.index.d
             with open(meta_filepath, 'rb') as f:
                 self.metas = pickle.load(f)
+            self.tombstones = TombstoneLog(tombstone_path_for(index_filepath))
+            self._invalidate()
+            self.index_path = index_filepath
+            self.meta_path = meta_filepath
+            if isinstance(self.metas, list):
+                # Legacy position-based store
+                self.metas = dict(enumerate(self.metas))
+                self._rebuild(self.ids(), self.index.reconstruct_n(0, self.index.ntotal))
         else:
             raise FileNotFoundError("Index or meta file not found.")
 
@@ -107,9 +670,19 @@ class DocumentVectorStore:
         norm = np.linalg.norm(query_vector)
         if norm > 0:
             query_vector = query_vector / norm
-        D, I = self.index.search(np.expand_dims(query_vector.astype('float32'), axis=0), top_k)
+        query = np.expand_dims(query_vector.astype('float32'), axis=0)
+        selector = self._search_selector(None)
+        if selector is None:
+            D, I = self.index.search(query, top_k)
+        else:
+            D, I = self.index.search(query, top_k, params=faiss.SearchParameters(sel=selector))
         results = []
         for i, dist in zip(I[0], D[0]):
-            if i < len(self.metas):
-                results.append((self.metas[i], dist))
+            if int(i) in self.metas:
+                results.append((self.metas[int(i)], dist))
         return results
+
+    def _rebuild(self, ids: np.ndarray, vectors: np.ndarray):
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        if len(ids):
+            self.index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype='int64'))
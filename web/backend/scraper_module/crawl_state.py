@@ -0,0 +1,91 @@
+"""
+File: web/backend/scraper_module/crawl_state.py
+
+Role:
+    Crawl state of one `CompanyURL` that outlives a crawl, in a small SQLite file per URL:
+    - `visited`: a 20-byte fingerprint (SHA-1 of the canonical URL) and the last-seen time of every page
+      and PDF the crawl requested. Pages seen within `recrawl_after` are not requested again, so an
+      incremental crawl only visits new and stale pages.
+    - `frontier`: URLs that were scheduled but not yet visited. The next crawl schedules them first, so an
+      interrupted crawl resumes where it stopped instead of starting over from the start URL. Downloaded
+      PDFs stay in the frontier until the crawl finishes: `PdfStoragePipeline` stores them in batches while
+      the crawl runs, so a crawl killed before its last batches were written would otherwise lose them.
+
+    Writes are committed in batches and when the crawl closes. A crawl killed without closing loses at most
+    the last batch, which is then only crawled again.
+
+Interactions:
+    - `spiders/company_spider.py`: Opens one state per target and records every request and response.
+    - `web/api/management/commands/crawl_companies.py`: Chooses the state folder and `recrawl_after`.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+from w3lib.url import canonicalize_url
+
+COMMIT_EVERY = 200  # writes per commit
+
+
+def url_fingerprint(url: str) -> bytes:
+    return hashlib.sha1(canonicalize_url(url).encode('utf-8')).digest()
+
+
+class CrawlState:
+    def __init__(self, path: str, recrawl_after: float):
+        self.recrawl_after = recrawl_after  # seconds, 0 = everything is stale
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS visited (
+                fingerprint BLOB PRIMARY KEY, kind TEXT NOT NULL, last_seen REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY, kind TEXT NOT NULL, referer TEXT, added_at REAL NOT NULL
+            );
+            """
+        )
+        self.pending_writes = 0
+
+    def is_fresh(self, url: str) -> bool:
+        """Seen within `recrawl_after`, so it is not requested again."""
+        if not self.recrawl_after:
+            return False
+        row = self.db.execute(
+            'SELECT last_seen FROM visited WHERE fingerprint = ?', (url_fingerprint(url),)
+        ).fetchone()
+        return row is not None and row[0] >= time.time() - self.recrawl_after
+
+    def schedule(self, url: str, kind: str, referer: str = None):
+        self.write('INSERT OR IGNORE INTO frontier (url, kind, referer, added_at) VALUES (?, ?, ?, ?)',
+                   (url, kind, referer, time.time()))
+
+    def visited(self, url: str, kind: str):
+        """Records a finished request (also a failed one, it is tried again once it is stale)."""
+        self.write('INSERT OR REPLACE INTO visited (fingerprint, kind, last_seen) VALUES (?, ?, ?)',
+                   (url_fingerprint(url), kind, time.time()))
+        if kind != 'pdf':
+            self.write('DELETE FROM frontier WHERE url = ?', (url,))
+
+    def frontier(self):
+        """[(url, kind, referer)] left over from an interrupted crawl."""
+        return self.db.execute('SELECT url, kind, referer FROM frontier ORDER BY added_at').fetchall()
+
+    def write(self, sql: str, params):
+        self.db.execute(sql, params)
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending_writes = 0
+
+    def close(self, finished: bool):
+        if finished:
+            self.db.execute("DELETE FROM frontier WHERE kind = 'pdf'")
+        self.commit()
+        self.db.close()
@@ -1,29 +1,114 @@
 import time
 import random
-from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from email.utils import parsedate_to_datetime
+
+from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.exceptions import IgnoreRequest
 from scrapy.utils.response import response_status_message
 
 class DynamicDelayRetryMiddleware(RetryMiddleware):
+    """
+    Retries 403/429 responses after a backoff that only pauses the blocking domain: the backoff is set as the
+    delay of the domain's downloader slot, so the reactor and the requests to all other domains keep running.
+    The wait is the response's Retry-After if it sends one, else exponential per retry with jitter. The slot
+    gets its own delay back with the first successful response after the backoff.
+    """
     def __init__(self, settings):
         super().__init__(settings)
         self.base_delay = 1  # Startverzögerung in Sekunden
         self.max_delay = 60  # Maximaler Delay
+        self.max_retry_after = 600  # Maximal befolgtes Retry-After
         self.retry_http_codes = set([403, 429])  # Fehlercodes, die verzögert werden
+        self.backoffs = {}  # slot key -> {'delay', 'jitter', 'until'} of slots in backoff
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler.settings)
+        middleware.crawler = crawler
+        return middleware
 
     def process_response(self, request, response, spider):
-        if response.status in self.retry_http_codes:
-            retries = request.meta.get('retry_times', 0) + 1
-            delay = min(self.base_delay * (2 ** (retries - 1)), self.max_delay)
-            jitter = random.uniform(0, 1.5)
-            total_delay = delay + jitter
+        if response.status not in self.retry_http_codes:
+            self.end_backoff(request)
+            return response
+
+        retries = request.meta.get('retry_times', 0) + 1
+        delay = self.retry_after(response)
+        if delay is None:
+            delay = min(self.base_delay * (2 ** (retries - 1)), self.max_delay) + random.uniform(0, 1.5)
+        self.start_backoff(request, delay)
+
+        spider.logger.warning(
+            f"Blocked with {response.status}. Retrying {request.url} in {delay:.2f}s (attempt {retries})"
+        )
+        retry_request = get_retry_request(
+            request,
+            spider=spider,
+            reason=response_status_message(response.status),
+            max_retry_times=request.meta.get('max_retry_times', self.max_retry_times),
+            priority_adjust=request.meta.get('priority_adjust', self.priority_adjust),
+        )
+        return retry_request or response
+
+    def retry_after(self, response):
+        """Seconds to wait according to the Retry-After header (seconds or HTTP date), None without one."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.decode('latin-1').strip()
+        if value.isdigit():
+            return min(float(value), self.max_retry_after)
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+        return min(max(seconds, 0.0), self.max_retry_after)
+
+    def start_backoff(self, request, delay):
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+        if key not in self.backoffs:
+            self.backoffs[key] = {'delay': slot.delay, 'jitter': _get_jitter(slot)}
+        self.backoffs[key]['until'] = time.monotonic() + delay
+        # Scrapy counts the slot delay from the last request sent to the domain, i.e. before this response arrived
+        slot.delay = delay + request.meta.get('download_latency', 0)
+        _set_jitter(slot, 0)  # a randomized delay could undercut Retry-After
+
+    def end_backoff(self, request):
+        key = request.meta.get('download_slot')
+        backoff = self.backoffs.get(key)
+        # Responses to requests sent before the backoff started do not end it
+        if backoff is None or time.monotonic() < backoff['until']:
+            return
+        del self.backoffs[key]
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.delay = backoff['delay']
+            _set_jitter(slot, backoff['jitter'])
+
+
+class CrawlBudgetMiddleware:
+    """
+    Drops page requests of companies whose page budget is used up. Runs when a request leaves the scheduler,
+    not when it is scheduled, so the budget is spent in priority order. Spiders without a budget are not affected.
+    """
+    def process_request(self, request, spider):
+        take_page_budget = getattr(spider, 'take_page_budget', None)
+        if take_page_budget is not None and not take_page_budget(request):
+            raise IgnoreRequest(f"Page budget used up: {request.url}")
+        return None
+
 
-            spider.logger.warning(
-                f"Blocked with {response.status}. Retrying {request.url} in {total_delay:.2f}s (attempt {retries})"
-            )
+# Newer Scrapy versions replaced the slot's randomize_delay flag with a jitter magnitude
 
-            time.sleep(total_delay)
+def _get_jitter(slot):
+    return slot.jitter if hasattr(slot, 'jitter') else slot.randomize_delay
 
-            reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
 
-        return response
+def _set_jitter(slot, value):
+    if hasattr(slot, 'jitter'):
+        slot.jitter = value
+    else:
+        slot.randomize_delay = bool(value)
@@ -0,0 +1,100 @@
+"""
+File: web/backend/scraper_module/pipelines.py
+
+Role:
+    Stores the PDFs a spider downloads in the database while the crawl runs, instead of after it. Items
+    ({'file_path', 'file_name', 'url', 'sha256', 'size', 'validators'}) belong to their `company_id`, or to
+    the spider's. They are collected per company into batches of PDF_STORE_BATCH_SIZE; each batch is stored
+    with `store_scraped_pdfs` (one hash lookup, bulk inserts of scrape dates and origin URLs) in a worker
+    thread, so the reactor keeps downloading meanwhile. The last partial batches are stored when the spider
+    closes. A spider with `store_pdfs = False` stores nothing, so crawls outside of Django need no database.
+
+    The Django ORM must not run on the reactor thread (an asyncio loop runs there); the batches of one crawl
+    are stored one after another, so two batches never race to create the same PDF.
+
+Interactions:
+    - `spiders/pdf_spider.py`: Enables the pipeline and yields one item per downloaded PDF.
+    - `spiders/company_spider.py`: Enables the pipeline and yields items carrying their `company_id`.
+    - `web/api/scraping.py`: `store_scraped_pdfs` writes a batch.
+    - `web/api/management/commands/run_scraper.py`, `crawl_companies.py`: Report the counts from the crawl stats.
+"""
+
+import threading
+
+from twisted.internet.defer import DeferredList
+from twisted.internet.threads import deferToThread
+
+
+class PdfStoragePipeline:
+    def __init__(self, stats, batch_size=20):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.pending = {}  # company_id -> items not stored yet
+        self.lock = threading.Lock()  # one batch at a time
+        self.enabled = True
+        self.company_id = None
+        self.companies = {}  # company_id -> CompanyProfile
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats, crawler.settings.getint('PDF_STORE_BATCH_SIZE', 20))
+
+    def open_spider(self, spider):
+        self.enabled = getattr(spider, 'store_pdfs', True)
+        self.company_id = getattr(spider, 'company_id', None)
+
+    def process_item(self, item, spider):
+        company_id = item.get('company_id', self.company_id)
+        if not self.enabled or company_id is None:
+            return item  # nothing to store for, e.g. a crawl without a company
+        pending = self.pending.setdefault(company_id, [])
+        pending.append(item)
+        if len(pending) < self.batch_size:
+            return item
+        batch = self.pending.pop(company_id)
+        return deferToThread(self.store, company_id, batch, spider).addCallback(lambda _: item)
+
+    def close_spider(self, spider):
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return None
+        return DeferredList([
+            deferToThread(self.store, company_id, batch, spider) for company_id, batch in pending.items()
+        ])
+
+    def store(self, company_id, batch, spider):
+        from api.models import CompanyProfile
+        from api.scraping import store_scraped_pdf, store_scraped_pdfs
+
+        with self.lock:
+            if company_id not in self.companies:
+                self.companies[company_id] = CompanyProfile.objects.get(pk=company_id)
+            company = self.companies[company_id]
+            try:
+                stored = list(zip(batch, store_scraped_pdfs(company, batch)))
+            except Exception as e:
+                # Store the batch one by one, so that one broken download does not lose the others
+                spider.logger.warning(f"Storing a batch of {len(batch)} PDFs failed ({e}), storing them one by one")
+                stored = []
+                for item in batch:
+                    try:
+                        stored.append((item, store_scraped_pdf(
+                            company, item['file_path'], item['file_name'], origin_url=item['url'],
+                            validators=item.get('validators'), sha256=item.get('sha256'), size=item.get('size'),
+                        )))
+                    except Exception as e:
+                        spider.logger.error(f"Fehler beim Speichern {item['url']}: {e}")
+                        self.count('failed', company_id)
+
+            for item, (_, created) in stored:
+                if created:
+                    spider.logger.info(f"Neues PDF gespeichert: {item['file_name']}")
+                    self.count('created', company_id)
+                else:
+                    spider.logger.info(f"Duplicate gefunden, Metadaten aktualisiert: {item['file_name']}")
+                    self.count('duplicates', company_id)
+
+    def count(self, outcome, company_id):
+        """Counts in the crawl stats, overall (`pdf_store/created`) and per company (`pdf_store/created/<id>`)."""
+        self.stats.inc_value(f'pdf_store/{outcome}')
+        self.stats.inc_value(f'pdf_store/{outcome}/{company_id}')
@@ -1,72 +1,79 @@
-import os
-import django
-import requests
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
-from django.core.files.base import ContentFile
-from ESGDataCollector.web.backend.scraper_module.spiders.pdf_spider import PdfSpider
-from api.models import CompanyProfile, PDFFile
+"""
+File: web/backend/scraper_module/runner.py
 
-from crochet import setup, wait_for
+Role:
+    Runs one crawl over the URLs of many companies on a single Twisted reactor. All companies share
+    the downloader of one `MultiCompanyPdfSpider`, so the global (CONCURRENT_REQUESTS) and per-domain
+    (CONCURRENT_REQUESTS_PER_DOMAIN) limits apply across the whole crawl instead of per company.
 
-# Django Setup
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-django.setup()
+    The reactor cannot be restarted, so `crawl_companies` can run once per process. Long-lived
+    processes (Celery workers) start it in a child process via the `crawl_companies` command.
 
-setup()
+Interactions:
+    - `spiders/company_spider.py`: The spider that crawls all targets.
+    - `web/backend/scraper_module/pipelines.py`: Stores the found PDFs while the crawl runs.
+    - `web/api/management/commands/crawl_companies.py`: Selects the targets and reports the results.
+"""
 
-def save_pdf_to_db(file_data, company: CompanyProfile):
-    """
-    Speichert ein PDF aus dem Webscraping direkt in die Datenbank inklusive Dateiinhalt.
-    """
-    # PDF herunterladen
-    response = requests.get(file_data['file_path'])
-    if response.status_code != 200:
-        print(f"❌ Fehler beim Download: {file_data['file_path']}")
-        return
+import os
+from typing import Any, Callable, Dict, List, Optional
 
-    file_content = ContentFile(response.content)
-    filename = file_data['file_name']
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
 
-    # Neues PDFFile-Objekt erstellen
-    pdf = PDFFile(
-        company=company,
-        source='webscraped',
-        file_size=len(response.content),
-        extraction_success=False,  # wird ggf. später durch LLM geändert
-    )
-    pdf.file.save(filename, file_content, save=True)
-    print(f"✅ Gespeichert: {filename}")
+from .spiders.company_spider import MultiCompanyPdfSpider
 
 
-class DjangoAwarePdfSpider(PdfSpider):
+def crawl_companies(
+    targets: List[Dict[str, Any]],
+    save_folder: str,
+    known: Optional[Dict[int, Dict[str, Dict[str, Any]]]] = None,
+    state_dir: Optional[str] = None,
+    recrawl_after: float = 0,
+    max_depth: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    score_links: bool = True,
+    store_pdfs: bool = False,
+    concurrency: Optional[int] = None,
+    per_domain: Optional[int] = None,
+    report: Optional[Callable[[MultiCompanyPdfSpider], None]] = None,
+    report_every: float = 30.0
+) -> MultiCompanyPdfSpider:
     """
-    Subclass of your PdfSpider with Django integration for saving to DB.
+    Crawls all `targets` ({'company_id', 'company_url_id', 'url'}) and blocks until the crawl is done. PDF URLs
+    in `known` ({company_id: {url: validators}}) are requested conditionally. With a `state_dir` the crawl
+    state of each CompanyURL is kept there, pages seen within `recrawl_after` seconds are skipped. Links are
+    followed up to `max_depth` and at most `max_pages` pages are requested per company (default: CRAWL_MAX_DEPTH and
+    CRAWL_MAX_PAGES_PER_COMPANY, 0 = unlimited), best-scored links first unless `score_links` is off. With `store_pdfs`
+    (needs Django) every downloaded PDF is stored for its company while the crawl runs. `report` is called
+    with the spider every `report_every` seconds while it runs. Returns the spider, whose `pdf_files`
+    and `company_stats` hold the results per company, and whose crawler stats hold the `pdf_store/*` counts.
     """
-    def __init__(self, domain, company_id, *args, **kwargs):
-        super().__init__(domain, *args, **kwargs)
-        self.company = CompanyProfile.objects.get(id=company_id)
-
-    def closed(self, reason):
-        # override to save to DB instead of CSV
-        for file_data in self.pdf_files:
-            save_pdf_to_db(file_data, self.company)
-        print(f"✅ Finished scraping for company: {self.company.name}")
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'backend.scraper_module.settings')
+    settings = get_project_settings()
+    if concurrency:
+        settings.set('CONCURRENT_REQUESTS', concurrency, priority='cmdline')
+    if per_domain:
+        settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', per_domain, priority='cmdline')
+    if max_depth is None:
+        max_depth = settings.getint('CRAWL_MAX_DEPTH')
+    if max_pages is None:
+        max_pages = settings.getint('CRAWL_MAX_PAGES_PER_COMPANY')
 
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(MultiCompanyPdfSpider)
+    finished = process.crawl(
+        crawler, targets=targets, save_folder=save_folder, known=known, state_dir=state_dir, recrawl_after=recrawl_after,
+        max_depth=max_depth or None, max_pages=max_pages or None, score_links=score_links,
+        store_pdfs=store_pdfs,
+    )
 
-@wait_for(timeout=60.0)
-def run(domain: str, company_id: int):
-    process = CrawlerProcess(get_project_settings())
-    process.crawl(DjangoAwarePdfSpider, domain=domain, company_id=company_id)
-    process.start()
+    if report:
+        from twisted.internet import task
 
+        loop = task.LoopingCall(lambda: crawler.spider and report(crawler.spider))
+        loop.start(report_every, now=False)
+        finished.addBoth(lambda result: (loop.stop() if loop.running else None, result)[1])
 
-# --- Optional: Kommandozeilen-Start (z. B. `python run_scraper.py https://example.com 1`)
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 3:
-        print("Usage: python run_scraper.py <domain> <company_id>")
-    else:
-        domain = sys.argv[1]
-        company_id = int(sys.argv[2])
-        run(domain, company_id)
+    process.start()  # blocks until the crawl is done
+    return crawler.spider
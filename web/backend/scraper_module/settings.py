@@ -4,9 +4,24 @@ SPIDER_MODULES    = ['backend.scraper_module.spiders']
 NEWSPIDER_MODULE  = 'backend.scraper_module.spiders'
 
 DOWNLOADER_MIDDLEWARES = {
+    'backend.scraper_module.middlewares.CrawlBudgetMiddleware': 50,
     'backend.scraper_module.middlewares.DynamicDelayRetryMiddleware': 543,
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
 }
 
 RETRY_ENABLED = True
 RETRY_TIMES   = 5
+
+# One crawl covers all companies (crawl_companies): limits apply to the whole crawl and to every site
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+
+# Scrapy keeps the body of a transfer in memory until the callback returns, although the spiders stream PDFs to disk
+DOWNLOAD_MAXSIZE = 150 * 1024 * 1024  # as PDF_MAX_BYTES of the parser
+
+# Crawl budget per company (MultiCompanyPdfSpider): link depth below the start URL and pages requested, 0 = unlimited
+CRAWL_MAX_DEPTH = 4
+CRAWL_MAX_PAGES_PER_COMPANY = 500
+
+# PdfStoragePipeline: downloaded PDFs stored per database batch
+PDF_STORE_BATCH_SIZE = 20
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import time
+from urllib.parse import urlparse, urljoin
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, StopDownload
+
+from .pdf_spider import BROWSER_USER_AGENT
+from ..crawl_state import CrawlState
+from ..link_scorer import link_priority, score_link
+from ..utils import PdfDownloadStream, is_pdf_response
+
+
+class MultiCompanyPdfSpider(scrapy.Spider):
+    """
+    Crawls the start URLs of many companies in one spider, so that all of them share one downloader
+    and its limits: CONCURRENT_REQUESTS globally and CONCURRENT_REQUESTS_PER_DOMAIN per site. Every
+    request carries its company and start domain in `meta`; links are only followed within that domain.
+
+    Downloaded PDFs are written to `save_folder/<company_id>/` and listed per company in `pdf_files`;
+    `company_stats` counts crawled pages, PDFs and bytes per company. Every download is also yielded as an
+    item carrying its `company_id`; with `store_pdfs`, `PdfStoragePipeline` stores it while the crawl runs.
+
+    PDF URLs in `known` (the validators of their last download) are requested conditionally. A 304, or
+    unchanged validators or size in the response headers, ends the request before the body is downloaded;
+    the PDF is listed in `unchanged` and its size counted as saved bytes.
+
+    PDF bodies are streamed to disk and hashed while they arrive (`PdfDownloadStream`); responses that
+    are not PDFs are not saved.
+
+    With a `state_dir`, every target with a `company_url_id` keeps its `CrawlState` there: the crawl resumes
+    its frontier, and pages seen within `recrawl_after` seconds are not requested again (stored PDFs
+    neither, they count as unchanged). The start URLs are always requested, that is where new links show up.
+
+    Links are requested in the order of their `score_link` (report terms in URL and anchor text). Per company,
+    pages deeper than `max_depth` are not followed and at most `max_pages` pages are requested (counted by
+    `take_page_budget` in `CrawlBudgetMiddleware`); PDF links do not count against the budget.
+    """
+    name = "multi_company_pdf_spider"
+    # With store_pdfs, every downloaded PDF is stored for its company while the crawl runs
+    custom_settings = {
+        'ITEM_PIPELINES': {'backend.scraper_module.pipelines.PdfStoragePipeline': 300},
+    }
+
+    def __init__(
+        self, targets, save_folder='pdfs', known=None, state_dir=None, recrawl_after=0,
+        max_depth=None, max_pages=None, score_links=True, store_pdfs=False, *args, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.store_pdfs = store_pdfs
+        self.targets = targets  # [{'company_id': ..., 'company_url_id': ..., 'url': ...}, ...]
+        self.save_folder = save_folder
+        self.known = known or {}  # {company_id: {url: {'pdf_id', 'etag', 'last_modified', 'content_length'}}}
+        self.pdf_files = {target['company_id']: [] for target in targets}
+        self.unchanged = {target['company_id']: [] for target in targets}  # pdf_ids
+        self.company_stats = {
+            target['company_id']: {
+                'pages': 0, 'pdfs': 0, 'bytes': 0, 'unchanged': 0, 'bytes_saved': 0, 'fresh': 0, 'over_budget': 0,
+            }
+            for target in targets
+        }
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.score_links = score_links
+        self.pages_requested = {target['company_id']: 0 for target in targets}
+        self.states = {}  # company_url_id -> CrawlState
+        if state_dir:
+            for target in targets:
+                if target.get('company_url_id') is not None:
+                    path = os.path.join(state_dir, f"{target['company_url_id']}.sqlite3")
+                    self.states[target['company_url_id']] = CrawlState(path, recrawl_after)
+        self.skipped = set()  # (state key, url) of fresh URLs, counted once per crawl
+        self.started = time.time()
+        self.streams = PdfDownloadStream(os.path.join(self.save_folder, 'partial'))
+        os.makedirs(self.save_folder, exist_ok=True)
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(spider.bytes_received, signal=signals.bytes_received)
+        return spider
+
+    async def start(self):
+        # Scrapy >= 2.13 only calls start(); older versions call start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        for target in self.targets:
+            meta = {
+                'company_id': target['company_id'],
+                'domain': urlparse(target['url']).netloc,
+                'state': target.get('company_url_id') if target.get('company_url_id') in self.states else None,
+            }
+            yield scrapy.Request(
+                target['url'],
+                callback=self.parse,
+                errback=self.request_failed,
+                headers={'User-Agent': BROWSER_USER_AGENT},
+                meta={**meta, 'kind': 'page'},
+                dont_filter=True,  # several companies may share a start URL
+            )
+            # Resume what an earlier crawl scheduled but did not visit
+            state = self.states.get(meta['state'])
+            for url, kind, referer in (state.frontier() if state else []):
+                priority = self.priority(url, '', 1, kind == 'pdf')
+                if kind == 'pdf':
+                    yield self.pdf_request(url, referer or target['url'], meta, priority)
+                else:
+                    yield self.page_request(url, referer or target['url'], meta, priority)
+
+    def parse(self, response):
+        meta = {'company_id': response.meta['company_id'], 'domain': response.meta['domain'], 'state': response.meta['state']}
+        ct = response.headers.get('Content-Type', b'').decode('utf-8')
+        if 'application/pdf' in ct:
+            yield from self.save_pdf(response)
+            return
+        self.record_visit(response.request, 'page')
+        if 'text/html' not in ct:
+            return
+
+        self.company_stats[meta['company_id']]['pages'] += 1
+        state = self.states.get(meta['state'])
+        depth = response.meta.get('depth', 0)
+        follow_pages = self.max_depth is None or depth < self.max_depth
+        for anchor in response.css('a[href]'):
+            full_url = urljoin(response.url, anchor.attrib['href'])
+            if urlparse(full_url).netloc != meta['domain']:
+                continue
+            kind = 'pdf' if full_url.lower().endswith('.pdf') else 'page'
+            if kind == 'page' and not follow_pages:
+                continue
+            if state is not None:
+                if self.skip_fresh(state, meta, full_url, kind):
+                    continue
+                state.schedule(full_url, kind, response.url)
+            anchor_text = ' '.join(anchor.css('::text').getall() + [anchor.attrib.get('title', '')])
+            priority = self.priority(full_url, anchor_text, depth + 1, kind == 'pdf')
+            if kind == 'pdf':
+                yield self.pdf_request(full_url, response.url, meta, priority)
+            else:
+                yield self.page_request(full_url, response.url, meta, priority)
+
+    def priority(self, url, anchor_text, depth, is_pdf) -> int:
+        if not self.score_links:
+            return 0
+        return link_priority(score_link(url, anchor_text), depth, is_pdf)
+
+    def page_request(self, url, referer, meta, priority=0):
+        return scrapy.Request(
+            url=url, callback=self.parse, errback=self.request_failed, priority=priority,
+            headers={'User-Agent': BROWSER_USER_AGENT, 'Referer': referer}, meta={**meta, 'kind': 'page'},
+        )
+
+    def take_page_budget(self, request) -> bool:
+        """
+        Counts a page request against the budget of its company when it leaves the scheduler; False once the
+        budget is used up. The scheduler hands out requests by priority, so the budget goes to the best links.
+        """
+        if request.meta.get('kind') != 'page' or not self.max_pages or request.meta.get('budgeted'):
+            return True  # PDFs, no budget, or the retry of a counted request
+        company_id = request.meta['company_id']
+        if self.pages_requested[company_id] >= self.max_pages:
+            self.company_stats[company_id]['over_budget'] += 1
+            return False
+        self.pages_requested[company_id] += 1
+        request.meta['budgeted'] = True
+        return True
+
+    def skip_fresh(self, state, meta, url, kind) -> bool:
+        """Pages seen within recrawl_after and stored PDFs seen within it are not requested."""
+        known = self.known.get(meta['company_id'], {}).get(url) if kind == 'pdf' else None
+        if (kind == 'pdf' and known is None) or not state.is_fresh(url):
+            return False
+        if (meta['state'], url) not in self.skipped:
+            self.skipped.add((meta['state'], url))
+            self.company_stats[meta['company_id']]['fresh'] += 1
+            if known is not None:
+                self.count_unchanged(meta['company_id'], known)
+        return True
+
+    def record_visit(self, request, kind):
+        state = self.states.get(request.meta.get('state'))
+        if state is None:
+            return
+        # The URL as scheduled, before redirects
+        for url in {request.url, *request.meta.get('redirect_urls', [])}:
+            state.visited(url, kind)
+
+    def request_failed(self, failure):
+        self.streams.discard(failure.request)  # the .part file of a PDF download that broke off
+        if failure.check(IgnoreRequest):
+            return  # dropped over budget, not visited: it stays in the frontier for the next crawl
+        self.record_visit(failure.request, 'failed')
+
+    def closed(self, reason):
+        for state in self.states.values():
+            state.close(finished=reason == 'finished')
+
+    def pdf_request(self, url, referer, meta, priority=0):
+        headers = {'User-Agent': BROWSER_USER_AGENT, 'Referer': referer}
+        known = self.known.get(meta['company_id'], {}).get(url)
+        meta = {**meta, 'kind': 'pdf'}
+        if known:
+            meta = {**meta, 'known': known, 'handle_httpstatus_list': [304]}
+            if known['etag']:
+                headers['If-None-Match'] = known['etag']
+            if known['last_modified']:
+                headers['If-Modified-Since'] = known['last_modified']
+        return scrapy.Request(
+            url=url, callback=self.save_pdf, errback=self.request_failed, priority=priority, headers=headers, meta=meta,
+        )
+
+    def headers_received(self, headers, body_length, request):
+        """
+        Stops the download of a known PDF whose response headers show that it did not change; else a PDF
+        body starts streaming to disk.
+        """
+        known = request.meta.get('known')
+        if known and self.is_unchanged(known, headers, body_length):
+            raise StopDownload(fail=False)  # save_pdf gets the response without its body
+        if is_pdf_response(headers):
+            self.streams.open(request)
+
+    def bytes_received(self, data, request):
+        self.streams.write(request, data)
+
+    @staticmethod
+    def is_unchanged(known, headers, body_length) -> bool:
+        etag = headers.get('ETag', b'').decode('latin-1')
+        last_modified = headers.get('Last-Modified', b'').decode('latin-1')
+        if etag and known['etag']:
+            return etag == known['etag']
+        if last_modified and known['last_modified']:
+            return last_modified == known['last_modified']
+        # Servers without validators: the same size counts as the same file
+        return known['content_length'] is not None and body_length == known['content_length']
+
+    def save_pdf(self, response):
+        company_id = response.meta['company_id']
+        self.record_visit(response.request, 'pdf')
+        if response.status == 304 or 'download_stopped' in response.flags:
+            self.count_unchanged(company_id, response.meta['known'])
+            return
+
+        pdf_name = os.path.basename(urlparse(response.url).path) or 'document.pdf'
+        # Prefixed with a hash of the URL, different paths of one site may use the same file name
+        url_hash = hashlib.sha1(response.url.encode('utf-8')).hexdigest()[:10]
+        company_folder = os.path.join(self.save_folder, str(company_id))
+        os.makedirs(company_folder, exist_ok=True)
+        download = self.streams.close(response, os.path.join(company_folder, f"{url_hash}-{pdf_name}"))
+        if download is None:
+            self.log(f'Not a PDF, skipped: {response.url}')
+            return
+
+        item = {
+            'company_id': company_id,
+            'file_name': pdf_name,
+            **download,
+            'url': response.url,
+            'upload_date': response.headers.get('Last-Modified', b'').decode('utf-8'),
+            'validators': {
+                'etag': response.headers.get('ETag', b'').decode('latin-1'),
+                'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1'),
+                'content_length': download['size'],
+            },
+        }
+        self.pdf_files[company_id].append(item)
+        stats = self.company_stats[company_id]
+        stats['pdfs'] += 1
+        stats['bytes'] += download['size']
+        self.log(f'Saved locally: {pdf_name} (company {company_id})')
+        yield item
+
+    def count_unchanged(self, company_id, known):
+        self.unchanged[company_id].append(known['pdf_id'])
+        stats = self.company_stats[company_id]
+        stats['unchanged'] += 1
+        stats['bytes_saved'] += known['content_length'] or 0
+
+    def pages_per_sec(self, company_id=None) -> float:
+        elapsed = max(time.time() - self.started, 1e-6)
+        if company_id is None:
+            return sum(stats['pages'] for stats in self.company_stats.values()) / elapsed
+        return self.company_stats[company_id]['pages'] / elapsed
@@ -1,29 +1,55 @@
 import scrapy
 import os
-import pandas as pd
+from scrapy import signals
 from urllib.parse import urlparse, urljoin
 
+from ..utils import PdfDownloadStream, is_pdf_response
+
+BROWSER_USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/114.0.0.0 Safari/537.36'
+)
+
 class PdfSpider(scrapy.Spider):
     name = "pdf_spider"
+    # Jedes heruntergeladene PDF wird noch während des Crawls für company_id gespeichert
+    custom_settings = {
+        'ITEM_PIPELINES': {'backend.scraper_module.pipelines.PdfStoragePipeline': 300},
+    }
 
-    def __init__(self, domain, save_folder='pdfs', *args, **kwargs):
+    def __init__(self, domain, save_folder='pdfs', company_id=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.domain = domain
+        self.company_id = company_id
         self.allowed_domains = [urlparse(domain).netloc]
         self.start_urls = [domain]
         self.save_folder = save_folder
-        self.pdf_files = []
         if not os.path.exists(self.save_folder):
             os.makedirs(self.save_folder)
+        # PDF-Bodies werden beim Download direkt auf die Platte geschrieben und gehasht
+        self.streams = PdfDownloadStream(self.save_folder)
 
         # Hier definierst du deine Browser-Header
         self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                          'AppleWebKit/537.36 (KHTML, like Gecko) '
-                          'Chrome/114.0.0.0 Safari/537.36',
+            'User-Agent': BROWSER_USER_AGENT,
             'Referer': self.domain
         }
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(spider.bytes_received, signal=signals.bytes_received)
+        return spider
+
+    def headers_received(self, headers, body_length, request):
+        if is_pdf_response(headers):
+            self.streams.open(request)
+
+    def bytes_received(self, data, request):
+        self.streams.write(request, data)
+
     def parse(self, response):
         ct = response.headers.get('Content-Type', b'').decode('utf-8')
         if 'application/pdf' in ct:
@@ -37,34 +63,39 @@ class PdfSpider(scrapy.Spider):
                         yield scrapy.Request(
                             url=full_url,
                             callback=self.save_pdf,
+                            errback=self.request_failed,
                             headers=self.headers
                         )
                     else:
-                        yield response.follow(full_url, self.parse)
+                        yield response.follow(full_url, self.parse, errback=self.request_failed)
+
+    def request_failed(self, failure):
+        # Abgebrochener Download: die .part-Datei wird entfernt
+        self.streams.discard(failure.request)
+        self.logger.warning(f'Request failed: {failure.request.url} ({failure.value!r})')
 
     def save_pdf(self, response):
         pdf_name = response.url.split('/')[-1]
         upload_date = response.headers.get('Last-Modified', b'').decode('utf-8')
 
-        # Speichere lokale Datei direkt
-        local_path = os.path.join(self.save_folder, pdf_name)
-        with open(local_path, 'wb') as f:
-            f.write(response.body)
-
-        self.pdf_files.append({
-            'file_name': pdf_name,
-            'file_path': local_path,   # jetzt lokaler Pfad
-            'upload_date': upload_date
-        })
+        # Der Download liegt schon auf der Platte, er wird nur an seinen Platz verschoben
+        download = self.streams.close(response, os.path.join(self.save_folder, pdf_name))
+        if download is None:
+            self.log(f'Not a PDF, skipped: {response.url}')
+            return
 
         self.log(f'Saved locally: {pdf_name}')
-        yield {}  # Dummy
+        yield {
+            'file_name': pdf_name,
+            **download,   # file_path (lokaler Pfad), sha256, size
+            'url': response.url,
+            'upload_date': upload_date,
+            'validators': {
+                'etag': response.headers.get('ETag', b'').decode('latin-1'),
+                'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1'),
+                'content_length': download['size'],
+            },
+        }
 
     def is_internal_link(self, url):
         return urlparse(url).netloc in self.allowed_domains
-
-    def closed(self, reason):
-        df = pd.DataFrame(self.pdf_files)
-        csv_path = os.path.join(self.save_folder, 'pdf_files.csv')
-        df.to_csv(csv_path, index=False)
-        self.log(f"Finished scraping PDFs. File paths saved to {csv_path}")
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import tempfile
+
+
+class PdfDownloadStream:
+    """
+    Writes PDF responses to disk while they are downloaded, and hashes them on the way: `open()` when the
+    response headers arrive, `write()` for every received chunk, `close()` in the callback. The spider never
+    reads `response.body`, and the stored file does not have to be read again to get its SHA-256 and size.
+
+    The state of a download lives in `request.meta['pdf_stream']`, which the response shares.
+    """
+    META_KEY = 'pdf_stream'
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def open(self, request, prefix=''):
+        os.makedirs(self.folder, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.folder, prefix=prefix, suffix='.part')
+        # A retried request carries the meta of its first attempt; that download is replaced
+        self.discard(request)
+        request.meta[self.META_KEY] = {'file': os.fdopen(fd, 'wb'), 'path': path, 'sha256': hashlib.sha256(), 'size': 0}
+
+    def write(self, request, data):
+        stream = request.meta.get(self.META_KEY)
+        if stream is None or stream['file'].closed:
+            return
+        stream['file'].write(data)
+        stream['sha256'].update(data)
+        stream['size'] += len(data)
+
+    def close(self, response, path):
+        """Moves the finished download to `path`; returns {'file_path', 'sha256', 'size'}, None if nothing was streamed."""
+        stream = response.meta.pop(self.META_KEY, None)
+        if stream is None:
+            return None
+        stream['file'].close()
+        os.replace(stream['path'], path)
+        return {'file_path': path, 'sha256': stream['sha256'].hexdigest(), 'size': stream['size']}
+
+    def discard(self, request):
+        stream = request.meta.pop(self.META_KEY, None)
+        if stream is not None:
+            stream['file'].close()
+            if os.path.exists(stream['path']):
+                os.remove(stream['path'])
+
+
+def is_pdf_response(headers) -> bool:
+    return b'application/pdf' in headers.get('Content-Type', b'')
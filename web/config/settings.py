@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',  # after auth, it checks request.user.is_staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -156,6 +157,14 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Shared cache, so that status flags and progress written by Celery workers are visible to the web process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+
 # settings.py
 CELERY_BROKER_URL = 'redis://localhost:6379/0'  # Or your RabbitMQ URL
 CELERY_RESULT_BACKEND = 'django-db'  # Or redis
@@ -163,5 +172,58 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# PDF ingestion runs as a chain of stages on two queues, so that pdfplumber parsing and model inference
+# scale independently, e.g.:
+#   celery -A api worker -Q cpu -c 4      (parsing, index writing; one process per core)
+#   celery -A api worker -Q model -c 1    (embedding, LLM year inference; one model copy per process)
+# Everything else goes to the default 'celery' queue.
+CELERY_TASK_ROUTES = {
+    'backend.llm_module.pdf_preprocessor.parse_pdf_stage': {'queue': 'cpu'},
+    'backend.llm_module.pdf_preprocessor.build_index_stage': {'queue': 'cpu'},
+    'backend.llm_module.pdf_preprocessor.embed_chunks_stage': {'queue': 'model'},
+    'backend.llm_module.pdf_preprocessor.infer_year_stage': {'queue': 'model'},
+}
+# Model workers should not prefetch a second long-running task while one is running
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Priority lists per queue (0 = first, 9 = last); see backend/llm_module/ingestion_queue.py
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_BEAT_SCHEDULE = {
+    'compact-vector-indexes': {
+        'task': 'backend.llm_module.company_index.compact_vector_indexes_task',
+        'schedule': 60 * 60,  # hourly
+    },
+}
+
+# Opt-in profiling of tasks and views (core/profiling.py), reports under MEDIA_ROOT/profiles.
+# Staff users can profile a single request with the header 'X-Profile: 1' regardless of this setting.
+PROFILING_ENABLED = os.environ.get('PROFILING', '') == '1'
+# Only profile these tasks (full or short task names, comma-separated in the env var); empty = all tasks
+PROFILING_TASKS = [name for name in os.environ.get('PROFILING_TASKS', '').split(',') if name]
+
+# Port of the Prometheus endpoint each Celery worker starts (0 = off). Workers on the same host need
+# different ports, e.g. WORKER_METRICS_PORT=9809 for the model worker. The web process serves /metrics/.
+# The endpoint runs in the prefork parent and only sees the pool processes' metrics through
+# PROMETHEUS_MULTIPROC_DIR, so it is off unless that is set.
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9808 if os.environ.get('PROMETHEUS_MULTIPROC_DIR') else 0))
+
+# Limits of the PDF parser (backend/llm_module/parser.py): longer PDFs are parsed up to PDF_MAX_PAGES,
+# larger files without tables; pages are read in windows of PDF_PAGE_WINDOW to bound worker memory
+PDF_MAX_PAGES = 1500
+PDF_MAX_BYTES = 150 * 1024 * 1024
+PDF_PAGE_WINDOW = 200
+
+# Embedding model for PDF chunks and queries; indexes are reused across PDFs with the same file hash and model
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# How the preprocessing worker writes PDFFile state: 'orm' (shared database) or 'api' (REST API at API_BASE_URL)
+PDF_STORE_BACKEND = 'orm'
+API_BASE_URL = 'http://localhost:8000'
+
+# Threads used by LLMProcessor.rag_analyze to load and search the per-PDF vector indexes (1 = sequential)
+RAG_RETRIEVAL_WORKERS = 8
 
 WS_TRUST_ENABLED = True  # Enable WebSocket trust for the API
\ No newline at end of file
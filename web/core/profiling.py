@@ -0,0 +1,187 @@
+"""
+File: web/core/profiling.py
+
+Role:
+    Opt-in profiling of Celery tasks and Django views. A profiled run is wrapped in cProfile and
+    tracemalloc and leaves two files under `MEDIA_ROOT/profiles/`: `<name>.prof` (pstats, e.g. for
+    snakeviz) and `<name>.txt` (top functions by cumulative time, top allocations and peak memory).
+
+    - Tasks: all tasks (or those in `PROFILING_TASKS`) are profiled while `PROFILING_ENABLED` is set
+      (env `PROFILING=1`). Profiles are named by task and pdf_id, or by task id.
+    - Views: every request while `PROFILING_ENABLED` is set, or a single request of a staff user that
+      sends the header `X-Profile: 1`; the user is logged in by session or, for the API views, by token.
+      The response carries the profile name in `X-Profile-Name`.
+
+    When profiling is off, the only cost is a settings lookup per task or request.
+
+Interactions:
+    - `web/api/celery.py`: Imports this module, which connects the task signals below.
+    - `config/settings.py`: `ProfilingMiddleware` is part of `MIDDLEWARE`.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+
+PROFILE_DIR = 'profiles'  # below MEDIA_ROOT
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_active = threading.local()  # cProfile cannot nest, inner runs are not profiled separately
+
+
+def profiling_enabled() -> bool:
+    return getattr(settings, 'PROFILING_ENABLED', False)
+
+
+def profile_path(name: str, suffix: str) -> str:
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+    return os.path.join(settings.MEDIA_ROOT, PROFILE_DIR, f"{safe_name}{suffix}")
+
+
+class Profile:
+    """One cProfile + tracemalloc run; `stop()` writes the report files and returns the .prof path."""
+    def __init__(self, name: str):
+        self.name = name
+        self.profiler = None
+        self.owns_tracemalloc = False
+
+    def start(self) -> 'Profile':
+        if getattr(_active, 'profile', None) is not None:
+            return self
+        _active.profile = self
+        self.owns_tracemalloc = not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return self
+
+    def stop(self):
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        elapsed = time.perf_counter() - self.started
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if self.owns_tracemalloc:
+            tracemalloc.stop()
+        _active.profile = None
+
+        prof_path = profile_path(self.name, '.prof')
+        os.makedirs(os.path.dirname(prof_path), exist_ok=True)
+        self.profiler.dump_stats(prof_path)
+
+        stats_text = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats_text).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        allocations = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+        with open(profile_path(self.name, '.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"{self.name}: {elapsed:.2f} s wall time, peak traced memory {peak / 2**20:.1f} MiB\n\n")
+            f.write(f"Top {TOP_ALLOCATIONS} allocations still held at the end:\n")
+            for stat in allocations:
+                f.write(f"  {stat}\n")
+            f.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time:\n")
+            f.write(stats_text.getvalue())
+        print(f"Profile written to {prof_path}")
+        return prof_path
+
+
+@contextmanager
+def profiled(name: str):
+    """Profiles the block unconditionally, e.g. from a shell or management command."""
+    profile = Profile(name).start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+
+
+# === Celery tasks ===
+
+_task_profiles = {}
+
+
+def task_profile_name(task, task_id, args, kwargs) -> str:
+    """`<task>-pdf<id>-<task id prefix>` for tasks working on a PDF, else `<task>-<task id>`."""
+    short_name = task.name.rsplit('.', 1)[-1]
+    kwargs = kwargs or {}
+    pdf_id = kwargs.get('pdf_id')
+    if pdf_id is None and args:
+        first = args[0]
+        # Ingestion stages get their PDF inside the state dict, process_and_embed_pdf_task as first argument
+        pdf_id = first.get('pdf_id') if isinstance(first, dict) else (first if short_name.startswith('process_and_embed') else None)
+    if pdf_id is not None:
+        return f"{short_name}-pdf{pdf_id}-{task_id[:8]}"
+    return f"{short_name}-{task_id}"
+
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, args=None, kwargs=None, **extra):
+    if not profiling_enabled():
+        return
+    only = getattr(settings, 'PROFILING_TASKS', None)
+    if only and task.name not in only and task.name.rsplit('.', 1)[-1] not in only:
+        return
+    _task_profiles[task_id] = Profile(task_profile_name(task, task_id, args, kwargs)).start()
+
+
+@task_postrun.connect
+def stop_task_profile(task_id=None, **extra):
+    profile = _task_profiles.pop(task_id, None)
+    if profile is not None:
+        profile.stop()
+
+
+# === Django views ===
+
+class ProfilingMiddleware:
+    """Profiles requests while PROFILING_ENABLED is set, or staff requests with the header `X-Profile: 1`."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = Profile('view').start()
+        try:
+            response = self.get_response(request)
+        finally:
+            # Named after the URL pattern once the view is resolved, e.g. view-llm_evaluate-1718000000000
+            match = request.resolver_match
+            view_name = (match.url_name or match.view_name) if match else (request.path.strip('/') or 'root')
+            profile.name = f"view-{view_name}-{int(time.time() * 1000)}"
+            written = profile.stop()
+        if written:
+            response['X-Profile-Name'] = profile.name
+        return response
+
+    @staticmethod
+    def should_profile(request) -> bool:
+        if profiling_enabled():
+            return True
+        if request.META.get('HTTP_X_PROFILE') != '1':
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        # DRF authenticates API tokens in the view, after the middleware; the token is checked here as well
+        from rest_framework.authentication import TokenAuthentication
+        from rest_framework.exceptions import AuthenticationFailed
+
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False  # the view answers 401
+        return bool(authenticated and authenticated[0].is_staff)